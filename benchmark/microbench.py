@@ -0,0 +1,369 @@
+"""
+Offline microbenchmarks for the protocol codec and client hot paths
+
+Every benchmark runs on synthetic in-memory fixtures, so no broker is needed.
+Each is repeated over a grid of message sizes, partition counts and
+compression types, and reports items (messages, keys or partitions) and
+payload bytes handled per second, taking the best of several rounds.
+
+Typical use is to save a baseline before a change and compare against it
+afterwards::
+
+    python benchmark/microbench.py --save baseline.json
+    python benchmark/microbench.py --compare baseline.json
+
+With `--compare`, benchmarks that got slower by more than `--threshold` are
+flagged and the script exits with status 1, so it can gate CI jobs. Baselines
+are only comparable when taken on the same machine and Python version.
+"""
+from __future__ import division, print_function
+
+import argparse
+import itertools
+import json
+import platform
+import random
+import struct
+import sys
+import threading
+import timeit
+
+import tabulate
+
+import pykafka
+from pykafka.cli.kafka_tools import PARTITIONERS
+from pykafka.common import CompressionType
+from pykafka.partition import Partition
+from pykafka.protocol import (FetchResponse, Message, MessageSet,
+                              ProduceRequest)
+from pykafka.simpleconsumer import OwnedPartition
+from pykafka.utils import compression, struct_helpers
+
+
+MSG_SIZES = [100, 1000, 10000]
+PARTITION_COUNTS = [1, 16, 256]
+COMPRESSION_TYPES = {
+    'none': CompressionType.NONE,
+    'gzip': CompressionType.GZIP,
+}
+if compression.snappy is not None:
+    COMPRESSION_TYPES['snappy'] = CompressionType.SNAPPY
+
+# Messages per MessageSet, request or response
+BATCH_SIZE = 100
+
+_WORDS = [b'kafka', b'topic', b'partition', b'offset', b'broker', b'message',
+          b'consumer', b'producer', b'leader', b'replica', b'0', b'1', b'42',
+          b'"', b':', b',', b'{', b'}']
+
+BENCHMARKS = []
+
+
+def benchmark(**param_grid):
+    """Register a benchmark for every combination of parameters
+
+    The decorated function takes the parameters as keyword arguments and
+    returns a tuple of (function to time, items per call, bytes per call).
+    """
+    def decorator(setup):
+        keys = sorted(param_grid)
+        for values in itertools.product(*(param_grid[key] for key in keys)):
+            params = dict(zip(keys, values))
+            name = '{}[{}]'.format(setup.__name__, ','.join(
+                '{}={}'.format(key, params[key]) for key in keys))
+            BENCHMARKS.append((name, setup, params))
+        return setup
+    return decorator
+
+
+#
+# Fixtures
+#
+
+class _Topic(object):
+    name = b'benchmark'
+
+
+class _Broker(object):
+    def __init__(self, id_):
+        self.id = id_
+
+
+_TOPIC = _Topic()
+
+
+def _payload(size, rng):
+    """Text-like payload that compresses about as well as JSON"""
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(_WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return b' '.join(words)[:size]
+
+
+def _messages(count, size, seed=0):
+    rng = random.Random(seed)
+    return [Message(_payload(size, rng), partition_key=('key-%d' % i).encode(),
+                    offset=i)
+            for i in range(count)]
+
+
+def _partitions(count, num_brokers=3):
+    brokers = [_Broker(i) for i in range(num_brokers)]
+    return [Partition(_TOPIC, i, brokers[i % num_brokers], [], [])
+            for i in range(count)]
+
+
+def _encode_message_set(messages, compression_type):
+    """Serialize messages with their offsets, as a broker would return them"""
+    output = bytearray()
+    for message in messages:
+        encoded = message.encode()
+        output += struct.pack('!qi', message.offset, len(encoded)) + encoded
+    if compression_type == CompressionType.NONE:
+        return bytes(output)
+    if compression_type == CompressionType.GZIP:
+        value = compression.encode_gzip(bytes(output))
+    else:
+        value = compression.encode_snappy(bytes(output))
+    wrapper = Message(value, compression_type=compression_type)
+    encoded = wrapper.encode()
+    return struct.pack('!qi', messages[-1].offset, len(encoded)) + bytes(encoded)
+
+
+def _encode_fetch_response(partition_msets):
+    """Serialize a version 0 FetchResponse body for one topic"""
+    parts = [struct.pack('!ih%dsi' % len(_TOPIC.name), 1, len(_TOPIC.name),
+                         _TOPIC.name, len(partition_msets))]
+    for partition_id, mset in enumerate(partition_msets):
+        parts.append(struct.pack('!ihqi', partition_id, 0, 10 ** 6, len(mset)))
+        parts.append(mset)
+    return b''.join(parts)
+
+
+#
+# Benchmarks
+#
+
+@benchmark(msg_size=MSG_SIZES)
+def message_pack_into(msg_size):
+    messages = _messages(BATCH_SIZE, msg_size)
+    buff = bytearray(max(len(m) for m in messages))
+
+    def run():
+        for message in messages:
+            message.pack_into(buff, 0)
+    return run, len(messages), sum(len(m) for m in messages)
+
+
+@benchmark(msg_size=MSG_SIZES)
+def message_set_decode(msg_size):
+    buff = _encode_message_set(_messages(BATCH_SIZE, msg_size),
+                               CompressionType.NONE)
+    return lambda: MessageSet.decode(buff), BATCH_SIZE, len(buff)
+
+
+@benchmark(msg_size=MSG_SIZES, compression=sorted(COMPRESSION_TYPES),
+           partitions=[1, 16])
+def fetch_response_parse(msg_size, compression, partitions):
+    msets = [_encode_message_set(_messages(BATCH_SIZE, msg_size, seed=i),
+                                 COMPRESSION_TYPES[compression])
+             for i in range(partitions)]
+    buff = _encode_fetch_response(msets)
+    return (lambda: FetchResponse(buff), BATCH_SIZE * partitions,
+            BATCH_SIZE * partitions * msg_size)
+
+
+@benchmark(msg_size=MSG_SIZES, compression=sorted(COMPRESSION_TYPES),
+           partitions=[1, 16])
+def produce_request_get_bytes(msg_size, compression, partitions):
+    messages = _messages(BATCH_SIZE, msg_size)
+    compression_type = COMPRESSION_TYPES[compression]
+
+    def run():
+        # a fresh request every time, as compressed MessageSets are cached
+        request = ProduceRequest(compression_type=compression_type)
+        for i, message in enumerate(messages):
+            request.add_message(message, _TOPIC.name, i % partitions)
+        request.get_bytes()
+    return run, len(messages), len(messages) * msg_size
+
+
+@benchmark(partitions=PARTITION_COUNTS)
+def unpack_metadata(partitions):
+    """struct_helpers.unpack_from on a MetadataResponse"""
+    fmt = '[iSi] [hS [hii [i] [i] ] ]'
+    parts = [struct.pack('!i', 3)]
+    for broker_id in range(3):
+        parts.append(struct.pack('!ih9si', broker_id, 9, b'localhost', 9092))
+    parts.append(struct.pack('!ihh%dsi' % len(_TOPIC.name), 1, 0,
+                             len(_TOPIC.name), _TOPIC.name, partitions))
+    for partition_id in range(partitions):
+        replicas = [(partition_id + i) % 3 for i in range(3)]
+        parts.append(struct.pack('!hii', 0, partition_id, replicas[0]))
+        parts.append(struct.pack('!i3i', 3, *replicas) * 2)  # replicas, isr
+    buff = b''.join(parts)
+    return (lambda: struct_helpers.unpack_from(fmt, buff, 0), partitions,
+            len(buff))
+
+
+# these raise on messages without a key
+_KEY_REQUIRED = ('hashing', 'murmur2')
+
+
+@benchmark(partitioner=sorted(PARTITIONERS), partitions=PARTITION_COUNTS,
+           keyed=[True])
+@benchmark(partitioner=sorted(set(PARTITIONERS) - set(_KEY_REQUIRED)),
+           partitions=PARTITION_COUNTS, keyed=[False])
+def partitioner(partitioner, partitions, keyed):
+    choose = PARTITIONERS[partitioner]()
+    sorted_partitions = _partitions(partitions)
+    keys = [('key-%d' % i).encode() for i in range(1000)] if keyed else [None] * 1000
+
+    def run():
+        for key in keys:
+            choose(sorted_partitions, key)
+    return run, len(keys), 0
+
+
+@benchmark(msg_size=[100])
+def owned_partition_enqueue(msg_size):
+    """OwnedPartition.enqueue_messages, followed by consuming the batch"""
+    messages = _messages(BATCH_SIZE, msg_size)
+    owned = OwnedPartition(_partitions(1)[0],
+                           semaphore=threading.Semaphore(0))
+
+    def run():
+        owned.next_offset = 0
+        owned.enqueue_messages(messages)
+        for _ in messages:
+            owned.consume()
+    return run, len(messages), len(messages) * msg_size
+
+
+#
+# Runner
+#
+
+def run_benchmark(setup, params, min_time, rounds):
+    """Time one benchmark, returning the best round
+
+    :param min_time: Seconds to spend timing, over all rounds
+    :param rounds: Number of rounds to take the best of
+    :returns: dict of ops_per_sec, bytes_per_sec and sec_per_call
+    """
+    func, items, num_bytes = setup(**params)
+    timer = timeit.Timer(func)
+    # calibrate, so that all rounds take about min_time together
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time / rounds / 10:
+            break
+        number *= 10
+    number = max(1, int(number * (min_time / rounds) / elapsed))
+    best = min(timer.repeat(repeat=rounds, number=number)) / number
+    return {
+        'ops_per_sec': items / best,
+        'bytes_per_sec': num_bytes / best,
+        'sec_per_call': best,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Compare results against a baseline
+
+    :returns: (table rows, names of regressed benchmarks)
+    """
+    rows, regressions = [], []
+    for name, result in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            rows.append((name, result['ops_per_sec'], None, None, 'new'))
+            continue
+        change = result['ops_per_sec'] / base['ops_per_sec'] - 1
+        status = ''
+        if change < -threshold:
+            status = 'REGRESSION'
+            regressions.append(name)
+        elif change > threshold:
+            status = 'improved'
+        rows.append((name, result['ops_per_sec'], base['ops_per_sec'],
+                     '{:+.1%}'.format(change), status))
+    return rows, regressions
+
+
+def _get_arg_parser():
+    parser = argparse.ArgumentParser(
+        description='Offline microbenchmarks for pykafka.')
+    parser.add_argument('-k', '--filter', action='append', default=[],
+                        help='Only run benchmarks whose name contains this '
+                             'string. May be given several times.')
+    parser.add_argument('--list', action='store_true',
+                        help='List the benchmarks and exit.')
+    parser.add_argument('--min-time', type=float, default=0.5,
+                        help='Seconds to time each benchmark for '
+                             '(default: %(default)s)')
+    parser.add_argument('--rounds', type=int, default=5,
+                        help='Rounds to take the best of (default: %(default)s)')
+    parser.add_argument('--save', metavar='PATH',
+                        help='Save the results as a JSON baseline.')
+    parser.add_argument('--compare', metavar='PATH',
+                        help='Compare the results against a JSON baseline.')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Relative slowdown flagged as regression '
+                             '(default: %(default)s)')
+    return parser
+
+
+def main(argv=None):
+    args = _get_arg_parser().parse_args(argv)
+    selected = [(name, setup, params) for name, setup, params in BENCHMARKS
+                if not args.filter or any(f in name for f in args.filter)]
+    if args.list:
+        for name, _, _ in selected:
+            print(name)
+        return 0
+
+    results = {}
+    for name, setup, params in selected:
+        results[name] = run_benchmark(setup, params, args.min_time, args.rounds)
+        print('{:<70} {:>14,.0f} ops/s {:>10.1f} MB/s'.format(
+            name, results[name]['ops_per_sec'],
+            results[name]['bytes_per_sec'] / 1024 / 1024), file=sys.stderr)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({
+                'meta': {
+                    'pykafka': pykafka.__version__,
+                    'python': platform.python_version(),
+                    'implementation': platform.python_implementation(),
+                    'machine': platform.machine(),
+                },
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        rows, regressions = compare(results, baseline, args.threshold)
+        print(tabulate.tabulate(
+            rows, headers=['Benchmark', 'ops/s', 'baseline ops/s', 'change', ''],
+            floatfmt=',.0f'))
+        if regressions:
+            print('\n{} benchmark(s) regressed by more than {:.0%}'.format(
+                len(regressions), args.threshold))
+            return 1
+    else:
+        print(tabulate.tabulate(
+            [(name, result['ops_per_sec'], result['bytes_per_sec'] / 1024 / 1024)
+             for name, result in sorted(results.items())],
+            headers=['Benchmark', 'ops/s', 'MB/s'], floatfmt=',.1f'))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
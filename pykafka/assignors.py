@@ -0,0 +1,178 @@
+"""
+Author: Emmett Butler, Keith Bourgoin
+"""
+__license__ = """
+Copyright 2015 Parse.ly, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+__all__ = ["BaseAssignor", "RangeAssignor", "range_assignor",
+           "LegacyRangeAssignor", "legacy_range_assignor",
+           "RoundRobinAssignor", "roundrobin_assignor", "StickyAssignor",
+           "sticky_assignor"]
+
+
+def _partition_sort_key(partition):
+    # deliberately excludes the leader id, so that leader changes don't
+    # reorder partitions and thereby reshuffle the assignment
+    return (partition.topic.name, partition.id)
+
+
+def _legacy_partition_sort_key(partition):
+    # the order BalancedConsumer used before assignors were pluggable
+    return '-'.join([str(partition.topic.name), str(partition.leader.id),
+                     str(partition.id)])
+
+
+class BaseAssignor(object):
+    """Base class for partition assignment strategies
+
+    An assignor is used by :class:`pykafka.balancedconsumer.BalancedConsumer`
+    and :class:`pykafka.managedbalancedconsumer.ManagedBalancedConsumer` to
+    divide partitions among the members of a consumer group. It computes the
+    assignment of every member at once. Since members of a
+    :class:`pykafka.balancedconsumer.BalancedConsumer` group each compute the
+    assignment independently, it must be deterministic.
+    """
+    #: The protocol name under which a managed consumer announces this
+    #: strategy to the group coordinator. All members of a group must use
+    #: strategies with the same name.
+    name = None
+
+    def __call__(self, members, partitions, previous_assignment=None):
+        """Assign partitions to all members of a group
+
+        :param members: The ids of all members of the group
+        :type members: Iterable of bytes
+        :param partitions: The partitions to divide among the members
+        :type partitions: Iterable of :class:`pykafka.partition.Partition`
+        :param previous_assignment: The partitions held by each member
+            before this assignment, as far as they are known
+        :type previous_assignment: dict {bytes: Iterable of
+            :class:`pykafka.partition.Partition`}
+        :returns: A dict mapping every member id to the set of partitions
+            assigned to it
+        """
+        raise NotImplementedError('Subclasses must define their own '
+                                  ' assignor implementation')
+
+
+class RangeAssignor(BaseAssignor):
+    """Assigns each member a contiguous range of partitions
+
+    Partitions are ordered by topic name and id and members by id. If the
+    partitions don't divide evenly, the first members get one extra
+    partition each. This is the consumer rebalancing algorithm described at
+    https://kafka.apache.org/documentation/#impl_consumerrebalance
+    """
+    name = b"range"
+    _sort_key = staticmethod(_partition_sort_key)
+
+    def __call__(self, members, partitions, previous_assignment=None):
+        members = sorted(members)
+        if not members:
+            return {}
+        partitions = sorted(partitions, key=self._sort_key)
+        per_member, remainder = divmod(len(partitions), len(members))
+        assignment = {}
+        start = 0
+        for idx, member in enumerate(members):
+            end = start + per_member + (1 if idx < remainder else 0)
+            assignment[member] = set(partitions[start:end])
+            start = end
+        return assignment
+
+
+range_assignor = RangeAssignor()
+
+
+class LegacyRangeAssignor(RangeAssignor):
+    """A :class:`RangeAssignor` that orders partitions as pykafka 2.6 did
+
+    Partitions are ordered by the string "<topic>-<leader id>-<id>", so the
+    assignment also changes when leaders move. Members of a
+    :class:`pykafka.balancedconsumer.BalancedConsumer` group each compute
+    the assignment themselves, and this is what keeps members running
+    earlier versions in agreement with upgraded ones. It is the default for
+    that consumer.
+    """
+    _sort_key = staticmethod(_legacy_partition_sort_key)
+
+
+legacy_range_assignor = LegacyRangeAssignor()
+
+
+class RoundRobinAssignor(BaseAssignor):
+    """Deals partitions out to the members in turn
+
+    Partitions are ordered by topic name and id and members by id. Unlike
+    :class:`RangeAssignor`, consecutive partitions end up on different
+    members.
+    """
+    name = b"roundrobin"
+
+    def __call__(self, members, partitions, previous_assignment=None):
+        members = sorted(members)
+        partitions = sorted(partitions, key=_partition_sort_key)
+        return {member: set(partitions[idx::len(members)])
+                for idx, member in enumerate(members)}
+
+
+roundrobin_assignor = RoundRobinAssignor()
+
+
+class StickyAssignor(BaseAssignor):
+    """Keeps partitions with their previous owners as far as balance allows
+
+    Like the other assignors, every member ends up with either `n` or `n + 1`
+    partitions. Within that constraint, as few partitions as possible change
+    hands: members keep what they held before up to their share, the larger
+    shares go to the members that held the most, and only the remaining
+    partitions are handed out, in order, to members below their share.
+    Without a `previous_assignment`, this produces the same result as
+    :class:`RangeAssignor`.
+    """
+    name = b"sticky"
+
+    def __call__(self, members, partitions, previous_assignment=None):
+        members = sorted(members)
+        if not members:
+            return {}
+        previous_assignment = previous_assignment or {}
+        partitions = sorted(partitions, key=_partition_sort_key)
+        available = set(partitions)
+        held = {}
+        for member in members:
+            # if two members claim the same partition, the first one keeps it
+            held[member] = [p for p in sorted(previous_assignment.get(member, ()),
+                                              key=_partition_sort_key)
+                            if p in available]
+            available.difference_update(held[member])
+
+        per_member, remainder = divmod(len(partitions), len(members))
+        by_held = sorted(members, key=lambda m: (-len(held[m]), m))
+        shares = {member: per_member + (1 if idx < remainder else 0)
+                  for idx, member in enumerate(by_held)}
+
+        assignment = {}
+        for member in members:
+            assignment[member] = set(held[member][:shares[member]])
+            available.update(held[member][shares[member]:])
+        unassigned = iter(sorted(available, key=_partition_sort_key))
+        for member in members:
+            while len(assignment[member]) < shares[member]:
+                assignment[member].add(next(unassigned))
+        return assignment
+
+
+sticky_assignor = StickyAssignor()
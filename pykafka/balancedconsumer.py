@@ -18,16 +18,17 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 __all__ = ["BalancedConsumer"]
-import itertools
 import logging
 import socket
 import sys
+import threading
 import time
 from uuid import uuid4
 import weakref
+from collections import defaultdict
 
 from kazoo.client import KazooClient
-from kazoo.exceptions import NoNodeException, NodeExistsError
+from kazoo.exceptions import NoNodeException, NodeExistsError, RolledBackError
 from kazoo.recipe.watchers import ChildrenWatch
 try:
     from kazoo.handlers.gevent import SequentialGeventHandler
@@ -35,10 +36,12 @@ except ImportError:
     SequentialGeventHandler = None
 from six import reraise
 
+from .assignors import legacy_range_assignor, StickyAssignor
 from .common import OffsetType
 from .exceptions import KafkaException, PartitionOwnedError, ConsumerStoppedException
 from .simpleconsumer import SimpleConsumer
-from .utils.compat import range, get_bytes, itervalues, iteritems, get_string
+from .utils.compat import (range, get_bytes, itervalues, iteritems, get_string,
+                           monotonic)
 from .utils.error_handlers import valid_int
 try:
     from .handlers import GEventHandler
@@ -99,7 +102,9 @@ class BalancedConsumer(object):
                  reset_offset_on_start=False,
                  post_rebalance_callback=None,
                  use_rdkafka=False,
-                 compacted_topic=False):
+                 compacted_topic=False,
+                 assignor=legacy_range_assignor,
+                 rebalance_quiet_period_ms=0):
         """Create a BalancedConsumer instance
 
         :param topic: The topic this consumer should consume
@@ -197,6 +202,22 @@ class BalancedConsumer(object):
             consumer to use less stringent message ordering logic because compacted
             topics do not provide offsets in strict incrementing order.
         :type compacted_topic: bool
+        :param assignor: The strategy used to divide partitions among the
+            members of the consumer group. All members of a group should use
+            the same one. The default,
+            :class:`pykafka.assignors.LegacyRangeAssignor`, agrees with
+            consumers of earlier pykafka versions.
+            :class:`pykafka.assignors.StickyAssignor` is not supported, since
+            members read the current owners from zookeeper at different
+            points of a rebalance and would disagree.
+        :type assignor: :class:`pykafka.assignors.BaseAssignor`
+        :param rebalance_quiet_period_ms: How long (in milliseconds) zookeeper
+            must have been free of broker, topic and consumer changes before
+            they trigger a rebalance. Changes arriving while a rebalance is
+            pending or running are always folded into a single rebalance; a
+            quiet period additionally spreads that over bursts of changes,
+            such as many consumers restarting at once.
+        :type rebalance_quiet_period_ms: int
         """
         self._cluster = cluster
         if not isinstance(consumer_group, bytes):
@@ -228,6 +249,11 @@ class BalancedConsumer(object):
         self._running = False
         self._worker_exception = None
         self._is_compacted_topic = compacted_topic
+        if isinstance(assignor, StickyAssignor):
+            raise ValueError("StickyAssignor requires a managed consumer group")
+        self._assignor = assignor
+        self._rebalance_quiet_period_ms = valid_int(rebalance_quiet_period_ms,
+                                                    allow_zero=True)
 
         if not rdkafka and use_rdkafka:
             raise ImportError("use_rdkafka requires rdkafka to be installed")
@@ -238,6 +264,10 @@ class BalancedConsumer(object):
         self._rebalancing_lock = cluster.handler.Lock()
         self._rebalancing_in_progress = self._cluster.handler.Event()
         self._internal_consumer_running = self._cluster.handler.Event()
+        self._rebalance_requested = self._cluster.handler.Event()
+        self._last_rebalance_request = 0
+        self._rebalance_worker = None
+        self._rebalance_stats = self._build_rebalance_stats()
         self._consumer = None
         self._consumer_id = get_bytes("{hostname}:{uuid}".format(
             hostname=socket.gethostname(),
@@ -281,6 +311,11 @@ class BalancedConsumer(object):
         """The topic this consumer consumes"""
         return self._topic
 
+    @property
+    def _subscribed_topics(self):
+        """A dict mapping the names of the topics to balance to the topics"""
+        return {self._topic.name: self._topic}
+
     @property
     def partitions(self):
         """A list of the partitions that this consumer consumes"""
@@ -299,6 +334,22 @@ class BalancedConsumer(object):
             return None
         return self._consumer.held_offsets
 
+    @property
+    def rebalance_stats(self):
+        """Counts and durations of this consumer's rebalances
+
+        :returns: A dict with the keys `requested` (the number of cluster or
+            group changes that called for a rebalance), `completed` (the
+            number of rebalances performed), and `last_duration_ms`,
+            `max_duration_ms` and `total_duration_ms`
+        """
+        return dict(self._rebalance_stats)
+
+    @staticmethod
+    def _build_rebalance_stats():
+        return {"requested": 0, "completed": 0, "last_duration_ms": 0.0,
+                "max_duration_ms": 0.0, "total_duration_ms": 0.0}
+
     def start(self):
         """Open connections and join a consumer group."""
         try:
@@ -307,9 +358,12 @@ class BalancedConsumer(object):
                                       self._zookeeper_connection_timeout_ms)
             self._zookeeper.ensure_path(self._topic_path)
             self._add_self()
+            # a previous stop() leaves this set to wake the old worker
+            self._rebalance_requested.clear()
             self._running = True
             self._set_watches()
             self._rebalance()
+            self._rebalance_worker = self._setup_rebalance_worker()
         except Exception:
             log.exception("Stopping consumer in response to error")
             self.stop()
@@ -325,6 +379,12 @@ class BalancedConsumer(object):
             # rebalance that is already underway might re-register the zk
             # nodes that we remove here
             self._running = False
+        # wake the rebalance worker so that it exits
+        self._rebalance_requested.set()
+        worker, self._rebalance_worker = self._rebalance_worker, None
+        # stop() may be called from a rebalance callback on the worker itself
+        if worker is not None and worker is not threading.current_thread():
+            worker.join()
         if self._consumer is not None:
             self._consumer.stop()
         if self._owns_zookeeper:
@@ -357,15 +417,30 @@ class BalancedConsumer(object):
         self._zookeeper.start()
 
     def _setup_internal_consumer(self, partitions=None, start=True):
-        """Instantiate an internal SimpleConsumer instance"""
-        if partitions is None:
-            partitions = []
-        # Only re-create internal consumer if something changed.
-        if partitions != self._partitions:
-            cns = self._get_internal_consumer(partitions=list(partitions), start=start)
+        """Set up the internal SimpleConsumer to consume `partitions`
+
+        The first call creates it; later calls add and remove partitions in
+        place, except with rdkafka, where the consumer is recreated.
+        """
+        partitions = set(partitions or [])
+        if self._consumer is not None:
+            self._consumer._set_group_membership(self._generation_id,
+                                                 self._consumer_id)
+        # Only touch the internal consumer if something changed.
+        if self._consumer is None or partitions != self._partitions:
+            old_offsets = (self._consumer.held_offsets
+                           if self._consumer else dict())
+            if self._consumer is None or self._use_rdkafka:
+                cns = self._get_internal_consumer(partitions=list(partitions),
+                                                  start=start)
+            else:
+                # apply only the difference, so that partitions we keep
+                # hold on to their offsets and fetched messages
+                cns = self._consumer
+                held = self._partitions
+                cns.remove_partitions(held - partitions)
+                cns.add_partitions(partitions - held)
             if self._post_rebalance_callback is not None:
-                old_offsets = (self._consumer.held_offsets
-                               if self._consumer else dict())
                 new_offsets = cns.held_offsets
                 try:
                     reset_offsets = self._post_rebalance_callback(
@@ -404,13 +479,9 @@ class BalancedConsumer(object):
             # _get_internal_consumer. subsequent calls should not
             # reset the offsets, since they can happen at any time
             reset_offset_on_start = False
-        Cls = (rdkafka.RdKafkaSimpleConsumer
-               if self._use_rdkafka else SimpleConsumer)
-        return Cls(
-            self._topic,
-            self._cluster,
+        return self._new_internal_consumer(
+            partitions,
             consumer_group=self._consumer_group,
-            partitions=partitions,
             auto_commit_enable=self._auto_commit_enable,
             auto_commit_interval_ms=self._auto_commit_interval_ms,
             fetch_message_max_bytes=self._fetch_message_max_bytes,
@@ -429,46 +500,48 @@ class BalancedConsumer(object):
             consumer_id=self._consumer_id
         )
 
-    def _decide_partitions(self, participants, consumer_id=None):
-        """Decide which partitions belong to this consumer.
+    def _new_internal_consumer(self, partitions, **kwargs):
+        """Create the internal consumer of `partitions` with settings `kwargs`"""
+        Cls = (rdkafka.RdKafkaSimpleConsumer
+               if self._use_rdkafka else SimpleConsumer)
+        return Cls(self._topic, self._cluster, partitions=partitions, **kwargs)
+
+    def _decide_assignment(self, participants, previous_assignment=None):
+        """Decide which partitions belong to each member of the group
 
-        Uses the consumer rebalancing algorithm described here
-        https://kafka.apache.org/documentation/#impl_consumerrebalance
+        The assignment is computed by `self._assignor`, in one pass for all
+        members. Since every consumer in the group computes it independently,
+        it must only depend on the arguments and the topics' partitions.
 
-        It is very important that the participants array is sorted,
-        since this algorithm runs on each consumer and indexes into the same
-        array. The same array index operation must return the same
-        result on each consumer.
+        :param participants: The ids of all consumers in this consumer group
+        :type participants: Iterable of `bytes`
+        :param previous_assignment: The partitions held by each consumer before
+            this rebalance, used by sticky assignors
+        :type previous_assignment: dict {bytes: Iterable of
+            :class:`pykafka.partition.Partition`}
+        :returns: A dict mapping each participant to a set of partitions
+        """
+        participants = list(participants)
+        all_parts = [p for topic in itervalues(self._subscribed_topics)
+                     for p in itervalues(topic.partitions)]
+        assignment = self._assignor(participants, all_parts, previous_assignment)
+        log.info('%s: Balancing %i participants for %i partitions.',
+                 self._consumer_id, len(participants), len(all_parts))
+        return assignment
+
+    def _decide_partitions(self, participants, consumer_id=None):
+        """Decide which partitions belong to this consumer.
 
-        :param participants: Sorted list of ids of all other consumers in this
-            consumer group.
+        :param participants: The ids of all consumers in this consumer group
         :type participants: Iterable of `bytes`
         :param consumer_id: The ID of the consumer for which to generate a partition
             assignment. Defaults to `self._consumer_id`
         """
-        # Freeze and sort partitions so we always have the same results
-        def p_to_str(p):
-            return '-'.join([str(p.topic.name), str(p.leader.id), str(p.id)])
-
-        all_parts = self._topic.partitions.values()
-        all_parts = sorted(all_parts, key=p_to_str)
-
-        # get start point, # of partitions, and remainder
-        participants = sorted(participants)  # just make sure it's sorted.
-        idx = participants.index(consumer_id or self._consumer_id)
-        parts_per_consumer = len(all_parts) // len(participants)
-        remainder_ppc = len(all_parts) % len(participants)
-
-        start = parts_per_consumer * idx + min(idx, remainder_ppc)
-        num_parts = parts_per_consumer + (0 if (idx + 1 > remainder_ppc) else 1)
-
-        # assign partitions from i*N to (i+1)*N - 1 to consumer Ci
-        new_partitions = itertools.islice(all_parts, start, start + num_parts)
-        new_partitions = set(new_partitions)
-        log.info('%s: Balancing %i participants for %i partitions. Owning %i partitions.',
-                 self._consumer_id, len(participants), len(all_parts),
-                 len(new_partitions))
-        log.debug('My partitions: %s', [p_to_str(p) for p in new_partitions])
+        consumer_id = consumer_id or self._consumer_id
+        new_partitions = self._decide_assignment(participants)[consumer_id]
+        log.info('%s: Owning %i partitions.', consumer_id, len(new_partitions))
+        log.debug('My partitions: %s', sorted(
+            '{}-{}'.format(p.topic.name, p.id) for p in new_partitions))
         return new_partitions
 
     def _get_participants(self):
@@ -484,10 +557,14 @@ class BalancedConsumer(object):
                       "No participants to find")
             return []
 
+        # issue all reads before waiting on any of them
+        pending = [(id_, self._zookeeper.get_async(
+                    "%s/%s" % (self._consumer_id_path, id_)))
+                   for id_ in consumer_ids]
         participants = []
-        for id_ in consumer_ids:
+        for id_, result in pending:
             try:
-                topic, stat = self._zookeeper.get("%s/%s" % (self._consumer_id_path, id_))
+                topic, stat = result.get()
                 if topic == self._topic.name:
                     participants.append(get_bytes(id_))
             except NoNodeException:
@@ -574,6 +651,7 @@ class BalancedConsumer(object):
                     self._add_self()
                     participants.append(self._consumer_id)
 
+                owners = self._get_partition_owners()
                 new_partitions = self._decide_partitions(participants)
                 if not new_partitions:
                     log.warning("No partitions assigned to consumer %s",
@@ -586,7 +664,7 @@ class BalancedConsumer(object):
                 # where due to an interrupted connection our zk session
                 # has expired, in which case we'd hold zero partitions on
                 # zk, but `self._partitions` may be outdated and non-empty
-                current_zk_parts = self._get_held_partitions()
+                current_zk_parts = owners.get(get_bytes(self._consumer_id), set())
                 self._remove_partitions(current_zk_parts - new_partitions)
                 self._add_partitions(new_partitions - current_zk_parts)
                 if self._setup_internal_consumer(new_partitions):
@@ -600,11 +678,58 @@ class BalancedConsumer(object):
                 log.info('Unable to acquire partition %s. Retrying', ex.partition)
                 self._cluster.handler.sleep(i * (self._rebalance_backoff_ms / 1000))
 
+    def _request_rebalance(self):
+        """Ask the rebalance worker to rebalance once things have settled
+
+        Requests made before the worker gets to run are coalesced into one
+        rebalance.
+        """
+        self._rebalance_stats["requested"] += 1
+        self._last_rebalance_request = monotonic()
+        self._rebalance_requested.set()
+
+    def _setup_rebalance_worker(self):
+        """Start the thread that carries out requested rebalances"""
+        self = weakref.proxy(self)
+
+        def rebalancer():
+            while True:
+                try:
+                    if not self._running:
+                        break
+                    if not self._rebalance_requested.wait(1):
+                        continue
+                    # wait until no request has come in for the quiet period
+                    while self._running:
+                        quiet_left = (self._last_rebalance_request +
+                                      self._rebalance_quiet_period_ms / 1000 -
+                                      monotonic())
+                        if quiet_left <= 0:
+                            break
+                        self._cluster.handler.sleep(quiet_left)
+                    # requests from here on lead to another rebalance
+                    self._rebalance_requested.clear()
+                    if not self._running:
+                        break
+                    self._rebalance()
+                except (ReferenceError, ConsumerStoppedException):
+                    break
+                except Exception:
+                    # surface all exceptions to the main thread
+                    self._worker_exception = sys.exc_info()
+                    break
+            log.debug("Rebalance worker exiting")
+        log.debug("Starting rebalance worker")
+        return self._cluster.handler.spawn(
+            rebalancer, name="pykafka.BalancedConsumer.rebalancer")
+
     def _rebalance(self):
         """Start the rebalancing process for this consumer
 
-        This method is called whenever a zookeeper watch is triggered.
+        This method is called by the rebalance worker after zookeeper watches
+        have been triggered.
         """
+        start = time.time()
         # This Event is used to notify about rebalance operation to SimpleConsumer's consume().
         if not self._rebalancing_in_progress.is_set():
             self._rebalancing_in_progress.set()
@@ -617,11 +742,18 @@ class BalancedConsumer(object):
             if not self._running:
                 raise ConsumerStoppedException
             log.info('Rebalancing consumer "%s" for topic "%s".' % (
-                self._consumer_id, self._topic.name))
+                self._consumer_id,
+                ", ".join(get_string(t) for t in sorted(self._subscribed_topics))))
             self._update_member_assignment()
 
         if self._rebalancing_in_progress.is_set():
             self._rebalancing_in_progress.clear()
+        duration_ms = (time.time() - start) * 1000
+        stats = self._rebalance_stats
+        stats["completed"] += 1
+        stats["last_duration_ms"] = duration_ms
+        stats["max_duration_ms"] = max(stats["max_duration_ms"], duration_ms)
+        stats["total_duration_ms"] += duration_ms
 
 
     def _path_from_partition(self, p):
@@ -637,9 +769,14 @@ class BalancedConsumer(object):
         :param partitions: The partitions to remove.
         :type partitions: Iterable of :class:`pykafka.partition.Partition`
         """
-        for p in partitions:
-            # TODO pass zk node version to make sure we still own this node
-            self._zookeeper.delete(self._path_from_partition(p))
+        # TODO pass zk node version to make sure we still own these nodes
+        pending = [self._zookeeper.delete_async(self._path_from_partition(p))
+                   for p in partitions]
+        for result in pending:
+            try:
+                result.get()
+            except NoNodeException:
+                pass  # already gone, e.g. because our session expired
 
     def _add_partitions(self, partitions):
         """Add partitions to the zookeeper registry for this consumer.
@@ -647,30 +784,51 @@ class BalancedConsumer(object):
         :param partitions: The partitions to add.
         :type partitions: Iterable of :class:`pykafka.partition.Partition`
         """
+        partitions = list(partitions)
+        if not partitions:
+            return
+        # a transaction claims all partitions in one round trip, and none of
+        # them if any is still owned by another consumer
+        transaction = self._zookeeper.transaction()
         for p in partitions:
-            try:
-                self._zookeeper.create(
-                    self._path_from_partition(p),
-                    value=get_bytes(self._consumer_id),
-                    ephemeral=True
-                )
-            except NodeExistsError:
+            transaction.create(self._path_from_partition(p),
+                               value=get_bytes(self._consumer_id),
+                               ephemeral=True)
+        results = transaction.commit()
+        for p, result in zip(partitions, results):
+            if isinstance(result, NodeExistsError):
                 raise PartitionOwnedError(p)
+        for result in results:
+            if isinstance(result, Exception) and \
+                    not isinstance(result, RolledBackError):
+                raise result
 
     def _get_held_partitions(self):
         """Build a set of partitions zookeeper says we own"""
-        zk_partition_ids = set()
+        return self._get_partition_owners().get(get_bytes(self._consumer_id), set())
+
+    def _get_partition_owners(self):
+        """Build a map from consumer id to the partitions zookeeper says it owns"""
+        owners = defaultdict(set)
         all_partitions = self._zookeeper.get_children(self._topic_path)
-        for partition_slug in all_partitions:
+        # issue all reads before waiting on any of them
+        pending = [(partition_slug, self._zookeeper.get_async(
+                    '{path}/{slug}'.format(path=self._topic_path, slug=partition_slug)))
+                   for partition_slug in all_partitions]
+        for partition_slug, result in pending:
             try:
-                owner_id, stat = self._zookeeper.get(
-                    '{path}/{slug}'.format(
-                        path=self._topic_path, slug=partition_slug))
-                if owner_id == get_bytes(self._consumer_id):
-                    zk_partition_ids.add(int(partition_slug.split('-')[1]))
+                owner_id, stat = result.get()
             except NoNodeException:
-                pass  # disappeared between ``get_children`` and ``get``
-        return set(self._topic.partitions[_id] for _id in zk_partition_ids)
+                continue  # disappeared between ``get_children`` and ``get``
+            partition_id = int(partition_slug.split('-')[1])
+            partition = self._topic.partitions.get(partition_id)
+            if partition is None:
+                # added to the topic since our metadata was last updated
+                log.debug("%s: Ignoring owner of unknown partition %s",
+                          self._consumer_id, partition_slug)
+                continue
+            owners[owner_id].add(partition)
+        return dict(owners)
 
     @_catch_thread_exception
     def _brokers_changed(self, brokers):
@@ -680,7 +838,7 @@ class BalancedConsumer(object):
             return
         log.debug("Rebalance triggered by broker change ({})".format(
             self._consumer_id))
-        self._rebalance()
+        self._request_rebalance()
 
     @_catch_thread_exception
     def _consumers_changed(self, consumers):
@@ -690,7 +848,7 @@ class BalancedConsumer(object):
             return
         log.debug("Rebalance triggered by consumer change ({})".format(
             self._consumer_id))
-        self._rebalance()
+        self._request_rebalance()
 
     @_catch_thread_exception
     def _topics_changed(self, topics):
@@ -700,7 +858,7 @@ class BalancedConsumer(object):
             return
         log.debug("Rebalance triggered by topic change ({})".format(
             self._consumer_id))
-        self._rebalance()
+        self._request_rebalance()
 
     def reset_offsets(self, partition_offsets=None):
         """Reset offsets for the specified partitions
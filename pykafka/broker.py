@@ -23,6 +23,7 @@ import time
 from .connection import BrokerConnection
 from .exceptions import LeaderNotAvailable, SocketDisconnectedError
 from .handlers import RequestHandler
+from .metrics import MetricsRegistry
 from .protocol import (
     FetchRequest, FetchResponse, OffsetRequest, OffsetResponse, MetadataRequest,
     MetadataResponse, OffsetCommitRequest, OffsetCommitResponse, OffsetFetchRequest,
@@ -60,7 +61,8 @@ class Broker(object):
                  source_host='',
                  source_port=0,
                  ssl_config=None,
-                 broker_version="0.9.0"):
+                 broker_version="0.9.0",
+                 request_hooks=None):
         """Create a Broker instance.
 
         :param id_: The id number of this broker
@@ -89,6 +91,9 @@ class Broker(object):
         :type source_port: int
         :param ssl_config: Config object for SSL connection
         :type ssl_config: :class:`pykafka.connection.SslConfig`
+        :param request_hooks: Listener for the lifecycle of requests to this
+            broker
+        :type request_hooks: :class:`pykafka.hooks.RequestHooks`
         """
         self._connection = None
         self._offsets_channel_connection = None
@@ -106,6 +111,8 @@ class Broker(object):
         self._buffer_size = buffer_size
         self._req_handlers = {}
         self._broker_version = broker_version
+        self._request_hooks = request_hooks
+        self._metrics = MetricsRegistry()
         try:
             self.connect()
         except SocketDisconnectedError:
@@ -132,7 +139,8 @@ class Broker(object):
                       source_host='',
                       source_port=0,
                       ssl_config=None,
-                      broker_version="0.9.0"):
+                      broker_version="0.9.0",
+                      request_hooks=None):
         """Create a Broker using BrokerMetadata
 
         :param metadata: Metadata that describes the broker.
@@ -156,6 +164,9 @@ class Broker(object):
         :type source_port: int
         :param ssl_config: Config object for SSL connection
         :type ssl_config: :class:`pykafka.connection.SslConfig`
+        :param request_hooks: Listener for the lifecycle of requests to this
+            broker
+        :type request_hooks: :class:`pykafka.hooks.RequestHooks`
         """
         return cls(metadata.id, metadata.host,
                    metadata.port, handler, socket_timeout_ms,
@@ -164,7 +175,8 @@ class Broker(object):
                    source_host=source_host,
                    source_port=source_port,
                    ssl_config=ssl_config,
-                   broker_version=broker_version)
+                   broker_version=broker_version,
+                   request_hooks=request_hooks)
 
     @property
     def connected(self):
@@ -214,6 +226,24 @@ class Broker(object):
         """
         return self._offsets_channel_req_handler
 
+    def stats(self):
+        """Take a snapshot of this broker's request metrics
+
+        Counts are kept over all connections to the broker, across reconnects.
+
+        :returns: dict of `requests_sent`, `requests_failed`, `bytes_sent`,
+            `bytes_received`, the `response_latency_us` histogram (see
+            :meth:`pykafka.metrics.Histogram.snapshot`) and `queued_requests`,
+            the number of requests waiting to be sent
+        """
+        stats = self._metrics.stats()
+        handlers = set(self._req_handlers.values())
+        handlers.update([self._req_handler, self._offsets_channel_req_handler])
+        stats['queued_requests'] = sum(
+            h.shared.requests.qsize() for h in handlers
+            if h is not None and h.shared is not None)
+        return stats
+
     def connect(self):
         """Establish a connection to the broker server.
 
@@ -227,7 +257,9 @@ class Broker(object):
                                             source_port=self._source_port,
                                             ssl_config=self._ssl_config)
         self._connection.connect(self._socket_timeout_ms)
-        self._req_handler = RequestHandler(self._handler, self._connection)
+        self._req_handler = RequestHandler(self._handler, self._connection,
+                                           self._request_hooks, self._id,
+                                           self._metrics)
         self._req_handler.start()
 
     def connect_offsets_channel(self):
@@ -244,7 +276,8 @@ class Broker(object):
             ssl_config=self._ssl_config)
         self._offsets_channel_connection.connect(self._offsets_channel_socket_timeout_ms)
         self._offsets_channel_req_handler = RequestHandler(
-            self._handler, self._offsets_channel_connection
+            self._handler, self._offsets_channel_connection,
+            self._request_hooks, self._id, self._metrics
         )
         self._offsets_channel_req_handler.start()
 
@@ -269,7 +302,8 @@ class Broker(object):
                 self.host, self.port, self._handler, buffer_size=self._buffer_size,
                 source_host=self._source_host, source_port=self._source_port)
             conn.connect(self._socket_timeout_ms)
-            handler = RequestHandler(self._handler, conn)
+            handler = RequestHandler(self._handler, conn, self._request_hooks,
+                                     self._id, self._metrics)
             handler.start()
             self._req_handlers[connection_id] = handler
         return self._req_handlers[connection_id]
@@ -416,7 +450,8 @@ class Broker(object):
     #  Group Membership API  #
     ##########################
 
-    def join_group(self, connection_id, consumer_group, member_id, topic_name):
+    def join_group(self, connection_id, consumer_group, member_id, topic_name,
+                   protocol_name=b"range", user_data=None):
         """Send a JoinGroupRequest
 
         :param connection_id: The unique identifier of the connection on which to make
@@ -426,14 +461,21 @@ class Broker(object):
         :type consumer_group: bytes
         :param member_id: The ID of the consumer joining the group
         :type member_id: bytes
-        :param topic_name: The name of the topic to which to connect, used in protocol
-            metadata
-        :type topic_name: str
+        :param topic_name: The name of the topic to which to connect, or a list of
+            the names of several topics, used in protocol metadata
+        :type topic_name: bytes or list of bytes
+        :param protocol_name: The name of the partition assignment strategy to use
+        :type protocol_name: bytes
+        :param user_data: Data for the group leader's assignment strategy, used in
+            protocol metadata
+        :type user_data: bytes
         """
         handler = self._get_unique_req_handler(connection_id)
         if handler is None:
             raise SocketDisconnectedError
-        future = handler.request(JoinGroupRequest(consumer_group, member_id, topic_name))
+        future = handler.request(JoinGroupRequest(consumer_group, member_id, topic_name,
+                                                  protocol_name=protocol_name,
+                                                  user_data=user_data))
         self._handler.sleep()
         return future.get(JoinGroupResponse)
 
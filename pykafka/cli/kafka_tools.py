@@ -1,17 +1,46 @@
 from __future__ import print_function
 
 import argparse
+from array import array
 import calendar
 import datetime as dt
+import json
+import logging
+import mmap
+import os
+import struct
 import sys
 import time
 
 import tabulate
 
 import pykafka
-from pykafka.common import OffsetType
+from pykafka.common import CompressionType, OffsetType
+from pykafka.partitioners import (hashing_partitioner, murmur2_partitioner,
+                                  random_partitioner, LatencyAwarePartitioner,
+                                  StickyPartitioner)
 from pykafka.protocol import PartitionOffsetCommitRequest
-from pykafka.utils.compat import PY3, iteritems
+from pykafka.utils.compat import PY3, get_string, iteritems
+
+log = logging.getLogger(__name__)
+
+# Size of the reads used for input that can't be memory-mapped
+READ_CHUNK_BYTES = 4 * 1024 * 1024
+
+COMPRESSION_TYPES = {
+    'none': CompressionType.NONE,
+    'gzip': CompressionType.GZIP,
+    'snappy': CompressionType.SNAPPY,
+}
+
+# Factories, so that stateful partitioners aren't shared
+PARTITIONERS = {
+    'random': lambda: random_partitioner,
+    'hashing': lambda: hashing_partitioner,
+    'murmur2': lambda: murmur2_partitioner,
+    'sticky': StickyPartitioner,
+    'latency_aware': LatencyAwarePartitioner,
+}
 
 #
 # Helper Functions
@@ -52,11 +81,190 @@ def fetch_consumer_lag(client, topic, consumer_group):
     :returns: dict of {partition_id: (latest_offset, consumer_offset)}
     """
     latest_offsets = fetch_offsets(client, topic, 'latest')
-    consumer = topic.get_simple_consumer(consumer_group=consumer_group,
-                                         auto_start=False)
-    current_offsets = consumer.fetch_offsets()
+    current_offsets = client.cluster.fetch_group_offsets(consumer_group, [topic])
     return {p_id: (latest_offsets[p_id].offset[0], res.offset)
-            for p_id, res in current_offsets}
+            for (_, p_id), res in iteritems(current_offsets)}
+
+
+def fetch_group_lags(client, group_topics):
+    """Get raw lag data for many consumer groups and topics at once.
+
+    The latest offsets of all topics are fetched with one request per
+    broker, and the committed offsets of each group with one request to its
+    coordinator. Partitions for which a group has no committed offset, or
+    whose lookup failed, are left out.
+
+    :param client: KafkaClient connected to the cluster.
+    :type client:  :class:`pykafka.KafkaClient`
+    :param group_topics: The topics to check for each consumer group.
+    :type group_topics: dict of {consumer_group: [:class:`pykafka.topic.Topic`]}
+    :returns: dict of {(consumer_group, topic_name, partition_id):
+        (latest_offset, consumer_offset)}
+    """
+    topics = {topic.name: topic
+              for group_topics_ in group_topics.values() for topic in group_topics_}
+    latest_offsets = client.cluster.fetch_offset_limits(
+        list(topics.values()), OffsetType.LATEST)
+    output = {}
+    for consumer_group, group_topics_ in iteritems(group_topics):
+        current_offsets = client.cluster.fetch_group_offsets(consumer_group,
+                                                             group_topics_)
+        for key, res in iteritems(current_offsets):
+            latest = latest_offsets.get(key)
+            if res.err or res.offset < 0 or latest is None or latest.err:
+                continue
+            output[(consumer_group,) + key] = (latest.offset[0], res.offset)
+    return output
+
+
+def format_lag_metrics(lag_info):
+    """Format lag data in the Prometheus text exposition format.
+
+    :param lag_info: Lag data, as returned by `fetch_group_lags`.
+    :type lag_info: dict of {(consumer_group, topic_name, partition_id):
+        (latest_offset, consumer_offset)}
+    :returns: :class:`str`
+    """
+    def labels(*pairs):
+        return ','.join('{}="{}"'.format(
+            name, get_string(value).replace('\\', '\\\\')
+                                   .replace('"', '\\"').replace('\n', '\\n'))
+            for name, value in pairs)
+
+    group_metrics = [
+        ('kafka_consumergroup_lag', 'Messages the consumer group has yet to '
+         'consume from the partition.', lambda latest, current: latest - current),
+        ('kafka_consumergroup_current_offset', 'The offset committed by the '
+         'consumer group for the partition.', lambda latest, current: current),
+    ]
+    lines = []
+    for name, description, value in group_metrics:
+        lines.append('# HELP {} {}'.format(name, description))
+        lines.append('# TYPE {} gauge'.format(name))
+        for (group, topic, partition_id), offsets in sorted(iteritems(lag_info)):
+            lines.append('{}{{{}}} {}'.format(
+                name,
+                labels(('group', group), ('topic', topic),
+                       ('partition', partition_id)),
+                value(*offsets)))
+    name = 'kafka_topic_partition_latest_offset'
+    lines.append('# HELP {} The offset of the next message appended to the '
+                 'partition.'.format(name))
+    lines.append('# TYPE {} gauge'.format(name))
+    latest_offsets = {(topic, partition_id): latest
+                      for (_, topic, partition_id), (latest, _) in iteritems(lag_info)}
+    for (topic, partition_id), latest in sorted(iteritems(latest_offsets)):
+        lines.append('{}{{{}}} {}'.format(
+            name, labels(('topic', topic), ('partition', partition_id)), latest))
+    return '\n'.join(lines) + '\n'
+
+
+def read_chunks(infile):
+    """Read a binary file in as few, large pieces as possible.
+
+    Regular files are memory-mapped and returned as a single chunk, so that
+    records can be sliced out without copying the file through Python.
+    Pipes and other unmappable input are read in `READ_CHUNK_BYTES` pieces.
+
+    :param infile: The file to read.
+    :type infile: binary file object
+    :returns: generator of `bytes` or `mmap.mmap`
+    """
+    try:
+        data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, EnvironmentError, ValueError):
+        # Not a regular file (or an empty one)
+        data = None
+    if data is not None:
+        try:
+            yield data
+        finally:
+            data.close()
+        return
+    while True:
+        chunk = infile.read(READ_CHUNK_BYTES)
+        if not chunk:
+            return
+        yield chunk
+
+
+def split_records(chunks, length_prefixed=False):
+    """Split a stream of chunks into records.
+
+    Records are either separated by newlines, or each prefixed by its length
+    as a 4-byte big-endian integer.
+
+    :param chunks: The input, as returned by `read_chunks`.
+    :type chunks: iterable of `bytes` or `mmap.mmap`
+    :param length_prefixed: Whether records are length-prefixed rather than
+        newline-delimited.
+    :type length_prefixed: bool
+    :returns: generator of `bytes`
+    """
+    buf = b''
+    for chunk in chunks:
+        buf = buf + chunk if buf else chunk
+        pos, end = 0, len(buf)
+        if length_prefixed:
+            while pos + 4 <= end:
+                size, = struct.unpack_from('>i', buf, pos)
+                if size < 0:
+                    raise ValueError('Invalid record length {}'.format(size))
+                if pos + 4 + size > end:
+                    break
+                yield buf[pos + 4:pos + 4 + size]
+                pos += 4 + size
+        else:
+            while True:
+                newline = buf.find(b'\n', pos)
+                if newline < 0:
+                    break
+                yield buf[pos:newline]
+                pos = newline + 1
+        # carry over the incomplete record at the end of the chunk
+        buf = buf[pos:]
+    if buf:
+        if length_prefixed:
+            raise ValueError('Input ends with a truncated record')
+        yield buf  # last line has no trailing newline
+
+
+def latency_summary(latencies_ms):
+    """Summarize latency samples in the way the JVM perf-test tools do.
+
+    Percentiles use the nearest-rank method.
+
+    :param latencies_ms: Latency samples in milliseconds.
+    :type latencies_ms: sequence of float
+    :returns: dict of `avg`, `max`, `p50`, `p99` and `p999`, or None if
+        there are no samples
+    """
+    if not latencies_ms:
+        return None
+    samples = sorted(latencies_ms)
+    output = {'avg': sum(samples) / len(samples), 'max': samples[-1]}
+    for name, per_mille in (('p50', 500), ('p99', 990), ('p999', 999)):
+        rank = max(1, -(-per_mille * len(samples) // 1000))
+        output[name] = samples[rank - 1]
+    return output
+
+
+def perf_report(num_records, num_bytes, elapsed, latencies_ms, **extra):
+    """Build the JSON report of the perf commands.
+
+    :returns: :class:`str`
+    """
+    elapsed = max(elapsed, 1e-6)
+    report = {
+        'records': num_records,
+        'bytes': num_bytes,
+        'elapsed_sec': elapsed,
+        'records_per_sec': num_records / elapsed,
+        'mb_per_sec': num_bytes / 1024.0 / 1024 / elapsed,
+        'latency_ms': latency_summary(latencies_ms),
+    }
+    report.update(extra)
+    return json.dumps(report, sort_keys=True)
 
 
 #
@@ -116,6 +324,236 @@ def desc_topic(client, args):
     ))
 
 
+def lag_exporter(client, args):
+    """Periodically write consumer lag for many groups and topics.
+
+    Runs until interrupted, reusing one connection to the cluster. Lag is
+    written in the Prometheus text exposition format, either to stdout or
+    by atomically replacing the output file, as expected by the node
+    exporter's textfile collector. Errors are logged and the next interval
+    is tried after refreshing the cluster metadata.
+
+    :param client: KafkaClient connected to the cluster.
+    :type client:  :class:`pykafka.KafkaClient`
+    :param track: Consumer groups and the topics to check for each.
+    :type track: list of (consumer_group, [topic_name])
+    :param interval: Seconds between lag checks.
+    :type interval: :class:`float`
+    :param outfile: Path of the file to write, or None for stdout.
+    :type outfile: :class:`str`
+    """
+    group_topics = {}
+    for consumer_group, topic_names in args.track:
+        for topic_name in topic_names:
+            # Don't auto-create topics.
+            if topic_name not in client.topics:
+                raise ValueError('Topic {} does not exist.'.format(topic_name))
+        # hold on to the topics, since the client only keeps weak references
+        group_topics.setdefault(consumer_group, []).extend(
+            client.topics[topic_name] for topic_name in topic_names)
+
+    while True:
+        start = time.time()
+        try:
+            metrics = format_lag_metrics(fetch_group_lags(client, group_topics))
+        except Exception:
+            log.exception('Error checking consumer lag')
+            client.update_cluster()
+        else:
+            if args.outfile is None:
+                sys.stdout.write(metrics)
+                sys.stdout.flush()
+            else:
+                tmp_path = '{}.tmp'.format(args.outfile)
+                with open(tmp_path, 'w') as f:
+                    f.write(metrics)
+                os.rename(tmp_path, args.outfile)
+        if args.once:
+            break
+        time.sleep(max(0, args.interval - (time.time() - start)))
+
+
+def produce_topic(client, args):
+    """Produce records from a file or stdin to a topic.
+
+    Progress is reported on stderr every `report_interval` seconds, and once
+    more after all records have been delivered.
+
+    :param client: KafkaClient connected to the cluster.
+    :type client:  :class:`pykafka.KafkaClient`
+    :param topic:  Name of the topic.
+    :type topic:  :class:`str`
+    :param infile: Path of the input, or `-` for stdin.
+    :type infile: :class:`str`
+    :param length_prefixed: Whether records are length-prefixed rather than
+        newline-delimited.
+    :type length_prefixed: bool
+    :param key_separator: If set, records are split on its first occurrence
+        into a partition key and the message.
+    :type key_separator: bytes
+    """
+    # Don't auto-create topics.
+    if args.topic not in client.topics:
+        raise ValueError('Topic {} does not exist.'.format(args.topic))
+    topic = client.topics[args.topic]
+    producer_kwargs = {
+        'compression': COMPRESSION_TYPES[args.compression],
+        'partitioner': PARTITIONERS[args.partitioner](),
+        'required_acks': args.required_acks,
+    }
+    for name in ('linger_ms', 'min_queued_messages', 'max_queued_messages',
+                 'max_request_size'):
+        if getattr(args, name) is not None:
+            producer_kwargs[name] = getattr(args, name)
+
+    def report(num_messages, num_bytes, elapsed):
+        elapsed = max(elapsed, 1e-6)
+        sys.stderr.write(
+            '{} messages, {:.1f} MB in {:.1f}s '
+            '({:.0f} messages/s, {:.2f} MB/s)\n'.format(
+                num_messages, num_bytes / 1e6, elapsed,
+                num_messages / elapsed, num_bytes / 1e6 / elapsed))
+
+    if args.infile == '-':
+        infile = getattr(sys.stdin, 'buffer', sys.stdin)
+    else:
+        infile = open(args.infile, 'rb')
+    num_messages = num_bytes = 0
+    start = last_report = time.time()
+    try:
+        with topic.get_producer(**producer_kwargs) as producer:
+            records = split_records(read_chunks(infile), args.length_prefixed)
+            for record in records:
+                key = None
+                if args.key_separator is not None:
+                    key, sep, value = record.partition(args.key_separator)
+                    if not sep:
+                        key, value = None, record
+                else:
+                    value = record
+                producer.produce(value, partition_key=key)
+                num_messages += 1
+                num_bytes += len(record)
+                # checking the clock for every message would cost too much
+                if num_messages % 1000 == 0:
+                    now = time.time()
+                    if now - last_report >= args.report_interval:
+                        report(num_messages, num_bytes, now - start)
+                        last_report = now
+    finally:
+        if args.infile != '-':
+            infile.close()
+    # the producer has flushed once stopped
+    report(num_messages, num_bytes, time.time() - start)
+
+
+def perf_consume(client, args):
+    """Measure consumer throughput and latency and print them as JSON.
+
+    Consumes from the earliest offsets until `num_records` messages have been
+    read or none arrived for `timeout_ms`. Latency is measured end to end,
+    from the timestamp a message was produced with until it was returned by
+    `consume()`, and is only available for messages carrying timestamps.
+
+    :param client: KafkaClient connected to the cluster.
+    :type client:  :class:`pykafka.KafkaClient`
+    :param topic:  Name of the topic.
+    :type topic:  :class:`str`
+    :param num_records: Number of messages to consume.
+    :type num_records: int
+    """
+    # Don't auto-create topics.
+    if args.topic not in client.topics:
+        raise ValueError('Topic {} does not exist.'.format(args.topic))
+    topic = client.topics[args.topic]
+    consumer = topic.get_simple_consumer(
+        use_rdkafka=args.use_rdkafka,
+        auto_offset_reset=OffsetType.EARLIEST,
+        reset_offset_on_start=True,
+        consumer_timeout_ms=args.timeout_ms,
+        fetch_message_max_bytes=args.fetch_message_max_bytes,
+        num_consumer_fetchers=args.num_consumer_fetchers,
+        queued_max_messages=args.queued_max_messages)
+    latencies = array('d')
+    num_records = num_bytes = 0
+    start = time.time()
+    try:
+        while num_records < args.num_records:
+            msg = consumer.consume()
+            if msg is None:
+                break
+            num_records += 1
+            num_bytes += len(msg.value or b'')
+            if msg.timestamp and msg.timestamp > 0:
+                latencies.append(time.time() * 1000 - msg.timestamp)
+    finally:
+        elapsed = time.time() - start
+        consumer.stop()
+    print(perf_report(num_records, num_bytes, elapsed, latencies))
+
+
+def perf_produce(client, args):
+    """Measure producer throughput and latency and print them as JSON.
+
+    Produces `num_records` messages of `record_size` bytes, optionally
+    limited to `throughput` messages per second. Latency is measured from
+    `produce()` until the delivery report for the message arrives, and
+    throughput up to when all messages have been delivered.
+
+    :param client: KafkaClient connected to the cluster.
+    :type client:  :class:`pykafka.KafkaClient`
+    :param topic:  Name of the topic.
+    :type topic:  :class:`str`
+    :param num_records: Number of messages to produce.
+    :type num_records: int
+    :param record_size: Size of each message in bytes.
+    :type record_size: int
+    :param throughput: Maximum messages per second, or a negative number
+        for no limit.
+    :type throughput: float
+    """
+    # Don't auto-create topics.
+    if args.topic not in client.topics:
+        raise ValueError('Topic {} does not exist.'.format(args.topic))
+    topic = client.topics[args.topic]
+    producer_kwargs = {
+        'use_rdkafka': args.use_rdkafka,
+        'compression': COMPRESSION_TYPES[args.compression],
+        'required_acks': args.required_acks,
+    }
+    for name in ('linger_ms', 'min_queued_messages', 'max_queued_messages'):
+        if getattr(args, name) is not None:
+            producer_kwargs[name] = getattr(args, name)
+    # Random payloads would only measure how badly they compress, so use the
+    # same kind of payload as the JVM tool
+    payload = b'A' * args.record_size
+    latencies = array('d')
+    failures = []
+
+    def on_delivery(sent, msg, exc):
+        if exc is None:
+            latencies.append((time.time() - sent) * 1000)
+        else:
+            failures.append(exc)
+
+    start = time.time()
+    with topic.get_producer(**producer_kwargs) as producer:
+        for i in range(args.num_records):
+            if args.throughput > 0:
+                # sleep while ahead of schedule
+                delay = start + i / args.throughput - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            now = time.time()
+            producer.produce(
+                payload,
+                on_delivery=lambda msg, exc, sent=now: on_delivery(sent, msg, exc))
+    elapsed = time.time() - start
+    print(perf_report(args.num_records - len(failures),
+                      (args.num_records - len(failures)) * args.record_size,
+                      elapsed, latencies, failed=len(failures)))
+
+
 def print_managed_consumer_groups(client, args):
     """Get Kafka-managed consumer groups for a topic.
 
@@ -278,6 +716,19 @@ def _add_consumer_group(parser):
                         type=_encode_utf8)
 
 
+def _parse_group_topics(string):
+    """Parses a GROUP:TOPIC[,TOPIC...] argument.
+
+    :returns: (consumer_group, [topic_name]) as bytes
+    """
+    consumer_group, sep, topic_names = string.partition(':')
+    if not sep or not consumer_group or not topic_names:
+        raise argparse.ArgumentTypeError(
+            'expected GROUP:TOPIC[,TOPIC...], got {!r}'.format(string))
+    return (_encode_utf8(consumer_group),
+            [_encode_utf8(name) for name in topic_names.split(',')])
+
+
 def _add_limit(parser):
     """Add limit option to arg parser."""
     parser.add_argument('-l', '--limit',
@@ -302,6 +753,20 @@ def _add_outfile(parser):
                         type=argparse.FileType('w'), default=sys.stdout)
 
 
+def _add_perf_options(parser):
+    """Add options shared by the perf commands to arg parser."""
+    parser.add_argument('-n', '--num-records',
+                        help='Number of messages (default: %(default)s)',
+                        type=int, default=10**6)
+    parser.add_argument('--handler',
+                        help='Concurrency handler for the client '
+                             '(default: %(default)s)',
+                        choices=['threading', 'gevent'], default='threading')
+    parser.add_argument('--use-rdkafka', action='store_true',
+                        help='Use the librdkafka-based implementation. '
+                             'Requires the correct --broker-version.')
+
+
 def _add_topic(parser):
     """Add topic to arg parser."""
     parser.add_argument('topic',
@@ -320,6 +785,10 @@ def _get_arg_parser():
                         dest='host',
                         help='host:port of any Kafka broker. '
                              '[default: localhost:9092]')
+    output.add_argument('--broker-version',
+                        default='0.9.0',
+                        help='Version of the Kafka brokers. '
+                             '[default: 0.9.0]')
 
     subparsers = output.add_subparsers(help='Commands', dest='command')
 
@@ -340,6 +809,81 @@ def _get_arg_parser():
     parser.set_defaults(func=desc_topic)
     _add_topic(parser)
 
+    # Export Consumer Lag
+    parser = subparsers.add_parser(
+        'lag_exporter',
+        help='Periodically write consumer lag for many groups and topics in '
+             'the Prometheus text format.'
+    )
+    parser.set_defaults(func=lag_exporter)
+    parser.add_argument('-t', '--track',
+                        metavar='GROUP:TOPIC[,TOPIC...]',
+                        action='append', required=True,
+                        type=_parse_group_topics,
+                        help='Consumer group and the topics to check for it. '
+                             'May be given several times.')
+    parser.add_argument('-i', '--interval',
+                        help='Seconds between lag checks '
+                             '(default: %(default)s)',
+                        type=float, default=10)
+    parser.add_argument('-o', '--outfile',
+                        help='File to replace with the latest lag on every '
+                             'check (defaults to appending to stdout)')
+    parser.add_argument('--once', action='store_true',
+                        help='Check lag once and exit.')
+
+    # Consumer Performance Test
+    parser = subparsers.add_parser(
+        'perf_consume',
+        help='Measure consumer throughput and latency.'
+    )
+    parser.set_defaults(func=perf_consume)
+    _add_topic(parser)
+    _add_perf_options(parser)
+    parser.add_argument('--timeout-ms',
+                        help='Stop when no message arrives for this long '
+                             '(default: %(default)s)',
+                        type=int, default=10 * 1000)
+    parser.add_argument('--fetch-message-max-bytes',
+                        help='(default: %(default)s)',
+                        type=int, default=1024 * 1024)
+    parser.add_argument('--num-consumer-fetchers',
+                        help='(default: %(default)s)',
+                        type=int, default=1)
+    parser.add_argument('--queued-max-messages',
+                        help='(default: %(default)s)',
+                        type=int, default=2000)
+
+    # Producer Performance Test
+    parser = subparsers.add_parser(
+        'perf_produce',
+        help='Measure producer throughput and latency.'
+    )
+    parser.set_defaults(func=perf_produce)
+    _add_topic(parser)
+    _add_perf_options(parser)
+    parser.add_argument('-s', '--record-size',
+                        help='Message size in bytes (default: %(default)s)',
+                        type=int, default=100)
+    parser.add_argument('--throughput',
+                        help='Maximum messages per second, -1 for no limit '
+                             '(default: %(default)s)',
+                        type=float, default=-1)
+    parser.add_argument('--required-acks',
+                        help='Acknowledgements required from the brokers '
+                             '(default: %(default)s)',
+                        type=int, default=1)
+    parser.add_argument('-c', '--compression',
+                        help='Compression codec (default: %(default)s)',
+                        choices=sorted(COMPRESSION_TYPES), default='none')
+    parser.add_argument('--linger-ms', type=int,
+                        help='Maximum time to wait for a batch to fill')
+    parser.add_argument('--min-queued-messages', type=int,
+                        help='Number of messages that fill a batch')
+    parser.add_argument('--max-queued-messages', type=int,
+                        help='Number of queued messages at which producing '
+                             'blocks')
+
     # Get consumer groups for a topic
     parser = subparsers.add_parser(
         'print_managed_consumer_groups',
@@ -373,6 +917,48 @@ def _get_arg_parser():
     )
     parser.set_defaults(func=print_topics)
 
+    # Produce from File
+    parser = subparsers.add_parser(
+        'produce_topic',
+        help='Produce records from a file or stdin to a topic.'
+    )
+    parser.set_defaults(func=produce_topic)
+    _add_topic(parser)
+    parser.add_argument('-i', '--infile',
+                        help='input file (defaults to stdin)',
+                        default='-')
+    parser.add_argument('--length-prefixed', action='store_true',
+                        help='Records are each prefixed by their length as '
+                             'a 4-byte big-endian integer instead of being '
+                             'separated by newlines.')
+    parser.add_argument('-k', '--key-separator',
+                        help='Split records on the first occurrence of this '
+                             'string into a partition key and the message.',
+                        type=_encode_utf8)
+    parser.add_argument('-c', '--compression',
+                        help='Compression codec (default: %(default)s)',
+                        choices=sorted(COMPRESSION_TYPES), default='none')
+    parser.add_argument('-p', '--partitioner',
+                        help='Partitioner (default: %(default)s)',
+                        choices=sorted(PARTITIONERS), default='random')
+    parser.add_argument('--required-acks',
+                        help='Acknowledgements required from the brokers '
+                             '(default: %(default)s)',
+                        type=int, default=1)
+    parser.add_argument('--linger-ms', type=int,
+                        help='Maximum time to wait for a batch to fill')
+    parser.add_argument('--min-queued-messages', type=int,
+                        help='Number of messages that fill a batch')
+    parser.add_argument('--max-queued-messages', type=int,
+                        help='Number of queued messages at which producing '
+                             'blocks')
+    parser.add_argument('--max-request-size', type=int,
+                        help='Maximum size of a produce request in bytes')
+    parser.add_argument('--report-interval',
+                        help='Seconds between throughput reports '
+                             '(default: %(default)s)',
+                        type=float, default=5)
+
     # Reset Offsets
     parser = subparsers.add_parser(
         'reset_offsets',
@@ -390,7 +976,10 @@ def main():
     parser = _get_arg_parser()
     args = parser.parse_args()
     if args.command:
-        client = pykafka.KafkaClient(hosts=args.host)
+        client = pykafka.KafkaClient(
+            hosts=args.host,
+            broker_version=args.broker_version,
+            use_greenlets=getattr(args, 'handler', None) == 'gevent')
         args.func(client, args)
     else:
         parser.print_help()
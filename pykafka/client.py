@@ -23,6 +23,10 @@ import logging
 
 from .cluster import Cluster
 from .handlers import ThreadingHandler
+from .managedbalancedconsumer import MultiTopicManagedBalancedConsumer
+from .producer import MultiTopicProducer
+from .simpleconsumer import MultiTopicSimpleConsumer
+from .utils.compat import iteritems
 try:
     from .handlers import GEventHandler
 except ImportError:
@@ -88,7 +92,8 @@ class KafkaClient(object):
                  exclude_internal_topics=True,
                  source_address='',
                  ssl_config=None,
-                 broker_version='0.9.0'):
+                 broker_version='0.9.0',
+                 request_hooks=None):
         """Create a connection to a Kafka cluster.
 
         Documentation for source_address can be found at
@@ -122,6 +127,10 @@ class KafkaClient(object):
             If this parameter doesn't match the actual broker version, some pykafka
             features may not work properly.
         :type broker_version: str
+        :param request_hooks: Listener notified as each request to a broker is
+            queued, sent, answered and decoded. See
+            :class:`pykafka.hooks.RequestHooks`
+        :type request_hooks: :class:`pykafka.hooks.RequestHooks`
         """
         self._seed_hosts = zookeeper_hosts if zookeeper_hosts is not None else hosts
         self._source_address = source_address
@@ -139,7 +148,8 @@ class KafkaClient(object):
             source_address=self._source_address,
             zookeeper_hosts=zookeeper_hosts,
             ssl_config=ssl_config,
-            broker_version=broker_version)
+            broker_version=broker_version,
+            request_hooks=request_hooks)
         self.brokers = self.cluster.brokers
         self.topics = self.cluster.topics
 
@@ -158,3 +168,52 @@ class KafkaClient(object):
         with current metadata from the cluster.
         """
         self.cluster.update()
+
+    def get_multi_producer(self, **kwargs):
+        """Create a :class:`pykafka.producer.MultiTopicProducer`
+
+        Its `produce()` takes the topic as its first argument, and messages
+        for all topics share the producer's per-broker queues and requests.
+        For a description of all available `kwargs`, see the Producer docstring.
+        """
+        return MultiTopicProducer(self.cluster, **kwargs)
+
+    def get_multi_simple_consumer(self, topics, consumer_group=None, **kwargs):
+        """Create a :class:`pykafka.simpleconsumer.MultiTopicSimpleConsumer`
+
+        For a description of all available `kwargs`, see the SimpleConsumer
+        docstring.
+
+        :param topics: The topics to consume, given as topics or topic names,
+            or a mapping from those to the partitions of each to consume
+            (`None` for all of them)
+        :type topics: Iterable of :class:`pykafka.topic.Topic` or bytes, or
+            dict {:class:`pykafka.topic.Topic` or bytes: Iterable of
+            :class:`pykafka.partition.Partition` or None}
+        :param consumer_group: The name of the consumer group to use for
+            offset committing and fetching
+        :type consumer_group: bytes
+        """
+        if not isinstance(topics, dict):
+            topics = {topic: None for topic in topics}
+        topics = {self.topics[topic] if isinstance(topic, bytes) else topic: partitions
+                  for topic, partitions in iteritems(topics)}
+        return MultiTopicSimpleConsumer(topics, self.cluster,
+                                        consumer_group=consumer_group, **kwargs)
+
+    def get_multi_balanced_consumer(self, topics, consumer_group, **kwargs):
+        """Create a :class:`pykafka.managedbalancedconsumer.MultiTopicManagedBalancedConsumer`
+
+        The consumer group is managed with Kafka's group membership api
+        (requires Kafka >=0.9). For a description of all available `kwargs`,
+        see the ManagedBalancedConsumer docstring.
+
+        :param topics: The topics to consume, given as topics or topic names
+        :type topics: Iterable of :class:`pykafka.topic.Topic` or bytes
+        :param consumer_group: The name of the consumer group to join
+        :type consumer_group: bytes
+        """
+        topics = [self.topics[topic] if isinstance(topic, bytes) else topic
+                  for topic in topics]
+        return MultiTopicManagedBalancedConsumer(topics, self.cluster,
+                                                 consumer_group, **kwargs)
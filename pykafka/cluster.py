@@ -23,6 +23,7 @@ import logging
 import random
 import time
 import weakref
+from collections import defaultdict
 
 from kazoo.client import KazooClient
 
@@ -33,7 +34,9 @@ from .exceptions import (ERROR_CODES,
                          SocketDisconnectedError,
                          LeaderNotFoundError,
                          LeaderNotAvailable)
-from .protocol import GroupCoordinatorRequest, GroupCoordinatorResponse
+from .protocol import (GroupCoordinatorRequest, GroupCoordinatorResponse,
+                       OffsetRequest, OffsetResponse, PartitionOffsetRequest,
+                       PartitionOffsetFetchRequest)
 from .topic import Topic
 from .utils.compat import iteritems, itervalues, range
 
@@ -159,7 +162,8 @@ class Cluster(object):
                  source_address='',
                  zookeeper_hosts=None,
                  ssl_config=None,
-                 broker_version='0.9.0'):
+                 broker_version='0.9.0',
+                 request_hooks=None):
         """Create a new Cluster instance.
 
         :param hosts: Comma-separated list of kafka hosts to which to connect.
@@ -187,6 +191,8 @@ class Cluster(object):
             If this parameter doesn't match the actual broker version, some pykafka
             features may not work properly.
         :type broker_version: str
+        :param request_hooks: Listener for the lifecycle of requests to brokers
+        :type request_hooks: :class:`pykafka.hooks.RequestHooks`
         """
         self._seed_hosts = zookeeper_hosts if zookeeper_hosts is not None else hosts
         self._socket_timeout_ms = socket_timeout_ms
@@ -202,6 +208,7 @@ class Cluster(object):
         self._max_connection_retries = 3
         self._max_connection_retries_offset_mgr = 8
         self._broker_version = broker_version
+        self._request_hooks = request_hooks
         if ':' in self._source_address:
             self._source_port = int(self._source_address.split(':')[1])
         self.update()
@@ -256,7 +263,8 @@ class Cluster(object):
                                     source_host=self._source_host,
                                     source_port=self._source_port,
                                     ssl_config=self._ssl_config,
-                                    broker_version=self._broker_version)
+                                    broker_version=self._broker_version,
+                                    request_hooks=self._request_hooks)
                     response = broker.request_metadata(topics)
                     if response is not None:
                         return response
@@ -366,7 +374,8 @@ class Cluster(object):
                     source_host=self._source_host,
                     source_port=self._source_port,
                     ssl_config=self._ssl_config,
-                    broker_version=self._broker_version)
+                    broker_version=self._broker_version,
+                    request_hooks=self._request_hooks)
             elif not self._brokers[id_].connected:
                 log.info('Reconnecting to broker id %s: %s:%s', id_, meta.host, meta.port)
                 try:
@@ -398,6 +407,83 @@ class Cluster(object):
             descriptions.update(res.groups)
         return descriptions
 
+    def _resolve_topics(self, topics):
+        """Look up the topics given by name in `topics`"""
+        return [self.topics[topic] if isinstance(topic, bytes) else topic
+                for topic in topics]
+
+    def fetch_offset_limits(self, topics, offsets_before, max_offsets=1):
+        """Get earliest or latest offsets for all partitions of several topics
+
+        Like :meth:`pykafka.topic.Topic.fetch_offset_limits`, but for many
+        topics at once: the partitions of all topics are batched into a single
+        OffsetRequest per leader broker, and the requests to all brokers are
+        in flight at the same time.
+
+        Errors are not raised, but reported in the `err` field of each
+        partition's response.
+
+        :param topics: The topics, or names of the topics, for which to fetch
+            offsets. Passing topics saves looking them up by name.
+        :type topics: Iterable of :class:`pykafka.topic.Topic` or bytes
+        :param offsets_before: Return an offset from before this timestamp (in
+            milliseconds)
+        :type offsets_before: int
+        :param max_offsets: The maximum number of offsets to return
+        :type max_offsets: int
+        :returns: {(topic name, partition id):
+            :class:`pykafka.protocol.OffsetPartitionResponse`}
+        """
+        requests = defaultdict(list)  # one request for each broker
+        for topic in self._resolve_topics(topics):
+            for part in itervalues(topic.partitions):
+                requests[part.leader].append(PartitionOffsetRequest(
+                    topic.name, part.id, offsets_before, max_offsets))
+        futures = []
+        for broker, reqs in iteritems(requests):
+            if broker.handler is None:
+                raise SocketDisconnectedError
+            log.debug("Fetching offset limits for %d partitions from broker %s",
+                      len(reqs), broker.id)
+            futures.append(broker.handler.request(OffsetRequest(reqs)))
+        output = {}
+        for future in futures:
+            res = future.get(OffsetResponse)
+            for topic_name, partitions in iteritems(res.topics):
+                for partition_id, pres in iteritems(partitions):
+                    output[(topic_name, partition_id)] = pres
+        return output
+
+    def fetch_group_offsets(self, consumer_group, topics):
+        """Get the offsets a consumer group committed for several topics
+
+        The offsets of all partitions of all topics are fetched from the
+        group's coordinator with a single OffsetFetchRequest, without
+        setting up a consumer.
+
+        Errors are not raised, but reported in the `err` field of each
+        partition's response. Partitions without a committed offset have an
+        offset of -1.
+
+        :param consumer_group: The name of the consumer group
+        :type consumer_group: bytes
+        :param topics: The topics, or names of the topics, for which to fetch
+            offsets. Passing topics saves looking them up by name.
+        :type topics: Iterable of :class:`pykafka.topic.Topic` or bytes
+        :returns: {(topic name, partition id):
+            :class:`pykafka.protocol.OffsetFetchPartitionResponse`}
+        """
+        reqs = [PartitionOffsetFetchRequest(topic.name, partition_id)
+                for topic in self._resolve_topics(topics)
+                for partition_id in topic.partitions]
+        if not reqs:
+            return {}
+        coordinator = self.get_group_coordinator(consumer_group)
+        res = coordinator.fetch_consumer_group_offsets(consumer_group, reqs)
+        return {(topic_name, partition_id): pres
+                for topic_name, partitions in iteritems(res.topics)
+                for partition_id, pres in iteritems(partitions)}
+
     def get_offset_manager(self, consumer_group):
         log.warning("WARNING: Cluster.get_offset_manager is deprecated since pykafka "
                     "2.3.0. Instead, use Cluster.get_group_coordinator.")
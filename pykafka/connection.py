@@ -191,7 +191,10 @@ class BrokerConnection(object):
         self.connect(10 * 1000)
 
     def request(self, request):
-        """Send a request over the socket connection"""
+        """Send a request over the socket connection
+
+        :returns: The number of bytes sent
+        """
         bytes_ = request.get_bytes()
         if not self._socket:
             raise SocketDisconnectedError("<broker {}:{}>".format(self.host, self.port))
@@ -201,6 +204,7 @@ class BrokerConnection(object):
             log.error("Failed to send data, error: %s" % repr(e))
             self.disconnect()
             raise SocketDisconnectedError("<broker {}:{}>".format(self.host, self.port))
+        return len(bytes_)
 
     def response(self):
         """Wait for a response from the broker"""
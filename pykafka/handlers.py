@@ -38,7 +38,8 @@ try:
 except ImportError:
     gevent = None
 
-from .utils.compat import Queue, Empty, Semaphore
+from .hooks import RequestEvent, call_hook
+from .utils.compat import Queue, Empty, Semaphore, monotonic
 
 log = logging.getLogger(__name__)
 
@@ -46,13 +47,19 @@ log = logging.getLogger(__name__)
 class ResponseFuture(object):
     """A response which may have a value at some point."""
 
-    def __init__(self, handler):
+    def __init__(self, handler, event=None, hooks=None):
         """
         :type handler: :class:`pykafka.handlers.Handler`
+        :param event: The lifecycle of this future's request, if instrumented
+        :type event: :class:`pykafka.hooks.RequestEvent`
+        :param hooks: Hooks to notify once the response is decoded
+        :type hooks: :class:`pykafka.hooks.RequestHooks`
         """
         self.handler = handler
         self.error = False
         self._ready = handler.Event()
+        self._event = event
+        self._hooks = hooks
 
     def set_response(self, response):
         """Set response data and trigger get method."""
@@ -72,10 +79,17 @@ class ResponseFuture(object):
         self._ready.wait(timeout)
         if self.error:
             raise self.error
-        if response_cls:
-            return response_cls(self.response)
-        else:
-            return self.response
+        if self._hooks is None:
+            return response_cls(self.response) if response_cls else self.response
+        try:
+            response = response_cls(self.response) if response_cls else self.response
+        except Exception as e:
+            self._event.error = e
+            call_hook(self._hooks.on_request_failed, self._event)
+            raise
+        self._event.decoded_at = monotonic()
+        call_hook(self._hooks.on_response_decoded, self._event)
+        return response
 
 
 class Handler(object):
@@ -144,21 +158,34 @@ if gevent:
 class RequestHandler(object):
     """Uses a Handler instance to dispatch requests."""
 
-    Task = namedtuple('Task', ['request', 'future'])
-    Shared = namedtuple('Shared', ['connection', 'requests', 'ending'])
+    Task = namedtuple('Task', ['request', 'future', 'event'])
+    Shared = namedtuple('Shared', ['connection', 'requests', 'ending', 'hooks',
+                                   'metrics'])
 
-    def __init__(self, handler, connection):
+    def __init__(self, handler, connection, hooks=None, broker_id=-1,
+                 metrics=None):
         """
         :type handler: :class:`pykafka.handlers.Handler`
         :type connection: :class:`pykafka.connection.BrokerConnection`
+        :param hooks: Listener for the lifecycle of each request
+        :type hooks: :class:`pykafka.hooks.RequestHooks`
+        :param broker_id: The id of the broker `connection` leads to, as
+            reported to `hooks`
+        :type broker_id: int
+        :param metrics: Registry in which to count requests, bytes and
+            response latencies
+        :type metrics: :class:`pykafka.metrics.MetricsRegistry`
         """
         self.handler = handler
+        self._broker_id = broker_id
 
         # NB self.shared is referenced directly by _start_thread(), so be careful not to
         # rebind it
         self.shared = self.Shared(connection=connection,
                                   requests=handler.Queue(),
-                                  ending=handler.Event())
+                                  ending=handler.Event(),
+                                  hooks=hooks,
+                                  metrics=metrics)
 
     def __del__(self):
         self.stop()
@@ -170,11 +197,16 @@ class RequestHandler(object):
         :param has_response: Whether this request will return a response
         :returns: :class:`pykafka.handlers.ResponseFuture`
         """
+        hooks = self.shared.hooks
+        event = None
+        if hooks is not None:
+            event = RequestEvent(request.API_KEY, self._broker_id, monotonic())
+            call_hook(hooks.on_request_enqueued, event)
         future = None
         if has_response:
-            future = ResponseFuture(self.handler)
+            future = ResponseFuture(self.handler, event, hooks)
 
-        task = self.Task(request, future)
+        task = self.Task(request, future, event)
         self.shared.requests.put(task)
         return future
 
@@ -197,6 +229,12 @@ class RequestHandler(object):
         # previous version of this used a weakref to `self`, but would
         # potentially abort the thread before the requests queue was empty
         shared = self.shared
+        if shared.metrics is not None:
+            requests_sent = shared.metrics.counter("requests_sent")
+            requests_failed = shared.metrics.counter("requests_failed")
+            bytes_sent = shared.metrics.counter("bytes_sent")
+            bytes_received = shared.metrics.counter("bytes_received")
+            response_latency = shared.metrics.histogram("response_latency_us")
 
         def worker():
             try:
@@ -206,12 +244,34 @@ class RequestHandler(object):
                         task = shared.requests.get(timeout=1)
                     except Empty:
                         continue
+                    event = task.event
                     try:
-                        shared.connection.request(task.request)
+                        size = shared.connection.request(task.request)
+                        sent_at = monotonic()
+                        if shared.metrics is not None:
+                            requests_sent.inc()
+                            bytes_sent.inc(size)
+                        if event is not None:
+                            event.request_size = size
+                            event.sent_at = sent_at
+                            call_hook(shared.hooks.on_request_sent, event)
                         if task.future:
                             res = shared.connection.response()
+                            if shared.metrics is not None:
+                                bytes_received.inc(len(res))
+                                response_latency.record(
+                                    (monotonic() - sent_at) * 1000000)
+                            if event is not None:
+                                event.response_size = len(res)
+                                event.received_at = monotonic()
+                                call_hook(shared.hooks.on_response_received, event)
                             task.future.set_response(res)
                     except Exception as e:
+                        if shared.metrics is not None:
+                            requests_failed.inc()
+                        if event is not None:
+                            event.error = e
+                            call_hook(shared.hooks.on_request_failed, event)
                         if task.future:
                             task.future.set_error(e)
                     finally:
@@ -0,0 +1,111 @@
+"""
+Author: Emmett Butler, Keith Bourgoin
+"""
+__license__ = """
+Copyright 2015 Parse.ly, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+__all__ = ["RequestHooks", "RequestEvent"]
+import logging
+
+log = logging.getLogger(__name__)
+
+
+class RequestEvent(object):
+    """The lifecycle of a single request to a broker
+
+    One instance is created per request and passed to every
+    :class:`pykafka.hooks.RequestHooks` method, filling in as the request
+    progresses. Timestamps are in seconds, taken from a monotonic clock
+    (`time.monotonic` where available), and are `None` for stages that have
+    not been reached yet.
+
+    :ivar api_key: The Kafka API key of the request
+    :ivar broker_id: The id of the broker the request is sent to. -1 for the
+        bootstrap brokers used to fetch the initial metadata
+    :ivar request_size: The size in bytes of the request, once sent
+    :ivar response_size: The size in bytes of the response, once received
+    :ivar enqueued_at: When the request was put on the `RequestHandler` queue
+    :ivar sent_at: When the request was written to the socket
+    :ivar received_at: When the response was read from the socket
+    :ivar decoded_at: When the response was decoded by `ResponseFuture.get`
+    :ivar error: The exception that failed the request, if any
+    """
+    __slots__ = ['api_key', 'broker_id', 'request_size', 'response_size',
+                 'enqueued_at', 'sent_at', 'received_at', 'decoded_at', 'error']
+
+    def __init__(self, api_key, broker_id, enqueued_at):
+        self.api_key = api_key
+        self.broker_id = broker_id
+        self.request_size = None
+        self.response_size = None
+        self.enqueued_at = enqueued_at
+        self.sent_at = None
+        self.received_at = None
+        self.decoded_at = None
+        self.error = None
+
+    def __repr__(self):
+        return "<{module}.{name} at {id_} (api_key={api_key}, broker_id={broker_id})>".format(
+            module=self.__class__.__module__,
+            name=self.__class__.__name__,
+            id_=hex(id(self)),
+            api_key=self.api_key,
+            broker_id=self.broker_id
+        )
+
+
+class RequestHooks(object):
+    """Listener for the lifecycle of requests sent to brokers
+
+    Subclass this, override the methods of interest and pass an instance as
+    `request_hooks` to :class:`pykafka.client.KafkaClient`. Each method
+    receives the :class:`pykafka.hooks.RequestEvent` of the request.
+
+    Hooks are called synchronously, either from the thread issuing the request
+    or from the broker connection's worker, so they should return quickly.
+    Exceptions raised by hooks are logged and otherwise ignored. When no hooks
+    are given, requests are not instrumented at all.
+    """
+    def on_request_enqueued(self, event):
+        """Called when a request is queued for sending to a broker"""
+        pass
+
+    def on_request_sent(self, event):
+        """Called when a request has been written to the socket"""
+        pass
+
+    def on_response_received(self, event):
+        """Called when a response has been read from the socket"""
+        pass
+
+    def on_response_decoded(self, event):
+        """Called when a response has been returned from `ResponseFuture.get`"""
+        pass
+
+    def on_request_failed(self, event):
+        """Called instead of the remaining hooks when a request fails"""
+        pass
+
+
+def call_hook(hook, event):
+    """Call a hook method, logging rather than raising its exceptions
+
+    :param hook: A bound method of a :class:`pykafka.hooks.RequestHooks`
+    :type event: :class:`pykafka.hooks.RequestEvent`
+    """
+    try:
+        hook(event)
+    except Exception:
+        log.exception("Exception in request hook %s", hook)
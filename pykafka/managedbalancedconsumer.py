@@ -17,18 +17,22 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-__all__ = ["ManagedBalancedConsumer"]
+__all__ = ["ManagedBalancedConsumer", "MultiTopicManagedBalancedConsumer"]
 import logging
+import struct
 import sys
 import uuid
 import weakref
+from collections import defaultdict
 
+from .assignors import range_assignor
 from .balancedconsumer import BalancedConsumer
 from .common import OffsetType
 from .exceptions import (IllegalGeneration, RebalanceInProgress, NotCoordinatorForGroup,
                          GroupCoordinatorNotAvailable, ERROR_CODES, GroupLoadInProgress)
 from .protocol import MemberAssignment
-from .utils.compat import iterkeys
+from .simpleconsumer import MultiTopicSimpleConsumer
+from .utils.compat import iterkeys, iteritems, itervalues
 from .utils.error_handlers import valid_int
 
 log = logging.getLogger(__name__)
@@ -70,7 +74,8 @@ class ManagedBalancedConsumer(BalancedConsumer):
                  post_rebalance_callback=None,
                  use_rdkafka=False,
                  compacted_topic=True,
-                 heartbeat_interval_ms=3000):
+                 heartbeat_interval_ms=3000,
+                 assignor=range_assignor):
         """Create a ManagedBalancedConsumer instance
 
         :param topic: The topic this consumer should consume
@@ -160,6 +165,11 @@ class ManagedBalancedConsumer(BalancedConsumer):
         :param heartbeat_interval_ms: The amount of time in milliseconds to wait between
             heartbeat requests
         :type heartbeat_interval_ms: int
+        :param assignor: The strategy the group leader uses to divide partitions
+            among the members of the consumer group. It is announced to the
+            group coordinator by its `name`, which must be the same for all
+            members.
+        :type assignor: :class:`pykafka.assignors.BaseAssignor`
         """
 
         self._cluster = cluster
@@ -187,6 +197,7 @@ class ManagedBalancedConsumer(BalancedConsumer):
         self._post_rebalance_callback = post_rebalance_callback
         self._is_compacted_topic = compacted_topic
         self._heartbeat_interval_ms = valid_int(heartbeat_interval_ms)
+        self._assignor = assignor
         if use_rdkafka is True:
             raise ImportError("use_rdkafka is not available for {}".format(
                 self.__class__.__name__))
@@ -196,6 +207,7 @@ class ManagedBalancedConsumer(BalancedConsumer):
         self._rebalancing_lock = cluster.handler.Lock()
         self._rebalancing_in_progress = self._cluster.handler.Event()
         self._internal_consumer_running = self._cluster.handler.Event()
+        self._rebalance_stats = self._build_rebalance_stats()
         # ManagedBalancedConsumers in the same process cannot share connections.
         # This connection hash is passed to Broker calls that use the group
         # membership  API
@@ -228,6 +240,7 @@ class ManagedBalancedConsumer(BalancedConsumer):
                         log.info("Error code %d encountered on heartbeat.",
                                  res.error_code)
                         self._handle_error(res.error_code)
+                        self._rebalance_stats["requested"] += 1
                         self._rebalance()
 
                     self._cluster.handler.sleep(self._heartbeat_interval_ms / 1000)
@@ -281,19 +294,20 @@ class ManagedBalancedConsumer(BalancedConsumer):
         for i in range(self._rebalance_max_retries):
             try:
                 members = self._join_group()
-                # generate partition assignments for each group member
+                # generate partition assignments for all group members at once
                 # if this is not the leader, join_result.members will be empty
-                group_assignments = [
-                    (member_id,
-                     MemberAssignment([
-                        (self._topic.name,
-                         [p.id for p in self._decide_partitions(
-                          iterkeys(members), consumer_id=member_id)])])
-                    ) for member_id in members]
+                group_assignments = []
+                if members:
+                    self._check_subscriptions(members)
+                    assignment = self._decide_assignment(
+                        iterkeys(members), self._get_previous_assignment(members))
+                    group_assignments = [
+                        (member_id, self._build_member_assignment(partitions))
+                        for member_id, partitions in iteritems(assignment)]
 
                 assignment = self._sync_group(group_assignments)
                 self._setup_internal_consumer(
-                    partitions=[self._topic.partitions[pid] for pid in assignment[0][1]])
+                    partitions=self._get_assigned_partitions(assignment))
                 log.debug("Successfully rebalanced consumer '%s'", self._consumer_id)
                 break
             except Exception as ex:
@@ -305,6 +319,73 @@ class ManagedBalancedConsumer(BalancedConsumer):
                 self._cluster.handler.sleep(i * (self._rebalance_backoff_ms / 1000))
         self._raise_worker_exceptions()
 
+    def _build_member_assignment(self, partitions):
+        """Encode `partitions` as a MemberAssignment, grouped by topic"""
+        partition_ids = defaultdict(list)
+        for p in partitions:
+            partition_ids[p.topic.name].append(p.id)
+        return MemberAssignment([(topic_name, sorted(partition_ids[topic_name]))
+                                 for topic_name in sorted(partition_ids)])
+
+    def _get_assigned_partitions(self, partition_assignment):
+        """Resolve a partition assignment received from the group coordinator
+
+        :param partition_assignment: The assignment, as returned by `_sync_group()`
+        :type partition_assignment: Iterable of (bytes, Iterable of int) tuples
+        """
+        topics = self._subscribed_topics
+        partitions = []
+        for topic_name, partition_ids in partition_assignment:
+            if topic_name not in topics:
+                log.warning("Ignoring partitions of topic '%s' that this consumer "
+                            "is not subscribed to", topic_name)
+                continue
+            partitions.extend(topics[topic_name].partitions[partition_id]
+                              for partition_id in partition_ids)
+        return partitions
+
+    def _check_subscriptions(self, members):
+        """Warn about members whose subscriptions differ from the leader's
+
+        The leader divides the partitions of its own topics among all members,
+        so every member of a group must subscribe to the same topics.
+
+        :param members: The group members, as returned by `_join_group()`
+        :type members: dict {bytes:
+            :class:`pykafka.protocol.ConsumerGroupProtocolMetadata`}
+        """
+        topic_names = set(self._subscribed_topics)
+        for member_id, metadata in iteritems(members):
+            if set(metadata.topic_names) != topic_names:
+                log.warning("Member '%s' subscribes to topics %s, but the group "
+                            "leader to %s", member_id, sorted(metadata.topic_names),
+                            sorted(topic_names))
+
+    def _get_previous_assignment(self, members):
+        """Read the partitions each member held from its join metadata
+
+        :param members: The group members, as returned by `_join_group()`
+        :type members: dict {bytes:
+            :class:`pykafka.protocol.ConsumerGroupProtocolMetadata`}
+        """
+        topics = self._subscribed_topics
+        previous_assignment = {}
+        for member_id, metadata in iteritems(members):
+            try:
+                held = MemberAssignment.from_bytestring(
+                    metadata.user_data or b"").partition_assignment
+            except struct.error:
+                log.warning("Ignoring unreadable assignment of member '%s'",
+                            member_id)
+                continue
+            previous_assignment[member_id] = [
+                topics[topic_name].partitions[partition_id]
+                for topic_name, partition_ids in held
+                if topic_name in topics
+                for partition_id in partition_ids
+                if partition_id in topics[topic_name].partitions]
+        return previous_assignment
+
     def _build_default_error_handlers(self):
         """Set up default responses to common error codes"""
         self = weakref.proxy(self)
@@ -342,11 +423,13 @@ class ManagedBalancedConsumer(BalancedConsumer):
         Assigns a member id and tells the coordinator about this consumer.
         """
         log.info("Sending JoinGroupRequest for consumer id '%s'", self._consumer_id)
+        # tell the group leader what we hold, for sticky assignment
+        held_partitions = self._build_member_assignment(self._partitions)
         for i in range(self._cluster._max_connection_retries):
-            join_result = self._group_coordinator.join_group(self._connection_id,
-                                                             self._consumer_group,
-                                                             self._consumer_id,
-                                                             self._topic.name)
+            join_result = self._group_coordinator.join_group(
+                self._connection_id, self._consumer_group, self._consumer_id,
+                sorted(self._subscribed_topics), protocol_name=self._assignor.name,
+                user_data=bytes(held_partitions.get_bytes()))
             if join_result.error_code == 0:
                 break
             log.info("Error code %d encountered during JoinGroupRequest for"
@@ -385,3 +468,52 @@ class ManagedBalancedConsumer(BalancedConsumer):
             self._handle_error(sync_result.error_code)
             self._cluster.handler.sleep(i * 2)
         return sync_result.member_assignment.partition_assignment
+
+
+class MultiTopicManagedBalancedConsumer(ManagedBalancedConsumer):
+    """A managed balanced consumer for several topics at once
+
+    Joins the consumer group once for all topics: the subscription to every
+    topic is announced in a single JoinGroupRequest, the group leader divides
+    the partitions of all topics among the members in one SyncGroupRequest,
+    and a single heartbeat keeps the membership alive. Partitions are
+    consumed through a :class:`pykafka.simpleconsumer.MultiTopicSimpleConsumer`,
+    so `partitions`, `held_offsets` and the dicts passed to
+    `post_rebalance_callback` are keyed by `(topic name, partition id)`
+    tuples.
+
+    All members of the consumer group must subscribe to the same topics.
+    """
+    def __init__(self, topics, cluster, consumer_group, **kwargs):
+        """Create a MultiTopicManagedBalancedConsumer instance
+
+        Accepts all keyword arguments of :class:`ManagedBalancedConsumer`.
+
+        :param topics: The topics this consumer should consume
+        :type topics: Iterable of :class:`pykafka.topic.Topic`
+        :param cluster: The cluster to which this consumer should connect
+        :type cluster: :class:`pykafka.cluster.Cluster`
+        :param consumer_group: The name of the consumer group this consumer
+            should join.
+        :type consumer_group: bytes
+        """
+        self._topics = {topic.name: topic for topic in topics}
+        if not self._topics:
+            raise ValueError("At least one topic is required")
+        super(MultiTopicManagedBalancedConsumer, self).__init__(
+            None, cluster, consumer_group, **kwargs)
+
+    @property
+    def topics(self):
+        """A dict mapping the names of the consumed topics to the topics"""
+        return dict(self._topics)
+
+    @property
+    def _subscribed_topics(self):
+        return self._topics
+
+    def _new_internal_consumer(self, partitions, **kwargs):
+        topics = {topic: [] for topic in itervalues(self._topics)}
+        for p in partitions:
+            topics[self._topics[p.topic.name]].append(p)
+        return MultiTopicSimpleConsumer(topics, self._cluster, **kwargs)
@@ -0,0 +1,193 @@
+"""
+Author: Emmett Butler, Keith Bourgoin
+"""
+__license__ = """
+Copyright 2015 Parse.ly, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+__all__ = ["MetricsRegistry", "Counter", "Gauge", "Histogram"]
+from collections import defaultdict
+import math
+import threading
+
+from .utils.compat import iteritems
+
+
+class Counter(object):
+    """A monotonically increasing count"""
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        """Increase the count
+
+        :param amount: How much to increase the count by
+        :type amount: int
+        """
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        return self._value
+
+    def snapshot(self):
+        return self._value
+
+
+class Gauge(object):
+    """A value that can go up and down
+
+    If created with a function, the value is obtained by calling it whenever
+    the gauge is read, so nothing needs updating on any hot path.
+    """
+    def __init__(self, fn=None):
+        """
+        :param fn: Function called without arguments to read the value
+        :type fn: callable
+        """
+        self._fn = fn
+        self._value = None
+
+    def set(self, value):
+        self._value = value
+
+    @property
+    def value(self):
+        return self._fn() if self._fn is not None else self._value
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram(object):
+    """The distribution of non-negative integer values, such as latencies
+
+    Like HdrHistogram, values are counted in buckets whose width grows with
+    their magnitude: each power of two is split into `2 ** (significant_bits
+    - 1)` equal buckets, so percentiles are reported within a relative error
+    of `2 ** (1 - significant_bits)` while memory stays bounded by the range
+    of the values rather than their number.
+    """
+    PERCENTILES = [('p50', 50), ('p90', 90), ('p99', 99), ('p999', 99.9)]
+
+    def __init__(self, significant_bits=7):
+        """
+        :param significant_bits: Number of leading bits of each value kept
+        :type significant_bits: int
+        """
+        self._significant_bits = significant_bits
+        self._counts = defaultdict(int)
+        self._lock = threading.Lock()
+        self._count = 0
+        self._sum = 0
+        self._min = None
+        self._max = None
+
+    def _bucket_width(self, value):
+        return 1 << max(0, value.bit_length() - self._significant_bits)
+
+    def record(self, value):
+        """Count a value, rounding it down to an integer
+
+        :param value: The value to count. Negative values are counted as 0
+        :type value: int
+        """
+        value = max(0, int(value))
+        bucket = value - value % self._bucket_width(value)
+        with self._lock:
+            self._counts[bucket] += 1
+            self._count += 1
+            self._sum += value
+            if self._min is None or value < self._min:
+                self._min = value
+            if self._max is None or value > self._max:
+                self._max = value
+
+    def snapshot(self):
+        """Summarise the values counted so far
+
+        :returns: dict of `count`, `min`, `max`, `mean` and the percentiles
+            `p50`, `p90`, `p99` and `p999`, which are `None` while empty
+        """
+        with self._lock:
+            counts = sorted(iteritems(self._counts))
+            count, sum_, min_, max_ = self._count, self._sum, self._min, self._max
+        stats = {'count': count, 'min': min_, 'max': max_,
+                 'mean': sum_ / float(count) if count else None}
+        buckets = iter(counts)
+        seen = 0
+        bucket = None
+        for name, percentile in self.PERCENTILES:
+            if not count:
+                stats[name] = None
+                continue
+            rank = max(1, int(math.ceil(percentile / 100.0 * count)))
+            while seen < rank:
+                bucket, bucket_count = next(buckets)
+                seen += bucket_count
+            # report the middle of the bucket, but never beyond what was seen
+            middle = bucket + (self._bucket_width(bucket) - 1) // 2
+            stats[name] = min(max(middle, min_), max_)
+        return stats
+
+
+class MetricsRegistry(object):
+    """A named collection of metrics
+
+    Metrics are created on first use and live as long as the registry. Each
+    metric does its own locking, so metrics updated from different threads
+    don't contend, and reading them never blocks writers for long.
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name, factory, cls):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = self._metrics[name] = factory()
+        if not isinstance(metric, cls):
+            raise TypeError("Metric {} is a {}, not a {}".format(
+                name, metric.__class__.__name__, cls.__name__))
+        return metric
+
+    def counter(self, name):
+        """Get the :class:`pykafka.metrics.Counter` called `name`"""
+        return self._get_or_create(name, Counter, Counter)
+
+    def gauge(self, name, fn=None):
+        """Get the :class:`pykafka.metrics.Gauge` called `name`
+
+        :param fn: Function to read the gauge with, if it is created here
+        :type fn: callable
+        """
+        return self._get_or_create(name, lambda: Gauge(fn), Gauge)
+
+    def histogram(self, name):
+        """Get the :class:`pykafka.metrics.Histogram` called `name`"""
+        return self._get_or_create(name, Histogram, Histogram)
+
+    def stats(self):
+        """Take a snapshot of all metrics
+
+        :returns: dict of metric name to its value. Histograms are represented
+            as returned from :meth:`pykafka.metrics.Histogram.snapshot`
+        """
+        return {name: metric.snapshot()
+                for name, metric in iteritems(dict(self._metrics))}
@@ -1,3 +1,4 @@
+from __future__ import division
 """
 Author: Keith Bourgoin, Emmett Butler
 """
@@ -17,11 +18,21 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 __all__ = ["random_partitioner", "BasePartitioner", "HashingPartitioner",
-           "hashing_partitioner", "GroupHashingPartitioner"]
+           "hashing_partitioner", "GroupHashingPartitioner", "StickyPartitioner",
+           "Murmur2Partitioner", "murmur2_partitioner", "murmur2",
+           "LatencyAwarePartitioner"]
+import bisect
 import random
+import struct
 
 from hashlib import sha1
 
+# Partitioners are shared by all topics of a MultiTopicProducer, so results
+# derived from a list of partitions are cached per list. The caches hold on
+# to the lists, which keeps their ids unique, and are emptied when they grow
+# past this size (lists are only replaced on metadata updates).
+_MAX_CACHED_LISTS = 64
+
 
 def random_partitioner(partitions, key):
     """Returns a random partition out of all of the available partitions."""
@@ -38,6 +49,55 @@ class BasePartitioner(object):
         raise NotImplementedError('Subclasses must define their own '
                                   ' partitioner implementation')
 
+    def on_batch_closed(self, partitions):
+        """Called by the producer when a batch is taken off a broker queue
+
+        Partitioners that route based on batching state can override this. It
+        is invoked from producer worker threads. A batch taken from the queue
+        of a :class:`pykafka.producer.MultiTopicProducer` may hold partitions
+        of several topics.
+
+        :param partitions: The partitions contained in the batch
+        :type partitions: set of :class:`pykafka.base.BasePartition`
+        """
+        pass
+
+    def on_request_completed(self, broker_id, latency_ms, queued_messages):
+        """Called by the producer after each produce request to a broker
+
+        Partitioners that route based on broker health can override this. It
+        is invoked from producer worker threads.
+
+        :param broker_id: The id of the broker the request was sent to
+        :type broker_id: int
+        :param latency_ms: How long (in milliseconds) sending the request and
+            handling its response took
+        :type latency_ms: float
+        :param queued_messages: The number of messages still pending for the
+            broker once the request completed
+        :type queued_messages: int
+        """
+        pass
+
+    def _sorted(self, partitions):
+        """Return `partitions` sorted by id, reusing earlier results if possible
+
+        The producer passes the same list object until the topic's metadata is
+        updated (see :attr:`pykafka.topic.Topic.sorted_partitions`), so sorting
+        is only done once per topic and update instead of once per message.
+        """
+        cache = getattr(self, '_sorted_cache', None)
+        if cache is None:
+            cache = self._sorted_cache = {}
+        cached = cache.get(id(partitions))
+        if cached is not None:
+            return cached[1]
+        sorted_partitions = sorted(partitions)  # sorting is VERY important
+        if len(cache) >= _MAX_CACHED_LISTS:
+            cache.clear()
+        cache[id(partitions)] = (partitions, sorted_partitions)
+        return sorted_partitions
+
 
 class HashingPartitioner(BasePartitioner):
     """
@@ -78,7 +138,7 @@ class HashingPartitioner(BasePartitioner):
             raise ValueError(
                 'key cannot be `None` when using hashing partitioner'
             )
-        partitions = sorted(partitions)  # sorting is VERY important
+        partitions = self._sorted(partitions)
         return partitions[abs(self.hash_func(key)) % len(partitions)]
 
 
@@ -131,5 +191,257 @@ class GroupHashingPartitioner(BasePartitioner):
             raise ValueError(
                 'group_size cannot be > available partitions'
             )
-        partitions = sorted(partitions)
+        partitions = self._sorted(partitions)
         return partitions[abs(self.hash_func(key) + random.randrange(0, self.group_size)) % len(partitions)]
+
+
+def murmur2(data):
+    """Compute the 32-bit murmur2 hash of `data` as the Java client does
+
+    This is a port of `org.apache.kafka.common.utils.Utils.murmur2`, and like
+    it returns a signed 32-bit integer.
+
+    :param data: The bytes to hash
+    :type data: bytes
+    """
+    length = len(data)
+    seed = 0x9747b28c
+    m = 0x5bd1e995
+    r = 24
+
+    h = (seed ^ length) & 0xffffffff
+    length4 = length // 4
+    for k in struct.unpack_from('<%dI' % length4, data):
+        k = (k * m) & 0xffffffff
+        k ^= k >> r
+        k = (k * m) & 0xffffffff
+        h = (h * m) & 0xffffffff
+        h ^= k
+
+    extra = length & 3
+    if extra:
+        tail = bytearray(data[length4 * 4:])
+        if extra >= 3:
+            h ^= tail[2] << 16
+        if extra >= 2:
+            h ^= tail[1] << 8
+        h ^= tail[0]
+        h = (h * m) & 0xffffffff
+
+    h ^= h >> 13
+    h = (h * m) & 0xffffffff
+    h ^= h >> 15
+    if h & 0x80000000:
+        return h - 0x100000000
+    return h
+
+
+class Murmur2Partitioner(BasePartitioner):
+    """
+    Returns a partition based on the murmur2 hash of the key, the same way as
+    the default partitioner of the Java client does for keyed messages.
+
+    Producers using this partitioner send messages with a given key to the same
+    partition as JVM producers do, as long as both see the same number of
+    partitions. The same caveats as for
+    :class:`pykafka.partitioners.HashingPartitioner` apply when the number of
+    partitions changes.
+    """
+    def __call__(self, partitions, key):
+        """
+        :param partitions: The partitions from which to choose
+        :type partitions: sequence of :class:`pykafka.base.BasePartition`
+        :param key: Key used for routing
+        :type key: bytes
+        :returns: A partition
+        :rtype: :class:`pykafka.base.BasePartition`
+        """
+        if key is None:
+            raise ValueError(
+                'key cannot be `None` when using murmur2 partitioner'
+            )
+        partitions = self._sorted(partitions)
+        return partitions[(murmur2(key) & 0x7fffffff) % len(partitions)]
+
+
+murmur2_partitioner = Murmur2Partitioner()
+
+
+class StickyPartitioner(BasePartitioner):
+    """
+    Sends keyless messages to a single partition until the batch holding them
+    is closed by the producer (because `min_queued_messages`,
+    `max_request_size` or `linger_ms` was reached), then switches to another
+    randomly chosen partition.
+
+    Concentrating keyless messages this way yields fewer, larger MessageSets
+    per request, which compresses better and is cheaper for the broker to
+    append than one small MessageSet per partition. Messages with a key are
+    routed by `key_partitioner`.
+
+    The sticky partition is tracked per topic, so one instance can be shared
+    by the topics of a :class:`pykafka.producer.MultiTopicProducer`.
+    """
+    def __init__(self, key_partitioner=None):
+        """
+        :param key_partitioner: The partitioner used for messages that have a
+            partition key (defaults to :data:`hashing_partitioner`)
+        :type key_partitioner: :class:`pykafka.partitioners.BasePartitioner`
+        """
+        self.key_partitioner = key_partitioner
+        if self.key_partitioner is None:
+            self.key_partitioner = hashing_partitioner
+        # topic name -> partition id
+        self._sticky_ids = {}
+        self._closed_ids = {}
+
+    def __call__(self, partitions, key=None):
+        """
+        :param partitions: The partitions from which to choose
+        :type partitions: sequence of :class:`pykafka.base.BasePartition`
+        :param key: Key used for routing, may be `None`
+        :type key: bytes
+        :returns: A partition
+        :rtype: :class:`pykafka.base.BasePartition`
+        """
+        if key is not None:
+            return self.key_partitioner(partitions, key)
+        topic_name = partitions[0].topic.name
+        sticky_id = self._sticky_ids.get(topic_name)
+        if sticky_id is not None:
+            for partition in partitions:
+                if partition.id == sticky_id:
+                    return partition
+        partition = random.choice(partitions)
+        # avoid landing on the partition whose batch just closed
+        closed_id = self._closed_ids.get(topic_name)
+        if partition.id == closed_id and len(partitions) > 1:
+            partition = random.choice(
+                [p for p in partitions if p.id != closed_id])
+        self._sticky_ids[topic_name] = partition.id
+        return partition
+
+    def on_batch_closed(self, partitions):
+        """Switch away from the sticky partitions whose batches have closed
+
+        :param partitions: The partitions contained in the batch
+        :type partitions: set of :class:`pykafka.base.BasePartition`
+        """
+        for partition in partitions:
+            topic_name = partition.topic.name
+            if self._sticky_ids.get(topic_name) == partition.id:
+                self._closed_ids[topic_name] = partition.id
+                self._sticky_ids.pop(topic_name, None)
+
+
+class LatencyAwarePartitioner(BasePartitioner):
+    """
+    Spreads keyless messages over partitions in inverse proportion to the
+    recent ack latency and queue depth of each partition's leader.
+
+    The producer reports both figures after every produce request (see
+    :meth:`BasePartitioner.on_request_completed`). Latency is smoothed with an
+    exponentially weighted moving average. A broker that falls behind thus
+    receives a shrinking part of the traffic instead of filling its queue
+    until `produce()` blocks, while `min_share` guarantees that every
+    partition keeps receiving messages. Brokers without reports yet are
+    treated like the fastest known broker.
+
+    Messages with a key are routed by `key_partitioner`.
+    """
+    def __init__(self, min_share=0.2, smoothing=0.3, key_partitioner=None):
+        """
+        :param min_share: The fraction of keyless traffic that is spread
+            evenly over all partitions regardless of broker health. Each
+            partition is guaranteed at least `min_share / len(partitions)`
+            of the messages.
+        :type min_share: float between 0 and 1
+        :param smoothing: The weight given to the newest latency sample in the
+            moving average. Higher values react faster to changes.
+        :type smoothing: float between 0 (exclusive) and 1
+        :param key_partitioner: The partitioner used for messages that have a
+            partition key (defaults to :data:`hashing_partitioner`)
+        :type key_partitioner: :class:`pykafka.partitioners.BasePartitioner`
+        """
+        if not 0 <= min_share <= 1:
+            raise ValueError('min_share must be between 0 and 1')
+        if not 0 < smoothing <= 1:
+            raise ValueError('smoothing must be in the range (0, 1]')
+        self.min_share = min_share
+        self.smoothing = smoothing
+        self.key_partitioner = key_partitioner
+        if self.key_partitioner is None:
+            self.key_partitioner = hashing_partitioner
+        self._latencies = {}  # broker id -> smoothed latency in ms
+        self._queued = {}  # broker id -> pending messages
+        self._stats_version = 0
+        # id(partitions) -> (partitions, stats version, cumulative weights)
+        self._weights_cache = {}
+
+    def __call__(self, partitions, key=None):
+        """
+        :param partitions: The partitions from which to choose
+        :type partitions: sequence of :class:`pykafka.base.BasePartition`
+        :param key: Key used for routing, may be `None`
+        :type key: bytes
+        :returns: A partition
+        :rtype: :class:`pykafka.base.BasePartition`
+        """
+        if key is not None:
+            return self.key_partitioner(partitions, key)
+        cached = self._weights_cache.get(id(partitions))
+        if cached is None or cached[1] != self._stats_version:
+            cached = (partitions, self._stats_version,
+                      self._cumulative_weights(partitions))
+            if len(self._weights_cache) >= _MAX_CACHED_LISTS:
+                self._weights_cache.clear()
+            self._weights_cache[id(partitions)] = cached
+        cumulative = cached[2]
+        idx = bisect.bisect_right(cumulative, random.random() * cumulative[-1])
+        return partitions[min(idx, len(partitions) - 1)]
+
+    def on_request_completed(self, broker_id, latency_ms, queued_messages):
+        """Record the latency and queue depth reported for a broker
+
+        :param broker_id: The id of the broker the request was sent to
+        :type broker_id: int
+        :param latency_ms: How long (in milliseconds) sending the request and
+            handling its response took
+        :type latency_ms: float
+        :param queued_messages: The number of messages still pending for the
+            broker once the request completed
+        :type queued_messages: int
+        """
+        previous = self._latencies.get(broker_id)
+        if previous is None:
+            self._latencies[broker_id] = latency_ms
+        else:
+            self._latencies[broker_id] = (self.smoothing * latency_ms +
+                                          (1 - self.smoothing) * previous)
+        self._queued[broker_id] = queued_messages
+        self._stats_version += 1
+
+    def _cumulative_weights(self, partitions):
+        """Compute the cumulative selection weights for `partitions`"""
+        latencies = dict(self._latencies)
+        queued = dict(self._queued)
+        # floor latencies at 1ms so a single very fast sample doesn't
+        # starve every other broker
+        default_latency = max(1.0, min(latencies.values())) if latencies else 1.0
+        # queue depth counts relative to the shortest known queue
+        min_queued = min(queued.values()) if queued else 0
+        costs = []
+        for partition in partitions:
+            leader_id = partition.leader.id
+            latency = max(1.0, latencies.get(leader_id, default_latency))
+            depth = queued.get(leader_id, min_queued) + 1.0
+            costs.append(latency * depth / (min_queued + 1.0))
+        weights = [1.0 / cost for cost in costs]
+        total = sum(weights)
+        floor = self.min_share / len(partitions)
+        cumulative = []
+        running = 0.0
+        for weight in weights:
+            running += floor + (1 - self.min_share) * weight / total
+            cumulative.append(running)
+        return cumulative
@@ -17,13 +17,14 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-__all__ = ["Producer"]
-from collections import deque
+__all__ = ["Producer", "MultiTopicProducer", "DeliveryFuture"]
+from collections import deque, OrderedDict
 import logging
 import platform
 import struct
 import sys
 import threading
+import time
 import weakref
 from pkg_resources import parse_version
 
@@ -41,9 +42,10 @@ from .exceptions import (
     ProducerStoppedException,
     SocketDisconnectedError,
 )
+from .metrics import MetricsRegistry
 from .partitioners import random_partitioner
 from .protocol import Message, ProduceRequest
-from .utils.compat import iteritems, itervalues, Empty
+from .utils.compat import iteritems, Empty, get_string, monotonic
 from .utils.error_handlers import valid_int
 from .utils import msg_protocol_version
 
@@ -72,7 +74,10 @@ class Producer(object):
                  min_queued_messages=70000,
                  linger_ms=5 * 1000,
                  block_on_queue_full=True,
+                 buffer_memory_bytes=None,
                  max_request_size=1000012,
+                 encode_on_produce=False,
+                 spill_store=None,
                  sync=False,
                  delivery_reports=False,
                  auto_start=True):
@@ -124,7 +129,7 @@ class Producer(object):
             this setting.  However, if we have fewer than this many messages
             accumulated for this partition we will 'linger' for the specified
             time waiting for more records to show up. linger_ms=0 indicates no
-            lingering.
+            lingering. `flush()` and `stop()` send queued messages right away.
         :type linger_ms: int
         :param block_on_queue_full: When the producer's message queue for a
             broker contains max_queued_messages, we must either stop accepting
@@ -132,6 +137,15 @@ class Producer(object):
             indicates we should block until space is available in the queue.
             If False, we should throw an error immediately.
         :type block_on_queue_full: bool
+        :param buffer_memory_bytes: The total number of bytes (counted as the
+            encoded size of messages) that the producer may hold in its
+            queues, including messages waiting for acknowledgement. When this
+            budget is used up, `produce()` blocks or raises
+            `ProducerQueueFullError`, as set by block_on_queue_full. A
+            single message larger than the budget is accepted only when no
+            other messages are buffered. If `None`, memory use is bounded only
+            by max_queued_messages.
+        :type buffer_memory_bytes: int
         :param max_request_size:
             The maximum size of a request in bytes. This is also effectively a
             cap on the maximum record size. Note that the server has its own
@@ -139,6 +153,23 @@ class Producer(object):
             will limit the number of record batches the producer will send in a
             single request to avoid sending huge requests.
         :type max_request_size: int
+        :param encode_on_produce: Whether `produce()` should serialize each
+            message right away. Serialization then happens on the calling
+            thread rather than on the broker's worker thread, which only has
+            to copy the serialized bytes into requests. Messages returned by
+            `produce()` must not be modified when this is enabled.
+        :type encode_on_produce: bool
+        :param spill_store: Where to put messages that don't fit into the
+            in-memory queues (as limited by max_queued_messages and
+            buffer_memory_bytes) instead of blocking or raising
+            `ProducerQueueFullError`. Once messages have been spilled, all
+            following messages are spilled as well until the store has been
+            replayed, which keeps their order. Only when the store's disk
+            budget is used up does `produce()` fall back to blocking or
+            raising. Replay happens on a dedicated thread and picks up
+            anything left over from earlier producers of the same topic using
+            the same store. Leftovers for other topics are dropped.
+        :type spill_store: :class:`pykafka.spill.SpillStore`
         :param sync: Whether calls to `produce` should wait for the message to
             send before returning.  If `True`, an exception will be raised from
             `produce()` if delivery to kafka failed.
@@ -161,6 +192,10 @@ class Producer(object):
         self._protocol_version = msg_protocol_version(cluster._broker_version)
         self._topic = topic
         self._partitioner = partitioner
+        # plain function partitioners have none of these hooks
+        self._on_batch_closed = getattr(partitioner, "on_batch_closed", None)
+        self._on_request_completed = getattr(partitioner, "on_request_completed",
+                                             None)
         self._compression = compression
         if self._compression == CompressionType.SNAPPY and \
                 platform.python_implementation == "PyPy":
@@ -176,16 +211,42 @@ class Producer(object):
                                         if not sync else 1)
         self._linger_ms = valid_int(linger_ms, allow_zero=True)
         self._block_on_queue_full = block_on_queue_full
+        self._buffer_memory_bytes = (valid_int(buffer_memory_bytes)
+                                     if buffer_memory_bytes is not None else None)
+        self._buffer_memory_used = 0
+        self._buffer_memory_lock = self._cluster.handler.Lock()
+        self._buffer_memory_available = self._cluster.handler.Event()
         self._max_request_size = valid_int(max_request_size)
+        self._encode_on_produce = encode_on_produce
+        self._spill_store = spill_store
+        self._spill_lock = self._cluster.handler.Lock()
+        self._spill_ready = self._cluster.handler.Event()
+        self._spill_replayer = None
+        self._spill_stopping = False
+        self._spill_replaying = 0  # records read but not fully enqueued yet
+        # record position -> report targets of messages spilled by us
+        self._spill_targets = {}
+        # record position -> [messages not yet settled, next position]
+        self._spill_unsettled = OrderedDict()
         self._synchronous = sync
         self._worker_exception = None
         self._owned_brokers = None
+        self._metrics = MetricsRegistry()
         self._delivery_reports = (_DeliveryReportQueue(self._cluster.handler)
                                   if delivery_reports or self._synchronous
                                   else _DeliveryReportNone())
         self._auto_start = auto_start
         self._running = False
         self._update_lock = self._cluster.handler.Lock()
+        # set whenever an OwnedBroker runs out of pending messages
+        self._pending_drained = self._cluster.handler.Event()
+        # number of flush() calls waiting, while non-zero OwnedBrokers don't
+        # linger on partially filled queues
+        self._flushes_in_progress = 0
+        self._flush_lock = self._cluster.handler.Lock()
+        self._callback_lock = self._cluster.handler.Lock()
+        self._callback_queue = None
+        self._callback_dispatcher = None
         if self._auto_start:
             self.start()
 
@@ -199,6 +260,14 @@ class Producer(object):
         if self._worker_exception is not None:
             reraise(*self._worker_exception)
 
+    def _set_worker_exception(self, exc_info):
+        """Record an exception from a worker thread and wake up waiters
+
+        :param exc_info: The exception, as returned by `sys.exc_info()`
+        """
+        self._worker_exception = exc_info
+        self._buffer_memory_available.set()
+
     def __repr__(self):
         return "<{module}.{name} at {id_}>".format(
             module=self.__class__.__module__,
@@ -214,11 +283,55 @@ class Producer(object):
         """Context manager exit point - stop the producer"""
         self.stop()
 
+    @property
+    def buffer_memory_used(self):
+        """The encoded size in bytes of all messages currently held
+
+        This counts messages from the moment they're passed to `produce()`
+        until they are acknowledged by the broker or finally given up on.
+        """
+        return self._buffer_memory_used
+
+    def stats(self):
+        """Take a snapshot of the producer's internal metrics
+
+        :returns: dict of
+
+            * counters `requests_sent`, `requests_failed`,
+              `messages_delivered`, `messages_retried` (re-enqueued after a
+              failed request) and `messages_failed` (given up on)
+            * `batch_bytes`, the total size of all sent messages before
+              compression, and `request_bytes`, the total size of the produce
+              requests carrying them. `compression_ratio` is the latter over
+              the former
+            * histograms `batch_messages` and `request_latency_us` (see
+              :meth:`pykafka.metrics.Histogram.snapshot`)
+            * `queued_messages`, a dict of broker id to the number of messages
+              waiting in the queue for that broker, and `buffer_memory_used`
+        """
+        stats = self._metrics.stats()
+        for name in ("requests_sent", "requests_failed", "messages_delivered",
+                     "messages_retried", "messages_failed", "batch_bytes",
+                     "request_bytes"):
+            stats.setdefault(name, 0)
+        stats['compression_ratio'] = (
+            stats['request_bytes'] / stats['batch_bytes']
+            if stats['batch_bytes'] else None)
+        # snapshot the brokers, an update may change them while we iterate
+        owned_brokers = list(iteritems(self._owned_brokers or {}))
+        stats['queued_messages'] = {
+            broker_id: len(owned_broker.queue)
+            for broker_id, owned_broker in owned_brokers}
+        stats['buffer_memory_used'] = self._buffer_memory_used
+        return stats
+
     def start(self):
         """Set up data structures and start worker threads"""
         if not self._running:
             self._setup_owned_brokers()
             self._running = True
+            if self._spill_store is not None:
+                self._start_spill_replayer()
         self._raise_worker_exceptions()
 
     def _update(self):
@@ -265,12 +378,21 @@ class Producer(object):
                     queued_messages.extend(batch)
 
         self._owned_brokers = {}
-        for partition in self._topic.partitions.values():
-            if partition.leader.id not in self._owned_brokers:
-                self._owned_brokers[partition.leader.id] = OwnedBroker(
-                    self, partition.leader)
+        for leader in self._get_leaders():
+            if leader.id not in self._owned_brokers:
+                self._owned_brokers[leader.id] = OwnedBroker(self, leader)
+        # wake up flush(), which may be waiting on a discarded OwnedBroker
+        self._pending_drained.set()
         return queued_messages
 
+    def _get_leaders(self):
+        """The brokers to which this producer may send messages"""
+        return [partition.leader for partition in self._topic.partitions.values()]
+
+    def _get_partition(self, message):
+        """The :class:`pykafka.partition.Partition` `message` is bound for"""
+        return self._topic.partitions[message.partition_id]
+
     def stop(self):
         """Mark the producer as stopped, and wait until all messages to be sent"""
         def get_queue_readers():
@@ -286,11 +408,16 @@ class Producer(object):
                 for owned_broker in self._owned_brokers.values():
                     owned_broker.stop()
 
+        if self._spill_replayer is not None:
+            self._stop_spill_replayer()
         while self._running:
             queue_readers = get_queue_readers()
             stop_owned_brokers()
             if len(queue_readers) == 0:
                 self._running = False
+                # wake up produce() calls blocked on buffer memory
+                self._buffer_memory_available.set()
+                self._stop_callback_dispatcher()
             else:
                 # The join() here works because new queue readers are spawned during the
                 # execution of the old ones i.e: after a queue reader in its call to
@@ -303,7 +430,8 @@ class Producer(object):
                 for queue_reader in queue_readers:
                     queue_reader.join()
 
-    def produce(self, message, partition_key=None, timestamp=None):
+    def produce(self, message, partition_key=None, timestamp=None,
+                on_delivery=None):
         """Produce a message.
 
         :param message: The message to produce (use None to send null)
@@ -314,6 +442,77 @@ class Producer(object):
         :param timestamp: The timestamp at which the message is produced (requires
             broker_version >= 0.10.0)
         :type timestamp: `datetime.datetime`
+        :param on_delivery: A function that is called with the
+            :class:`pykafka.protocol.Message` and either `None` (for success) or
+            an `Exception` (for failed delivery) once delivery has been
+            settled. Callbacks are run one batch after another on a dedicated
+            dispatcher thread, so they should return quickly. The delivery
+            report for this message is then not posted to the
+            `get_delivery_report()` queue. With `sync=True`, the callback is
+            called on the producing thread before `produce()` returns.
+        :type on_delivery: function
+        :return: The :class:`pykafka.protocol.Message` instance that was
+            added to the internal message queue
+        """
+        return self._produce_reported(self._topic, message, partition_key,
+                                      timestamp, on_delivery)
+
+    def produce_future(self, message, partition_key=None, timestamp=None):
+        """Produce a message and return a future for its delivery
+
+        Takes the same arguments as `produce()`, but never blocks waiting for
+        delivery, even with `sync=True`.
+
+        :return: A :class:`pykafka.producer.DeliveryFuture` that resolves to the
+            produced :class:`pykafka.protocol.Message`
+        """
+        future = DeliveryFuture(self._cluster.handler)
+        self._produce_message(self._topic, message, partition_key, timestamp, future)
+        self._raise_worker_exceptions()
+        return future
+
+    def _produce_reported(self, topic, message, partition_key, timestamp,
+                          on_delivery):
+        """Produce a message to `topic`, reporting delivery as set up
+
+        See `produce()` for the arguments.
+        """
+        if self._synchronous:
+            # a per-message future wakes us as soon as the report is in
+            future = DeliveryFuture(self._cluster.handler)
+            msg = self._produce_message(topic, message, partition_key, timestamp,
+                                        future)
+            # min_queued_messages is 1 in sync mode, so the owning broker is
+            # flushed right away; the timeout only serves to surface errors
+            # from worker threads
+            while not future.wait(1):
+                self._raise_worker_exceptions()
+            reported_msg, exc = future.report
+            assert reported_msg is msg
+            if on_delivery is not None:
+                on_delivery(reported_msg, exc)
+            if exc is not None:
+                raise exc
+        elif on_delivery is not None:
+            msg = self._produce_message(
+                topic, message, partition_key, timestamp,
+                _DeliveryCallback(on_delivery, self._get_callback_queue()))
+        else:
+            # We must pass our thread-local Queue instance directly,
+            # as results will be written to it in a worker thread
+            msg = self._produce_message(topic, message, partition_key, timestamp,
+                                        self._delivery_reports.queue)
+        self._raise_worker_exceptions()
+        return msg
+
+    def _produce_message(self, topic, message, partition_key, timestamp,
+                         delivery_report_q):
+        """Build a Message and enqueue it for the relevant broker
+
+        :param topic: The topic to produce to
+        :type topic: :class:`pykafka.topic.Topic`
+        :param delivery_report_q: Where the delivery report for the message
+            is put, anything with a `put((message, exc))` method or None
         :return: The :class:`pykafka.protocol.Message` instance that was
             added to the internal message queue
         """
@@ -327,33 +526,219 @@ class Producer(object):
             raise RuntimeError("Producer.produce got a timestamp with protocol 0")
         if not self._running:
             raise ProducerStoppedException()
-        partitions = list(self._topic.partitions.values())
-        partition_id = self._partitioner(partitions, partition_key).id
+        partition = self._partitioner(topic.sorted_partitions, partition_key)
 
         msg = Message(value=message,
                       partition_key=partition_key,
-                      partition_id=partition_id,
+                      partition_id=partition.id,
                       timestamp=timestamp,
                       protocol_version=self._protocol_version,
-                      # We must pass our thread-local Queue instance directly,
-                      # as results will be written to it in a worker thread
-                      delivery_report_q=self._delivery_reports.queue)
-        self._produce(msg)
+                      delivery_report_q=delivery_report_q)
+        msg.partition = partition
+        if self._encode_on_produce:
+            msg.encode()
+        if self._spill_store is None or not self._spill(msg):
+            self._reserve_buffer_memory(len(msg))
+            try:
+                self._produce(msg)
+            except Exception:
+                # the message never made it into a queue
+                self._release_buffer_memory(len(msg))
+                raise
+        return msg
 
-        if self._synchronous:
+    def _spill(self, message):
+        """Append `message` to the spill store if it must not be enqueued now
+
+        :returns: Whether the message was spilled
+        """
+        with self._spill_lock:
+            if (self._spill_store.empty() and self._spill_replaying == 0 and
+                    not self._queues_full(message)):
+                return False
+            position = self._spill_store.append(
+                self._topic.name, message.partition_id, [message])
+            if position is None:
+                log.warning("Spill store %s is full", self._spill_store)
+                return False
+            if message.delivery_report_q is not None:
+                self._spill_targets[position] = [message.delivery_report_q]
+        self._spill_ready.set()
+        return True
+
+    def _queues_full(self, message):
+        """Whether enqueueing `message` would have to block or raise"""
+        if (self._buffer_memory_bytes is not None and
+                self._buffer_memory_used > 0 and
+                self._buffer_memory_used + len(message) > self._buffer_memory_bytes):
+            return True
+        leader_id = self._get_partition(message).leader.id
+        owned_broker = self._owned_brokers.get(leader_id)
+        return (owned_broker is None or
+                len(owned_broker.queue) >= self._max_queued_messages)
+
+    def _start_spill_replayer(self):
+        """Start the worker that moves spilled messages into the queues"""
+        def replayer(self):
+            try:
+                while not self._spill_stopping:
+                    if not self._replay_spilled_record():
+                        self._spill_ready.wait(1)
+            except Exception:
+                # surface all exceptions to the main thread
+                self._set_worker_exception(sys.exc_info())
+            log.debug("Spill replayer exiting")
+        self._spill_stopping = False
+        self._spill_ready.set()
+        self._spill_replayer = self._cluster.handler.spawn(
+            replayer, args=(weakref.proxy(self), ),
+            name="pykafka.Producer spill replayer")
+
+    def _stop_spill_replayer(self):
+        self._spill_stopping = True
+        self._spill_ready.set()
+        self._spill_replayer.join()
+        self._spill_replayer = None
+        with self._spill_lock:
+            self._spill_store.flush()
+
+    def _replay_spilled_record(self):
+        """Enqueue the messages of the next spilled record
+
+        This blocks while the in-memory queues are full, regardless of
+        block_on_queue_full.
+
+        :returns: Whether a record was replayed
+        """
+        with self._spill_lock:
+            record = self._spill_store.read()
+            if record is None:
+                self._spill_ready.clear()
+                return False
+            position, next_position, topic_name, _, messages = record
+            # left over from a producer of another topic
+            foreign = topic_name != self._topic.name
+            if foreign:
+                log.error("Dropping %d messages for topic %s from spill store "
+                          "%s, which is used for topic %s", len(messages),
+                          get_string(topic_name), self._spill_store,
+                          get_string(self._topic.name))
+                self._spill_unsettled[position] = [1, next_position]
+            else:
+                self._spill_replaying += 1
+                targets = self._spill_targets.pop(position, [])
+                self._spill_unsettled[position] = [len(messages), next_position]
+        if foreign:
+            # settle it right away, so that the record gets committed
+            self._spilled_message_settled(position)
+            return True
+        try:
+            targets.extend([None] * (len(messages) - len(targets)))
+            for msg, target in zip(messages, targets):
+                if msg.partition_id not in self._topic.partitions:
+                    # the topic has changed since the message was spilled
+                    msg.partition_id = self._partitioner(
+                        self._topic.sorted_partitions, msg.partition_key).id
+                msg.partition = self._topic.partitions[msg.partition_id]
+                msg.delivery_report_q = _SpillReport(self, position, target)
+                self._reserve_buffer_memory(len(msg), block=True)
+                self._produce(msg, block=True)
+        finally:
+            with self._spill_lock:
+                self._spill_replaying -= 1
+        return True
+
+    def _spilled_message_settled(self, position):
+        """Commit spilled records once all of their messages are settled"""
+        with self._spill_lock:
+            self._spill_unsettled[position][0] -= 1
+            commit_position = None
+            while self._spill_unsettled:
+                position, (unsettled, next_position) = next(
+                    iteritems(self._spill_unsettled))
+                if unsettled > 0:
+                    break
+                self._spill_unsettled.popitem(last=False)
+                commit_position = next_position
+            if commit_position is not None:
+                self._spill_store.commit(commit_position)
+
+    def _get_callback_queue(self):
+        """Return the queue of the delivery callback dispatcher, starting it if needed"""
+        if not self._running:
+            raise ProducerStoppedException()
+        if self._callback_dispatcher is None:
+            with self._callback_lock:
+                if self._callback_dispatcher is None:
+                    self._callback_queue = self._cluster.handler.Queue()
+                    self._callback_dispatcher = self._cluster.handler.spawn(
+                        _dispatch_delivery_callbacks,
+                        args=(self._callback_queue, ),
+                        name="pykafka.Producer delivery callback dispatcher")
+        return self._callback_queue
+
+    def _stop_callback_dispatcher(self):
+        """Run all outstanding delivery callbacks and stop the dispatcher"""
+        with self._callback_lock:
+            dispatcher = self._callback_dispatcher
+            if dispatcher is None:
+                return
+            self._callback_dispatcher = None
+            self._callback_queue.put(None)
+        # a callback may itself stop the producer
+        if dispatcher is not threading.current_thread():
+            dispatcher.join()
+
+    def flush(self, timeout=None):
+        """Send all queued messages and block until they have been delivered
+
+        "Pending" messages are those that have been used in calls to `produce`
+        and have not yet been sent to the broker and acknowledged by it (or
+        given up on). Messages waiting in the spill store are not counted.
+        Queued messages are sent right away, without waiting for `linger_ms`
+        or `min_queued_messages`.
+
+        :param timeout: How long (in seconds) to block before returning. If
+            `None`, block until no messages are pending.
+        :type timeout: float
+        :returns: The number of messages that are still pending, that is 0 if
+            all messages were sent within `timeout`
+        :rtype: int
+        """
+        with self._flush_lock:
+            self._flushes_in_progress += 1
+        try:
+            for owned_broker in list((self._owned_brokers or {}).values()):
+                # under the lock, so that the OwnedBroker either sees the flush
+                # in progress or is woken up by this
+                with owned_broker.lock:
+                    owned_broker.flush_ready.set()
+            deadline = None if timeout is None else monotonic() + timeout
             while True:
                 self._raise_worker_exceptions()
-                self._cluster.handler.sleep()
-                try:
-                    reported_msg, exc = self.get_delivery_report(timeout=1)
-                    break
-                except Empty:
-                    continue
-            assert reported_msg is msg
-            if exc is not None:
-                raise exc
-        self._raise_worker_exceptions()
-        return msg
+                # clear before checking, so that a notification sent between
+                # the check and the wait below isn't lost
+                self._pending_drained.clear()
+                pending = self._messages_pending()
+                if pending == 0:
+                    return 0
+                if deadline is None:
+                    self._pending_drained.wait()
+                else:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        return pending
+                    self._pending_drained.wait(remaining)
+        finally:
+            with self._flush_lock:
+                self._flushes_in_progress -= 1
+
+    def _messages_pending(self):
+        """The number of pending messages summed over all OwnedBrokers"""
+        if not self._owned_brokers:
+            return 0
+        return sum(owned_broker.messages_pending
+                   for owned_broker in list(self._owned_brokers.values()))
 
     def get_delivery_report(self, block=True, timeout=None):
         """Fetch delivery reports for messages produced on the current thread
@@ -373,17 +758,60 @@ class Producer(object):
         except AttributeError:
             raise KafkaException("Delivery-reporting is disabled")
 
-    def _produce(self, message):
+    def _reserve_buffer_memory(self, size, block=None):
+        """Account for `size` bytes of new messages, waiting for room if needed
+
+        :param size: The encoded size in bytes of the messages
+        :type size: int
+        :param block: Whether to block rather than raise when out of room,
+            defaults to block_on_queue_full
+        :type block: bool
+        """
+        if block is None:
+            block = self._block_on_queue_full
+        while True:
+            with self._buffer_memory_lock:
+                if (self._buffer_memory_bytes is None or
+                        self._buffer_memory_used == 0 or
+                        self._buffer_memory_used + size <= self._buffer_memory_bytes):
+                    self._buffer_memory_used += size
+                    return
+                self._buffer_memory_available.clear()
+            if not block:
+                raise ProducerQueueFullError(
+                    "buffer_memory_bytes ({}) exhausted".format(
+                        self._buffer_memory_bytes))
+            # failing workers and stop() set the event too, so check for
+            # them after clearing it
+            self._raise_worker_exceptions()
+            if not self._running:
+                raise ProducerStoppedException()
+            self._buffer_memory_available.wait()
+
+    def _release_buffer_memory(self, size):
+        """Return `size` bytes of messages that have left the producer
+
+        :param size: The encoded size in bytes of the messages
+        :type size: int
+        """
+        with self._buffer_memory_lock:
+            self._buffer_memory_used = max(0, self._buffer_memory_used - size)
+            self._buffer_memory_available.set()
+
+    def _produce(self, message, block=None):
         """Enqueue a message for the relevant broker
 
         :param message: Message with valid `partition_id`, ready to be sent
         :type message: `pykafka.protocol.Message`
+        :param block: Whether to block rather than raise when the queue is
+            full, defaults to block_on_queue_full
+        :type block: bool
         """
         success = False
         while not success:
-            leader_id = self._topic.partitions[message.partition_id].leader.id
+            leader_id = self._get_partition(message).leader.id
             if leader_id in self._owned_brokers:
-                self._owned_brokers[leader_id].enqueue(message)
+                self._owned_brokers[leader_id].enqueue(message, block)
                 success = True
             else:
                 success = False
@@ -403,27 +831,30 @@ class Producer(object):
         )
         req.delivered = 0
         for msg in message_batch:
-            req.add_message(msg, self._topic.name, msg.partition_id)
+            req.add_message(msg, self._get_partition(msg).topic.name,
+                            msg.partition_id)
         log.debug("Sending %d messages to broker %d",
                   len(message_batch), owned_broker.broker.id)
-
-        def _get_partition_msgs(partition_id, req):
-            """Get all the messages for the partitions from the request."""
-            return (
-                mset
-                for topic, partitions in iteritems(req.msets)
-                for p_id, mset in iteritems(partitions)
-                if p_id == partition_id
-            )
+        self._metrics.histogram("batch_messages").record(len(message_batch))
 
         def mark_as_delivered(message_batch):
             owned_broker.increment_messages_pending(-1 * len(message_batch))
+            self._release_buffer_memory(sum(len(msg) for msg in message_batch))
+            self._metrics.counter("messages_delivered").inc(len(message_batch))
             req.delivered += len(message_batch)
             for msg in message_batch:
                 self._delivery_reports.put(msg)
 
         try:
+            start = monotonic()
             response = owned_broker.broker.produce_messages(req)
+            self._metrics.histogram("request_latency_us").record(
+                (monotonic() - start) * 1000000)
+            self._metrics.counter("requests_sent").inc()
+            self._metrics.counter("batch_bytes").inc(
+                sum(len(msg) for msg in message_batch))
+            # compressed MessageSets are cached, so this doesn't compress again
+            self._metrics.counter("request_bytes").inc(len(req))
             if self._required_acks == 0:  # and thus, `response` is None
                 mark_as_delivered(message_batch)
                 return
@@ -451,13 +882,12 @@ class Producer(object):
                         presponse.err)
                     log.warning(info)
                     exc = ERROR_CODES[presponse.err](info)
-                    to_retry.extend(
-                        (mset, exc)
-                        for mset in _get_partition_msgs(partition, req))
+                    to_retry.append((req.msets[topic][partition], exc))
         except (SocketDisconnectedError, struct.error) as exc:
             log.warning('Error encountered when producing to broker %s:%s. Retrying.',
                         owned_broker.broker.host,
                         owned_broker.broker.port)
+            self._metrics.counter("requests_failed").inc()
             self._update()
             to_retry = [
                 (mset, exc)
@@ -470,7 +900,9 @@ class Producer(object):
 
         if to_retry:
             self._cluster.handler.sleep(self._retry_backoff_ms / 1000)
-            owned_broker.increment_messages_pending(-1 * len(to_retry))
+            # to_retry holds MessageSets, but pending counts are per message
+            owned_broker.increment_messages_pending(
+                -1 * sum(len(mset.messages) for mset, _ in to_retry))
             for mset, exc in to_retry:
                 # XXX arguably, we should try to check these non_recoverables
                 # for individual messages in _produce and raise errors there
@@ -479,10 +911,13 @@ class Producer(object):
                                                 MessageSizeTooLarge)
                 for msg in mset.messages:
                     if (non_recoverable or msg.produce_attempt >= self._max_retries):
+                        self._release_buffer_memory(len(msg))
                         self._delivery_reports.put(msg, exc)
+                        self._metrics.counter("messages_failed").inc()
                         log.error("Message not delivered!! %r" % exc)
                     else:
                         msg.produce_attempt += 1
+                        self._metrics.counter("messages_retried").inc()
                         self._produce(msg)
 
     def _wait_all(self):
@@ -492,9 +927,78 @@ class Producer(object):
         and have not yet been dequeued and sent to the broker
         """
         log.info("Blocking until all messages are sent")
-        while any(q.message_is_pending() for q in itervalues(self._owned_brokers)):
-            self._cluster.handler.sleep(.3)
-            self._raise_worker_exceptions()
+        self.flush()
+
+
+class MultiTopicProducer(Producer):
+    """A Producer that can send messages to any topic in the cluster
+
+    Messages for all topics share one queue, one worker and one stream of
+    produce requests per broker, so each request can carry batches for many
+    topics at once. Topics are looked up on first use and kept for the
+    lifetime of the producer.
+
+    The partitioner is shared by all topics, so a partitioner that keeps
+    state must keep it per topic, as
+    :class:`pykafka.partitioners.StickyPartitioner` does.
+    """
+    def __init__(self, cluster, **kwargs):
+        """Instantiate a new MultiTopicProducer
+
+        :param cluster: The cluster to which to connect
+        :type cluster: :class:`pykafka.cluster.Cluster`
+
+        All other keyword arguments are those of
+        :class:`pykafka.producer.Producer`, except for `spill_store`, which is
+        not supported.
+        """
+        if kwargs.get("spill_store") is not None:
+            raise ValueError("MultiTopicProducer does not support spill_store")
+        self._topics = {}
+        self._topics_lock = cluster.handler.Lock()
+        super(MultiTopicProducer, self).__init__(cluster, None, **kwargs)
+
+    def _get_leaders(self):
+        return list(self._cluster.brokers.values())
+
+    def _get_partition(self, message):
+        return message.partition
+
+    def _get_topic(self, topic):
+        """Return the :class:`pykafka.topic.Topic` for a topic or topic name"""
+        name = getattr(topic, "name", topic)
+        if name not in self._topics:
+            with self._topics_lock:
+                if name not in self._topics:
+                    # the cluster only keeps weak references to topics
+                    self._topics[name] = (topic if hasattr(topic, "partitions")
+                                          else self._cluster.topics[name])
+        return self._topics[name]
+
+    def produce(self, topic, message, partition_key=None, timestamp=None,
+                on_delivery=None):
+        """Produce a message to `topic`.
+
+        :param topic: The topic to which to produce
+        :type topic: :class:`pykafka.topic.Topic` or bytes
+        :return: The :class:`pykafka.protocol.Message` instance that was
+            added to the internal message queue
+
+        For the other arguments, see :meth:`pykafka.producer.Producer.produce`.
+        """
+        return self._produce_reported(self._get_topic(topic), message,
+                                      partition_key, timestamp, on_delivery)
+
+    def produce_future(self, topic, message, partition_key=None, timestamp=None):
+        """Produce a message to `topic` and return a future for its delivery
+
+        See :meth:`pykafka.producer.Producer.produce_future`.
+        """
+        future = DeliveryFuture(self._cluster.handler)
+        self._produce_message(self._get_topic(topic), message, partition_key,
+                              timestamp, future)
+        self._raise_worker_exceptions()
+        return future
 
 
 class OwnedBroker(object):
@@ -540,6 +1044,8 @@ class OwnedBroker(object):
     def cleanup(self):
         if not self.slot_available.is_set():
             self.slot_available.set()
+        # let flush() notice if this worker exited with an exception
+        self.producer._pending_drained.set()
 
     def start(self):
         def queue_reader():
@@ -547,10 +1053,19 @@ class OwnedBroker(object):
                 try:
                     batch = self.flush(self.producer._linger_ms, self.producer._max_request_size)
                     if batch:
+                        if self.producer._on_batch_closed is not None:
+                            self.producer._on_batch_closed(
+                                set(self.producer._get_partition(msg)
+                                    for msg in batch))
+                        start = time.time()
                         self.producer._send_request(batch, self)
+                        if self.producer._on_request_completed is not None:
+                            self.producer._on_request_completed(
+                                self.broker.id, (time.time() - start) * 1000,
+                                self.messages_pending)
                 except Exception:
                     # surface all exceptions to the main thread
-                    self.producer._worker_exception = sys.exc_info()
+                    self.producer._set_worker_exception(sys.exc_info())
                     break
             self.cleanup()
             log.info("Worker exited for broker %s:%s", self.broker.host,
@@ -562,11 +1077,15 @@ class OwnedBroker(object):
 
     def stop(self):
         self.running = False
+        # wake up the queue reader if it is lingering
+        self.flush_ready.set()
 
     def increment_messages_pending(self, amnt):
         with self.lock:
             self.messages_pending += amnt
             self.messages_pending = max(0, self.messages_pending)
+            if self.messages_pending == 0:
+                self.producer._pending_drained.set()
 
     def message_is_pending(self):
         """
@@ -575,17 +1094,20 @@ class OwnedBroker(object):
         """
         return self.messages_pending > 0
 
-    def enqueue(self, message):
+    def enqueue(self, message, block=None):
         """Push message onto the queue
 
         :param message: The message to push onto the queue
         :type message: `pykafka.protocol.Message`
+        :param block: Whether to block rather than raise when the queue is
+            full, defaults to the producer's block_on_queue_full
+        :type block: bool
         """
-        self._wait_for_slot_available()
+        self._wait_for_slot_available(block)
         with self.lock:
             self.queue.appendleft(message)
             self.increment_messages_pending(1)
-            if len(self.queue) >= self.producer._min_queued_messages:
+            if self._ready_to_flush():
                 if not self.flush_ready.is_set():
                     self.flush_ready.set()
 
@@ -633,6 +1155,7 @@ class OwnedBroker(object):
                             peeked_message.delivery_report_q.put((message, exc))
                         # remove from pending message count
                         self.increment_messages_pending(-1)
+                        self.producer._release_buffer_memory(len(message))
                         continue
 
                     # test if adding the message would go over the
@@ -666,23 +1189,40 @@ class OwnedBroker(object):
             to contain messages before returning
         :type linger_ms: int
         """
-        if len(self.queue) < self.producer._min_queued_messages:
+        if not self._ready_to_flush():
             with self.lock:
-                if len(self.queue) < self.producer._min_queued_messages:
+                if not self._ready_to_flush():
                     self.flush_ready.clear()
-            if linger_ms > 0:
+            # stop() sets flush_ready after clearing `running`, so checking
+            # here means we can't miss its wake-up
+            if linger_ms > 0 and self.running:
                 self.flush_ready.wait((linger_ms / 1000))
 
-    def _wait_for_slot_available(self):
-        """Block until the queue has at least one slot not containing a message"""
+    def _ready_to_flush(self):
+        """Whether the queue should be sent without lingering"""
+        if len(self.queue) >= self.producer._min_queued_messages:
+            return True
+        # Producer.flush() wants whatever is queued sent right away
+        return self.producer._flushes_in_progress > 0 and len(self.queue) > 0
+
+    def _wait_for_slot_available(self, block=None):
+        """Block until the queue has at least one slot not containing a message
+
+        :param block: Whether to block rather than raise when the queue is
+            full, defaults to the producer's block_on_queue_full
+        :type block: bool
+        """
+        if block is None:
+            block = self.producer._block_on_queue_full
         if len(self.queue) >= self.producer._max_queued_messages:
             with self.lock:
                 if len(self.queue) >= self.producer._max_queued_messages:
                     self.slot_available.clear()
-            if self.producer._block_on_queue_full:
-                while not self.slot_available.is_set():
-                    self.producer._cluster.handler.sleep()
-                    self.slot_available.wait(5)
+            if block:
+                # set by flush() when it takes messages off the queue and by
+                # cleanup() when the queue reader exits
+                self.producer._raise_worker_exceptions()
+                self.slot_available.wait()
             else:
                 raise ProducerQueueFullError("Queue full for broker %d",
                                              self.broker.id)
@@ -698,11 +1238,122 @@ class _DeliveryReportQueue(threading.local):
         msg.delivery_report_q.put((msg, exc))
 
 
+class DeliveryFuture(object):
+    """The delivery of a single message, which will be settled at some point
+
+    Returned by :meth:`pykafka.producer.Producer.produce_future`.
+
+    :ivar report: `None` until delivery is settled, then a 2-tuple of the
+        :class:`pykafka.protocol.Message` and either `None` (for success) or an
+        `Exception` (for failed delivery)
+    """
+    def __init__(self, handler):
+        """
+        :type handler: :class:`pykafka.handlers.Handler`
+        """
+        self._event = handler.Event()
+        self.report = None
+
+    def put(self, report):
+        """Settle the delivery, used in place of a delivery report queue"""
+        self.report = report
+        self._event.set()
+
+    def done(self):
+        """Whether delivery has been settled"""
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """Block until delivery has been settled, return whether it has"""
+        self._event.wait(timeout)
+        return self._event.is_set()
+
+    def get(self, timeout=None):
+        """Block until delivery has been settled and return the message
+
+        Raises the delivery error if delivery failed, or `Queue.Empty` if
+        delivery hasn't been settled within `timeout` seconds.
+
+        :param timeout: How long (in seconds) to block, or `None` to block
+            until delivery is settled
+        :type timeout: float
+        :rtype: :class:`pykafka.protocol.Message`
+        """
+        if not self.wait(timeout):
+            raise Empty()
+        msg, exc = self.report
+        if exc is not None:
+            raise exc
+        return msg
+
+
+class _DeliveryCallback(object):
+    """Stand-in for a delivery report queue that hands reports to a callback"""
+    __slots__ = ["callback", "dispatch_q"]
+
+    def __init__(self, callback, dispatch_q):
+        self.callback = callback
+        self.dispatch_q = dispatch_q
+
+    def put(self, report):
+        self.dispatch_q.put((self.callback, report))
+
+
+def _dispatch_delivery_callbacks(dispatch_q, max_batch_size=1000):
+    """Run delivery callbacks until a `None` sentinel is dequeued
+
+    Whatever has accumulated on the queue is taken off in one go, so that
+    the dispatcher wakes up once per batch rather than once per report.
+    """
+    running = True
+    while running:
+        batch = [dispatch_q.get()]
+        try:
+            while len(batch) < max_batch_size:
+                batch.append(dispatch_q.get_nowait())
+        except Empty:
+            pass
+        for item in batch:
+            if item is None:
+                running = False
+                continue
+            callback, (msg, exc) = item
+            try:
+                callback(msg, exc)
+            except Exception:
+                log.exception("Error in delivery callback for %r", msg)
+    log.debug("Delivery callback dispatcher exiting")
+
+
+class _SpillReport(object):
+    """Stand-in for the delivery report queue of a replayed message
+
+    Lets the producer commit spilled records once their messages are settled,
+    then passes the report on to the message's original target, if known.
+    """
+    __slots__ = ["producer", "position", "target"]
+
+    def __init__(self, producer, position, target):
+        self.producer = producer
+        self.position = position
+        self.target = target
+
+    def put(self, report):
+        self.producer._spilled_message_settled(self.position)
+        if self.target is not None:
+            self.target.put(report)
+
+
 class _DeliveryReportNone(object):
-    """Stand-in for when _DeliveryReportQueue has been disabled"""
+    """Stand-in for when _DeliveryReportQueue has been disabled
+
+    Reports are still passed on for messages that were produced with their
+    own report target (a callback or a future).
+    """
     def __init__(self):
         self.queue = None
 
     @staticmethod
     def put(msg, exc=None):
-        return
+        if msg.delivery_report_q is not None:
+            msg.delivery_report_q.put((msg, exc))
@@ -46,7 +46,7 @@ Response => CorrelationId ResponseMessage
 """
 __all__ = [
     "MetadataRequest", "MetadataResponse", "ProduceRequest", "ProduceResponse",
-    "OffsetRequest", "OffsetResponse", "OffsetCommitRequest",
+    "OffsetRequest", "OffsetResponse", "OffsetResponseV1", "OffsetCommitRequest",
     "FetchRequest", "FetchResponse", "PartitionFetchRequest",
     "OffsetCommitResponse", "OffsetFetchRequest", "OffsetFetchResponse",
     "PartitionOffsetRequest", "GroupCoordinatorRequest",
@@ -161,6 +161,7 @@ class Message(Message, Serializable):
     """
 
     __slots__ = [
+        "_encoded",
         "compression_type",
         "partition_key",
         "value",
@@ -200,8 +201,11 @@ class Message(Message, Serializable):
         self.delivery_report_q = delivery_report_q
         assert protocol_version in (0, 1)
         self.protocol_version = protocol_version
+        self._encoded = None
 
     def __len__(self):
+        if self._encoded is not None:
+            return len(self._encoded)
         size = 4 + 1 + 1 + 4 + 4
         if self.value is not None:
             size += len(self.value)
@@ -229,6 +233,21 @@ class Message(Message, Serializable):
                        timestamp=timestamp,
                        partition_id=partition_id)
 
+    def encode(self):
+        """Serialize the message once and keep the result
+
+        Afterwards `__len__` and `pack_into` reuse the serialized bytes, so the
+        fields that make up the serialization must not be changed anymore.
+
+        :returns: The serialized message
+        :rtype: :class:`bytearray`
+        """
+        self._encoded = None
+        encoded = bytearray(len(self))
+        self.pack_into(encoded, 0)
+        self._encoded = encoded
+        return encoded
+
     def pack_into(self, buff, offset):
         """Serialize and write to ``buff`` starting at offset ``offset``.
 
@@ -237,6 +256,9 @@ class Message(Message, Serializable):
         :param buff: The buffer to write into
         :param offset: The offset to start the write at
         """
+        if self._encoded is not None:
+            buff[offset:offset + len(self._encoded)] = self._encoded
+            return
         # NB a length of 0 means an empty string, whereas -1 means null
         # Assuming a CreateTime timestamp, not a LogAppendTime.
         len_key = -1 if self.partition_key is None else len(self.partition_key)
@@ -887,9 +909,21 @@ class OffsetRequest(Request):
           Partition => int32
           Time => int64
           MaxNumberOfOffsets => int32
+
+    Version 1 of the request (Kafka 0.10.1 and later) drops
+    MaxNumberOfOffsets. Instead of segment boundaries, it finds the offset of
+    the first message whose timestamp is at or after Time.
     """
-    def __init__(self, partition_requests):
-        """Create a new offset request"""
+    def __init__(self, partition_requests, api_version=0):
+        """Create a new offset request
+
+        :param partition_requests: Iterable of
+            :class:`pykafka.protocol.PartitionOffsetRequest` for this request.
+            With `api_version=1`, their `max_offsets` is ignored.
+        :param api_version: The version of the request to send
+        :type api_version: int
+        """
+        self.api_version = api_version
         self._reqs = defaultdict(dict)
         for t in partition_requests:
             self._reqs[t.topic_name][t.partition_id] = (t.offsets_before,
@@ -899,11 +933,12 @@ class OffsetRequest(Request):
         """Length of the serialized message, in bytes"""
         # Header + replicaId + len(topics)
         size = self.HEADER_LEN + 4 + 4
+        # partition + time (+ max offsets in v0) => for each partition
+        partition_size = 4 + 8 + (4 if self.api_version == 0 else 0)
         for topic, parts in iteritems(self._reqs):
             # topic name + len(parts)
             size += 2 + len(topic) + 4
-            # partition + fetch offset + max bytes => for each partition
-            size += (4 + 8 + 4) * len(parts)
+            size += partition_size * len(parts)
         return size
 
     @property
@@ -918,7 +953,7 @@ class OffsetRequest(Request):
         :rtype: :class:`bytearray`
         """
         output = bytearray(len(self))
-        self._write_header(output)
+        self._write_header(output, api_version=self.api_version)
         offset = self.HEADER_LEN
         struct.pack_into('!ii', output, offset, -1, len(self._reqs))
         offset += 8
@@ -928,9 +963,13 @@ class OffsetRequest(Request):
                              topic_name, len(partitions))
             offset += struct.calcsize(fmt)
             for pnum, (offsets_before, max_offsets) in iteritems(partitions):
-                struct.pack_into('!iqi', output, offset,
-                                 pnum, offsets_before, max_offsets)
-                offset += 16
+                if self.api_version == 0:
+                    struct.pack_into('!iqi', output, offset,
+                                     pnum, offsets_before, max_offsets)
+                    offset += 16
+                else:
+                    struct.pack_into('!iq', output, offset, pnum, offsets_before)
+                    offset += 12
         return output
 
 
@@ -951,6 +990,16 @@ class OffsetResponse(Response):
           ErrorCode => int16
           Offset => int64
     """
+    api_version = 0
+
+    @staticmethod
+    def get_subclass(broker_protocol):
+        """Choose which subclass of response to demand and expect, and thus
+        which version of :class:`OffsetRequest` to send"""
+        if parse_version(broker_protocol) >= parse_version("0.10.1"):
+            return OffsetResponseV1
+        return OffsetResponse
+
     def __init__(self, buff):
         """Deserialize into a new Response
 
@@ -968,6 +1017,47 @@ class OffsetResponse(Response):
                     partition[2], partition[1])
 
 
+OffsetPartitionResponseV1 = namedtuple(
+    'OffsetPartitionResponseV1',
+    ['offset', 'timestamp', 'err']
+)
+
+
+class OffsetResponseV1(OffsetResponse):
+    """An offset response, version 1
+
+    Specification::
+
+        OffsetResponse => [TopicName [PartitionOffsets]]
+          PartitionOffsets => Partition ErrorCode Timestamp Offset
+          Partition => int32
+          ErrorCode => int16
+          Timestamp => int64
+          Offset => int64
+
+    For consistency with version 0, `offset` is a list holding the one offset
+    returned. It is -1 if no message has a timestamp at or after the requested
+    time.
+    """
+    api_version = 1
+
+    def __init__(self, buff):
+        """Deserialize into a new Response
+
+        :param buff: Serialized message
+        :type buff: :class:`bytearray`
+        """
+        fmt = '[S [ihqq ] ]'
+        response = struct_helpers.unpack_from(fmt, buff, 0)
+
+        self.topics = {}
+        for topic_name, partitions in response:
+            self.topics[topic_name] = {}
+            for partition in partitions:
+                self.topics[topic_name][partition[0]] = OffsetPartitionResponseV1(
+                    [partition[3]], partition[2], partition[1])
+
+
 class GroupCoordinatorRequest(Request):
     """A consumer metadata request
 
@@ -1367,10 +1457,20 @@ class JoinGroupRequest(Request):
             ProtocolName => string
             ProtocolMetadata => bytes
     """
-    def __init__(self, group_id, member_id, topic_name, session_timeout=30000):
-        """Create a new group join request"""
-        metadata = ConsumerGroupProtocolMetadata(topic_names=[topic_name])
-        self.protocol = GroupMembershipProtocol(b"consumer", b"range", metadata)
+    def __init__(self, group_id, member_id, topic_name, session_timeout=30000,
+                 protocol_name=b"range", user_data=None):
+        """Create a new group join request
+
+        :param topic_name: The name of the topic to subscribe to, or a list
+            of the names of several topics
+        :type topic_name: bytes or list of bytes
+        """
+        if isinstance(topic_name, bytes):
+            topic_name = [topic_name]
+        metadata = ConsumerGroupProtocolMetadata(topic_names=list(topic_name))
+        if user_data is not None:
+            metadata.user_data = user_data
+        self.protocol = GroupMembershipProtocol(b"consumer", protocol_name, metadata)
         self.group_id = group_id
         self.session_timeout = session_timeout
         self.member_id = member_id
@@ -3,7 +3,7 @@ from pkg_resources import parse_version
 
 from pykafka.exceptions import RdKafkaStoppedException, ProducerStoppedException
 from pykafka.producer import Producer, CompressionType, random_partitioner
-from pykafka.utils.compat import get_bytes
+from pykafka.utils.compat import get_bytes, monotonic
 from . import _rd_kafka
 from . import helpers
 
@@ -28,7 +28,9 @@ class RdKafkaProducer(Producer):
     `queue.buffering.max.ms` config option and thus must be within the acceptable range
     defined by librdkafka. Several other parameters, including `ack_timeout_ms`,
     `max_retries`, and `retry_backoff_ms`, are used to derive certain librdkafka
-    config values. Certain combinations of values for these parameters can result in
+    config values. `buffer_memory_bytes` is handed to librdkafka as
+    `queue.buffering.max.kbytes`, which counts payload bytes rather than encoded
+    message sizes. Certain combinations of values for these parameters can result in
     configuration errors from librdkafka.
 
     The `broker_version` argument on `KafkaClient` must be set correctly to use the
@@ -46,6 +48,7 @@ class RdKafkaProducer(Producer):
                  max_queued_messages=100000,
                  min_queued_messages=2000,  # NB differs from pykafka.Producer
                  linger_ms=5 * 1000,
+                 buffer_memory_bytes=None,
                  max_request_size=1000012,
                  sync=False,
                  delivery_reports=False,
@@ -92,6 +95,33 @@ class RdKafkaProducer(Producer):
         except RdKafkaStoppedException:
             raise ProducerStoppedException
 
+    def flush(self, timeout=None):
+        """Block until librdkafka's outbound queue is empty
+
+        See `pykafka.Producer.flush`. librdkafka offers no notification for
+        this, so its queue length is sampled at short intervals.
+        """
+        if self._rdk_producer is None:
+            return 0
+        deadline = None if timeout is None else monotonic() + timeout
+        while True:
+            try:
+                pending = self._rdk_producer.outq_len()
+            except RdKafkaStoppedException:
+                return 0
+            if pending == 0:
+                return 0
+            if deadline is not None and monotonic() >= deadline:
+                return pending
+            self._cluster.handler.sleep(.01)
+
+    def _reserve_buffer_memory(self, size, block=None):
+        # librdkafka enforces queue.buffering.max.kbytes itself
+        return
+
+    def _release_buffer_memory(self, size):
+        return
+
     def _wait_all(self):
         log.info("Blocking until all messages are sent")
         if self._poller_thread is not None:
@@ -160,6 +190,7 @@ class RdKafkaProducer(Producer):
             "compression.codec": map_compression_types[self._compression],
             "batch.num.messages": self._min_queued_messages,
             "message.max.bytes": self._max_request_size,
+            # "queue.buffering.max.kbytes"  # set below if buffer_memory_bytes is
 
             # Report successful and failed messages so we know to dealloc them
             "delivery.report.only.error": "false",
@@ -167,6 +198,9 @@ class RdKafkaProducer(Producer):
             # "dr_cb"
             # "dr_msg_cb"  # gets set in _rd_kafka module
         }
+        if self._buffer_memory_bytes is not None:
+            conf["queue.buffering.max.kbytes"] = max(
+                1, self._buffer_memory_bytes // 1024)
         # broker.version.fallback is incompatible with >-0.10
         if not ver10:
             conf["broker.version.fallback"] = self._broker_version
@@ -58,6 +58,7 @@ class RdKafkaSimpleConsumer(SimpleConsumer):
         callargs = {k: v for k, v in vars().items()
                          if k not in ("self", "__class__")}
         self._rdk_consumer = None
+        self._rdk_consumer_stopped = False
         self._poller_thread = None
         self._stop_poller_thread = cluster.handler.Event()
         self._broker_version = cluster._broker_version
@@ -171,6 +172,24 @@ class RdKafkaSimpleConsumer(SimpleConsumer):
             return super(
                 RdKafkaSimpleConsumer, self).reset_offsets(partition_offsets)
 
+    def seek_to_timestamp(self, timestamp):
+        # Restart, because _rdk_consumer needs its internal offsets resynced
+        with self._stop_start_rdk_consumer():
+            return super(
+                RdKafkaSimpleConsumer, self).seek_to_timestamp(timestamp)
+
+    def add_partitions(self, partitions):
+        # Restart, because _rdk_consumer is started with a fixed set of partitions
+        with self._stop_start_rdk_consumer():
+            return super(
+                RdKafkaSimpleConsumer, self).add_partitions(partitions)
+
+    def remove_partitions(self, partitions):
+        # Restart, because _rdk_consumer is started with a fixed set of partitions
+        with self._stop_start_rdk_consumer():
+            return super(
+                RdKafkaSimpleConsumer, self).remove_partitions(partitions)
+
     @contextmanager
     def _stop_start_rdk_consumer(self):
         """Context manager for methods to temporarily stop _rdk_consumer
@@ -179,16 +198,22 @@ class RdKafkaSimpleConsumer(SimpleConsumer):
         internally in _rdk_consumer.  We'll hold the one in pykafka to be the
         ultimate source of truth.  So whenever offsets are to be changed (other
         than through consume() that is), we need to clobber _rdk_consumer.
+
+        Nested uses (eg add_partitions calling reset_offsets) only stop and
+        restart _rdk_consumer once, in the outermost one.
         """
-        restart_required = self._running and self._rdk_consumer is not None
+        restart_required = (self._running and self._rdk_consumer is not None
+                            and not self._rdk_consumer_stopped)
         if restart_required:
             # Note we must not call a full self.stop() as that would stop
             # SimpleConsumer threads too, and if we'd have to start() again
             # that could have other side effects (eg resetting offsets).
             self._rdk_consumer.stop()
+            self._rdk_consumer_stopped = True
             log.debug("Temporarily stopped _rdk_consumer.")
         yield
         if restart_required:
+            self._rdk_consumer_stopped = False
             self._setup_fetch_workers()
             log.debug("Restarted _rdk_consumer.")
 
@@ -17,7 +17,7 @@ WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 See the License for the specific language governing permissions and
 limitations under the License.
 """
-__all__ = ["SimpleConsumer"]
+__all__ = ["SimpleConsumer", "MultiTopicSimpleConsumer"]
 import itertools
 import logging
 import json
@@ -31,8 +31,9 @@ import weakref
 from six import reraise
 
 from .common import OffsetType
+from .metrics import MetricsRegistry
 from .utils.compat import (Queue, Empty, iteritems, itervalues,
-                           range, iterkeys, get_bytes, get_string)
+                           range, iterkeys, get_bytes, get_string, monotonic)
 from .exceptions import (UnknownError, OffsetOutOfRangeError, UnknownTopicOrPartition,
                          OffsetMetadataTooLarge, GroupLoadInProgress,
                          NotCoordinatorForGroup, SocketDisconnectedError,
@@ -40,7 +41,8 @@ from .exceptions import (UnknownError, OffsetOutOfRangeError, UnknownTopicOrPart
                          NotLeaderForPartition, OffsetRequestFailedError,
                          RequestTimedOut, UnknownMemberId, RebalanceInProgress,
                          IllegalGeneration, ERROR_CODES)
-from .protocol import (PartitionFetchRequest, PartitionOffsetCommitRequest,
+from .protocol import (FetchRequest, FetchResponse, OffsetRequest, OffsetResponse,
+                       PartitionFetchRequest, PartitionOffsetCommitRequest,
                        PartitionOffsetFetchRequest, PartitionOffsetRequest)
 from .utils.error_handlers import (handle_partition_responses, raise_error,
                                    build_parts_by_error, valid_int)
@@ -53,6 +55,9 @@ class SimpleConsumer(object):
     """
     A non-balancing consumer for Kafka
     """
+    # the size of the fetches seek_to_timestamp() uses to probe timestamps
+    _SEEK_PROBE_BYTES = 64 * 1024
+
     def __init__(self,
                  topic,
                  cluster,
@@ -194,29 +199,13 @@ class SimpleConsumer(object):
         self._last_auto_commit = time.time()
         self._worker_exception = None
         self._update_lock = self._cluster.handler.Lock()
+        self._metrics = MetricsRegistry()
 
         self._discover_group_coordinator()
 
-        if partitions is not None:
-            self._partitions = {p: OwnedPartition(p,
-                                                  self._cluster.handler,
-                                                  self._messages_arrived,
-                                                  self._is_compacted_topic,
-                                                  self._consumer_id)
-                                for p in partitions}
-        else:
-            self._partitions = {topic.partitions[k]:
-                                OwnedPartition(p,
-                                               self._cluster.handler,
-                                               self._messages_arrived,
-                                               self._is_compacted_topic,
-                                               self._consumer_id)
-                                for k, p in iteritems(topic.partitions)}
-        self._partitions_by_id = {p.partition.id: p
-                                  for p in itervalues(self._partitions)}
-        # Organize partitions by leader for efficient queries
-        self._setup_partitions_by_leader()
-        self.partition_cycle = itertools.cycle(self._partitions.values())
+        if partitions is None:
+            partitions = itervalues(topic.partitions)
+        self._set_partitions({p: self._own_partition(p) for p in partitions})
 
         self._default_error_handlers = self._build_default_error_handlers()
 
@@ -264,6 +253,119 @@ class SimpleConsumer(object):
 
         self._raise_worker_exceptions()
 
+    def _own_partition(self, partition):
+        """Create the :class:`OwnedPartition` through which to consume `partition`"""
+        return OwnedPartition(partition,
+                              self._cluster.handler,
+                              self._messages_arrived,
+                              self._is_compacted_topic,
+                              self._consumer_id)
+
+    def _set_partitions(self, owned_partitions):
+        """Replace the held partitions and the lookups derived from them
+
+        The lookups are rebuilt and swapped in rather than modified, so that
+        worker threads iterating over the old ones aren't disturbed.
+
+        :param owned_partitions: The partitions to hold
+        :type owned_partitions: dict {:class:`pykafka.partition.Partition`:
+            :class:`OwnedPartition`}
+        """
+        partitions_by_topic = defaultdict(dict)
+        for p in itervalues(owned_partitions):
+            partitions_by_topic[p.partition.topic.name][p.partition.id] = p
+        self._partitions = owned_partitions
+        self._partitions_by_id = {self._partition_key(p.partition): p
+                                  for p in itervalues(owned_partitions)}
+        self._partitions_by_topic = partitions_by_topic
+        # Organize partitions by leader for efficient queries
+        self._setup_partitions_by_leader()
+        self.partition_cycle = itertools.cycle(list(itervalues(owned_partitions)))
+
+    def add_partitions(self, partitions):
+        """Start consuming additional partitions
+
+        Partitions that are already held are ignored. If the consumer is
+        running, the new partitions start from their committed offsets, or
+        from `auto_offset_reset` if there are none (or no consumer group).
+
+        :param partitions: The partitions to add
+        :type partitions: Iterable of :class:`pykafka.partition.Partition`
+        """
+        with self._update_lock:
+            added = {p: self._own_partition(p) for p in partitions
+                     if p not in self._partitions}
+            if not added:
+                return
+            # Keep fetch() away from the new partitions until their offsets
+            # are resolved, or it would start fetching them from offset 0.
+            # They must be published first, as the offset responses are
+            # matched against the partitions held.
+            for owned_partition in itervalues(added):
+                owned_partition.fetch_lock.acquire()
+            owned_partitions = dict(self._partitions)
+            owned_partitions.update(added)
+            self._set_partitions(owned_partitions)
+        try:
+            log.info("Added %d partitions to %s", len(added), self)
+            if self._running:
+                if self._consumer_group is not None:
+                    self._fetch_offsets(list(itervalues(added)))
+                else:
+                    self.reset_offsets(partition_offsets=[
+                        (p, self._auto_offset_reset) for p in added])
+        finally:
+            for owned_partition in itervalues(added):
+                owned_partition.fetch_lock.release()
+        if not self._slot_available.is_set():
+            self._slot_available.set()
+
+    def remove_partitions(self, partitions):
+        """Stop consuming the given partitions
+
+        Messages already fetched from these partitions that haven't been
+        consumed are discarded. Offsets are not committed; call
+        `commit_offsets()` beforehand to preserve them.
+
+        :param partitions: The partitions to remove
+        :type partitions: Iterable of :class:`pykafka.partition.Partition`
+        """
+        with self._update_lock:
+            removed = [self._partitions[p] for p in partitions
+                       if p in self._partitions]
+            if not removed:
+                return
+            owned_partitions = dict(self._partitions)
+            for owned_partition in removed:
+                del owned_partitions[owned_partition.partition]
+            self._set_partitions(owned_partitions)
+        for owned_partition in removed:
+            # wait out a fetch in progress; later ones skip the partition
+            with owned_partition.fetch_lock:
+                owned_partition.flush()
+        log.info("Removed %d partitions from %s", len(removed), self)
+
+    def _set_group_membership(self, generation_id, consumer_id):
+        """Update the generation and member id used in group requests
+
+        :param generation_id: The generation id with which to make group requests
+        :type generation_id: int
+        :param consumer_id: The identifying string to use for this consumer on
+            group requests
+        :type consumer_id: bytes
+        """
+        self._generation_id = generation_id
+        self._consumer_id = consumer_id
+
+    def _partition_key(self, partition):
+        """The key under which `partition` appears in `partitions`"""
+        return partition.id
+
+    @property
+    def _topic_label(self):
+        """The name(s) of the consumed topic(s), for log messages"""
+        return self._topic.name
+
     def _setup_partitions_by_leader(self):
         self._partitions_by_leader = defaultdict(list)
         for p in itervalues(self._partitions):
@@ -336,16 +438,48 @@ class SimpleConsumer(object):
     @property
     def partitions(self):
         """A list of the partitions that this consumer consumes"""
-        return {id_: partition.partition
-                for id_, partition in iteritems(self._partitions_by_id)}
+        return {key: partition.partition
+                for key, partition in iteritems(self._partitions_by_id)}
 
     @property
     def held_offsets(self):
         """Return a map from partition id to held offset for each partition"""
-        return {p.partition.id:
+        return {key:
                 (OffsetType.EARLIEST if p.last_offset_consumed == -1
                  else p.last_offset_consumed)
-                for p in itervalues(self._partitions_by_id)}
+                for key, p in iteritems(self._partitions_by_id)}
+
+    def stats(self):
+        """Take a snapshot of the consumer's internal metrics
+
+        :returns: dict of
+
+            * counters `fetch_requests`, `fetch_errors` (requests that failed
+              to reach the broker) and `messages_fetched`
+            * histograms `fetch_latency_us` and `fetch_batch_messages`, the number
+              of messages in each non-empty partition response (see
+              :meth:`pykafka.metrics.Histogram.snapshot`)
+            * `partitions`, a dict keyed like :attr:`held_offsets` of dicts
+              with `queued_messages`, the messages fetched but not yet
+              consumed, `high_watermark`, the partition's latest offset as of
+              the last fetch, and `lag`, the number of messages between the
+              last consumed one and the high watermark. `high_watermark` and
+              `lag` are None until the partition has been fetched from
+        """
+        stats = self._metrics.stats()
+        for name in ("fetch_requests", "fetch_errors", "messages_fetched"):
+            stats.setdefault(name, 0)
+        partitions = {}
+        for key, op in iteritems(self._partitions_by_id):
+            fetched = op.high_watermark >= 0
+            partitions[key] = {
+                'queued_messages': op.message_count,
+                'high_watermark': op.high_watermark if fetched else None,
+                'lag': (max(0, op.high_watermark - op.last_offset_consumed - 1)
+                        if fetched else None)
+            }
+        stats['partitions'] = partitions
+        return stats
 
     def __del__(self):
         """Stop consumption and workers when object is deleted"""
@@ -473,7 +607,7 @@ class SimpleConsumer(object):
 
         if (time.time() - self._last_auto_commit) * 1000.0 >= self._auto_commit_interval_ms:
             log.debug("Autocommitting consumer offset for consumer group %s and topic %s",
-                      self._consumer_group, self._topic.name)
+                      self._consumer_group, self._topic_label)
             if self._consumer_group is not None:
                 self.commit_offsets()
             self._last_auto_commit = time.time()
@@ -500,7 +634,7 @@ class SimpleConsumer(object):
             except (SocketDisconnectedError, IOError):
                 log.error("Error committing offsets for topic '%s' from consumer id '%s'"
                           "(SocketDisconnectedError)",
-                          self._topic.name, self._consumer_id)
+                          self._topic_label, self._consumer_id)
                 if i >= self._offsets_commit_max_retries - 1:
                     raise
                 self._update()
@@ -509,13 +643,14 @@ class SimpleConsumer(object):
             parts_by_error = handle_partition_responses(
                 self._default_error_handlers,
                 response=response,
-                partitions_by_id=self._partitions_by_id)
+                partitions_by_topic=self._partitions_by_topic)
             if (len(parts_by_error) == 1 and 0 in parts_by_error) or \
                     len(parts_by_error) == 0:
                 break
             log.error("Error committing offsets for topic '%s' from consumer id '%s'"
-                      "(errors: %s)", self._topic.name, self._consumer_id,
-                      {ERROR_CODES[err]: [op.partition.id for op, _ in parts]
+                      "(errors: %s)", self._topic_label, self._consumer_id,
+                      {ERROR_CODES[err]: [self._partition_key(op.partition)
+                                          for op, _ in parts]
                        for err, parts in iteritems(parts_by_error)})
 
             # retry only the partitions that errored
@@ -537,7 +672,15 @@ class SimpleConsumer(object):
         """
         if not self._consumer_group:
             raise Exception("consumer group must be specified to fetch offsets")
-        if not self._partitions:
+        return self._fetch_offsets(list(itervalues(self._partitions)))
+
+    def _fetch_offsets(self, owned_partitions):
+        """Fetch and set the committed offsets of the given partitions
+
+        :param owned_partitions: The partitions for which to fetch offsets
+        :type owned_partitions: list of :class:`OwnedPartition`
+        """
+        if not owned_partitions:
             return []
 
         def _handle_success(parts):
@@ -569,7 +712,7 @@ class SimpleConsumer(object):
             if partition_offsets_to_reset:
                 self.reset_offsets(partition_offsets_to_reset)
 
-        reqs = [p.build_offset_fetch_request() for p in self._partitions.values()]
+        reqs = [p.build_offset_fetch_request() for p in owned_partitions]
         success_responses = []
 
         log.debug("Fetching offsets for %d partitions from broker id %s", len(reqs),
@@ -584,15 +727,16 @@ class SimpleConsumer(object):
                 self._default_error_handlers,
                 response=res,
                 success_handler=_handle_success,
-                partitions_by_id=self._partitions_by_id)
+                partitions_by_topic=self._partitions_by_topic)
 
-            success_responses.extend([(op.partition.id, r)
+            success_responses.extend([(self._partition_key(op.partition), r)
                                       for op, r in parts_by_error.get(0, [])])
             if len(parts_by_error) == 1 and 0 in parts_by_error:
                 return success_responses
             log.error("Error fetching offsets for topic '%s' (errors: %s)",
-                      self._topic.name,
-                      {ERROR_CODES[err]: [op.partition.id for op, _ in parts]
+                      self._topic_label,
+                      {ERROR_CODES[err]: [self._partition_key(op.partition)
+                                          for op, _ in parts]
                        for err, parts in iteritems(parts_by_error)})
 
             self._cluster.handler.sleep(i * (self._offsets_channel_backoff_ms / 1000))
@@ -674,7 +818,8 @@ class SimpleConsumer(object):
 
         for i in range(self._offsets_reset_max_retries):
             # sort offsets to avoid deadlocks
-            sorted_offsets = sorted(iteritems(owned_partition_offsets), key=lambda k: k[0].partition.id)
+            sorted_offsets = sorted(iteritems(owned_partition_offsets),
+                                    key=lambda k: self._partition_key(k[0].partition))
 
             # group partitions by leader
             by_leader = defaultdict(list)
@@ -696,7 +841,7 @@ class SimpleConsumer(object):
                     self._default_error_handlers,
                     response=response,
                     success_handler=_handle_success,
-                    partitions_by_id=self._partitions_by_id)
+                    partitions_by_topic=self._partitions_by_topic)
 
                 if 0 in parts_by_error:
                     # drop successfully reset partitions for next retry
@@ -707,8 +852,9 @@ class SimpleConsumer(object):
                 if not parts_by_error:
                     continue
                 log.error("Error resetting offsets for topic '%s' (errors: %s)",
-                          self._topic.name,
-                          {ERROR_CODES[err]: [op.partition.id for op, _ in parts]
+                          self._topic_label,
+                          {ERROR_CODES[err]: [self._partition_key(op.partition)
+                                              for op, _ in parts]
                            for err, parts in iteritems(parts_by_error)})
 
                 self._cluster.handler.sleep(i * (self._offsets_channel_backoff_ms / 1000))
@@ -730,6 +876,171 @@ class SimpleConsumer(object):
         if self._consumer_group is not None:
             self.commit_offsets()
 
+    def seek_to_timestamp(self, timestamp):
+        """Move every partition to the first message at or after `timestamp`
+
+        Unlike passing a timestamp to `reset_offsets()`, which only finds the
+        start of the log segment holding it, this finds the exact offset. On
+        Kafka 0.10.1 and later (according to the cluster's `broker_version`),
+        the brokers look the offsets up with version 1 of the Offset API.
+        Otherwise, each partition's offset is binary-searched between the
+        segment boundary and the end of the log, probing the timestamps of
+        messages with small fetches. This relies on messages carrying
+        timestamps (message format v1, Kafka 0.10.0 and later) that increase
+        with their offsets; partitions whose messages have no timestamps are
+        moved to the segment boundary.
+
+        All partitions are looked up together, sending one request to each
+        leader broker at a time, and their offsets are then reset in a
+        single pass. Partitions without any message at or after `timestamp`
+        are moved to the end of the log.
+
+        :param timestamp: The time to seek to, in milliseconds since the epoch
+        :type timestamp: int
+        :returns: A dict mapping partition keys (as in `partitions`) to the
+            offset of the next message each partition will consume
+        """
+        self._raise_worker_exceptions()
+        owned_partitions = list(itervalues(self._partitions))
+        response_class = OffsetResponse.get_subclass(self._cluster._broker_version)
+        if response_class.api_version > 0:
+            found = self._request_offsets(
+                {op: timestamp for op in owned_partitions}, response_class)
+            offsets = {op: pres.offset[0] for op, pres in iteritems(found)}
+            at_end = [op for op, offset in iteritems(offsets) if offset == -1]
+            if at_end:
+                latest = self._request_offsets(
+                    {op: OffsetType.LATEST for op in at_end}, response_class)
+                offsets.update((op, pres.offset[0]) for op, pres in iteritems(latest))
+        else:
+            offsets = self._search_offsets(owned_partitions, timestamp)
+
+        log.info("Seeking %d partitions of topic '%s' to timestamp %d",
+                 len(offsets), self._topic_label, timestamp)
+        # sort to avoid deadlocks, as in reset_offsets
+        sorted_offsets = sorted(iteritems(offsets),
+                                key=lambda k: self._partition_key(k[0].partition))
+        for owned_partition, offset in sorted_offsets:
+            owned_partition.fetch_lock.acquire()
+        for owned_partition, offset in sorted_offsets:
+            owned_partition.flush()
+            owned_partition.set_offset(offset - 1)
+        for owned_partition, offset in sorted_offsets:
+            owned_partition.fetch_lock.release()
+
+        if self._consumer_group is not None:
+            self.commit_offsets()
+        return {self._partition_key(op.partition): offset
+                for op, offset in iteritems(offsets)}
+
+    def _request_offsets(self, partition_times, response_class=OffsetResponse):
+        """Look up offsets by time, sending one OffsetRequest to each leader
+
+        The requests to all leaders are in flight at the same time. Partitions
+        that fail are retried as often as in `reset_offsets()`.
+
+        :param partition_times: The time to look up for each partition, which
+            may also be :class:`pykafka.common.OffsetType`
+        :type partition_times: dict {:class:`OwnedPartition`: int}
+        :param response_class: The type of response to expect, which also
+            determines the version of the request
+        :returns: dict {:class:`OwnedPartition`: partition response}
+        """
+        pending = dict(partition_times)
+        results = {}
+        for i in range(self._offsets_reset_max_retries):
+            if i > 0:
+                log.debug("Retrying offset request")
+                self._cluster.handler.sleep(i * (self._offsets_channel_backoff_ms / 1000))
+            by_leader = defaultdict(list)
+            for owned_partition, time_ in iteritems(pending):
+                by_leader[owned_partition.partition.leader].append(
+                    owned_partition.build_offset_request(time_))
+            futures = [broker.handler.request(OffsetRequest(
+                reqs, api_version=response_class.api_version))
+                for broker, reqs in iteritems(by_leader)]
+            for future in futures:
+                parts_by_error = handle_partition_responses(
+                    self._default_error_handlers,
+                    response=future.get(response_class),
+                    partitions_by_topic=self._partitions_by_topic)
+                for owned_partition, pres in parts_by_error.get(0, []):
+                    results[owned_partition] = pres
+                    pending.pop(owned_partition, None)
+            if not pending:
+                return results
+        raise OffsetRequestFailedError("Offset request failed after %d retries",
+                                       self._offsets_reset_max_retries)
+
+    def _search_offsets(self, owned_partitions, timestamp):
+        """Binary-search the offset of the first message at or after `timestamp`
+
+        The search of each partition starts between the start of the log
+        segment holding `timestamp`, as found by version 0 of the Offset API,
+        and the end of the log. Every round sends one FetchRequest to each
+        leader broker, all at the same time, probing `_SEEK_PROBE_BYTES` of
+        every partition, and narrows each range to one side of the first
+        message returned. Probes that can't hold a whole message are retried
+        with `fetch_message_max_bytes`.
+
+        :returns: dict {:class:`OwnedPartition`: int}
+        """
+        lower = self._request_offsets({op: timestamp for op in owned_partitions})
+        upper = self._request_offsets({op: OffsetType.LATEST for op in owned_partitions})
+        no_segment = [op for op, pres in iteritems(lower) if not pres.offset]
+        if no_segment:
+            lower.update(self._request_offsets(
+                {op: OffsetType.EARLIEST for op in no_segment}))
+        ranges = {op: [lower[op].offset[0], upper[op].offset[0]]
+                  for op in owned_partitions}
+
+        response_class = FetchResponse.get_subclass(self._cluster._broker_version)
+        probe_bytes = {op: min(self._SEEK_PROBE_BYTES, self._fetch_message_max_bytes)
+                       for op in owned_partitions}
+        while True:
+            searching = {op: bounds for op, bounds in iteritems(ranges)
+                         if bounds[0] < bounds[1]}
+            if not searching:
+                break
+            by_leader = defaultdict(list)
+            for owned_partition, (lo, hi) in iteritems(searching):
+                by_leader[owned_partition.partition.leader].append(
+                    PartitionFetchRequest(owned_partition.partition.topic.name,
+                                          owned_partition.partition.id,
+                                          (lo + hi) // 2, probe_bytes[owned_partition]))
+            futures = [broker.handler.request(FetchRequest(
+                reqs, timeout=0, min_bytes=1, api_version=response_class.api_version))
+                for broker, reqs in iteritems(by_leader)]
+            for future in futures:
+                parts_by_error = build_parts_by_error(
+                    future.get(response_class),
+                    partitions_by_topic=self._partitions_by_topic)
+                for err, parts in iteritems(parts_by_error):
+                    if err != 0:
+                        raise ERROR_CODES[err]()
+                for owned_partition, pres in parts_by_error.get(0, []):
+                    bounds = searching[owned_partition]
+                    mid = (bounds[0] + bounds[1]) // 2
+                    # compressed message sets may start before the requested offset
+                    message = next((m for m in pres.messages if m.offset >= mid), None)
+                    if (message is None and pres.max_offset > mid and
+                            probe_bytes[owned_partition] < self._fetch_message_max_bytes):
+                        # the probe was too small to hold the message at mid
+                        probe_bytes[owned_partition] = self._fetch_message_max_bytes
+                    elif message is None or message.offset >= bounds[1]:
+                        # nothing between mid and the upper bound
+                        bounds[1] = mid
+                    elif message.timestamp is None or message.timestamp < 0:
+                        log.warning("Messages of partition %s have no timestamps, "
+                                    "seeking to the start of their segment",
+                                    self._partition_key(owned_partition.partition))
+                        bounds[1] = bounds[0]
+                    elif message.timestamp >= timestamp:
+                        bounds[1] = message.offset
+                    else:
+                        bounds[0] = message.offset + 1
+        return {op: bounds[0] for op, bounds in iteritems(ranges)}
+
     def fetch(self):
         """Fetch new messages for all partitions
 
@@ -738,9 +1049,13 @@ class SimpleConsumer(object):
         """
         def _handle_success(parts):
             for owned_partition, pres in parts:
+                owned_partition.high_watermark = pres.max_offset
                 if len(pres.messages) > 0:
                     log.debug("Fetched %s messages for partition %s",
                               len(pres.messages), owned_partition.partition.id)
+                    self._metrics.counter("messages_fetched").inc(len(pres.messages))
+                    self._metrics.histogram("fetch_batch_messages").record(
+                        len(pres.messages))
                     owned_partition.enqueue_messages(pres.messages)
                     log.debug("Partition %s queue holds %s messages",
                               owned_partition.partition.id,
@@ -755,10 +1070,15 @@ class SimpleConsumer(object):
                                   key=lambda k: k[0].id)
         for broker, owned_partitions in sorted_by_leader:
             partition_reqs = {}
-            sorted_offsets = sorted(owned_partitions, key=lambda k: k.partition.id)
+            sorted_offsets = sorted(owned_partitions,
+                                    key=lambda k: self._partition_key(k.partition))
             for owned_partition in sorted_offsets:
                 # attempt to acquire lock, just pass if we can't
                 if owned_partition.fetch_lock.acquire(False):
+                    if self._partitions.get(owned_partition.partition) is not owned_partition:
+                        # removed since sorted_by_leader was taken
+                        owned_partition.fetch_lock.release()
+                        continue
                     partition_reqs[owned_partition] = None
                     if owned_partition.message_count < self._queued_max_messages:
                         fetch_req = owned_partition.build_fetch_request(
@@ -766,12 +1086,17 @@ class SimpleConsumer(object):
                         partition_reqs[owned_partition] = fetch_req
             if partition_reqs:
                 try:
+                    start = monotonic()
                     response = broker.fetch_messages(
                         [a for a in itervalues(partition_reqs) if a],
                         timeout=self._fetch_wait_max_ms,
                         min_bytes=self._fetch_min_bytes
                     )
+                    self._metrics.histogram("fetch_latency_us").record(
+                        (monotonic() - start) * 1000000)
+                    self._metrics.counter("fetch_requests").inc()
                 except (IOError, SocketDisconnectedError):
+                    self._metrics.counter("fetch_errors").inc()
                     unlock_partitions(iterkeys(partition_reqs))
                     if self._running:
                         log.info("Updating cluster in response to error in fetch() "
@@ -780,7 +1105,8 @@ class SimpleConsumer(object):
                     # If the broker dies while we're supposed to stop,
                     # it's fine, and probably an integration test.
                     return
-                parts_by_error = build_parts_by_error(response, self._partitions_by_id)
+                parts_by_error = build_parts_by_error(
+                    response, partitions_by_topic=self._partitions_by_topic)
                 handle_partition_responses(
                     self._default_error_handlers,
                     parts_by_error=parts_by_error,
@@ -789,20 +1115,79 @@ class SimpleConsumer(object):
 
     def _wait_for_slot_available(self):
         """Block until at least one queue has less than `_queued_max_messages`"""
+        owned_partitions = list(itervalues(self._partitions))
         if all(op.message_count >= self._queued_max_messages
-               for op in itervalues(self._partitions)):
-            for op in itervalues(self._partitions):
+               for op in owned_partitions):
+            for op in owned_partitions:
                 op.fetch_lock.acquire()
             if all(op.message_count >= self._queued_max_messages
-                   for op in itervalues(self._partitions)):
+                   for op in owned_partitions):
                 self._slot_available.clear()
-            for op in itervalues(self._partitions):
+            for op in owned_partitions:
                 op.fetch_lock.release()
             while not self._slot_available.is_set():
                 self._cluster.handler.sleep()
                 self._slot_available.wait(5)
 
 
+class MultiTopicSimpleConsumer(SimpleConsumer):
+    """A non-balancing consumer for several topics at once
+
+    Consumes all the given topics through one set of fetcher threads: every
+    fetch cycle sends a single FetchRequest to each broker, covering the
+    partitions of all topics that it leads, and offsets are committed with a
+    single OffsetCommitRequest to the group coordinator.
+
+    Consumed messages carry their topic in `message.partition.topic`. Where
+    :class:`SimpleConsumer` keys partitions by id (as in `partitions`,
+    `held_offsets` and the results of `fetch_offsets()`), this consumer uses
+    `(topic name, partition id)` tuples.
+    """
+    def __init__(self, topics, cluster, consumer_group=None, **kwargs):
+        """Create a MultiTopicSimpleConsumer.
+
+        Accepts all keyword arguments of :class:`SimpleConsumer` except
+        `topic` and `partitions`.
+
+        :param topics: The topics to consume, or a mapping from topics to the
+            partitions of each to consume, where `None` stands for all of them
+        :type topics: Iterable of :class:`pykafka.topic.Topic`, or dict
+            {:class:`pykafka.topic.Topic`: Iterable of
+            :class:`pykafka.partition.Partition` or None}
+        :param cluster: The cluster to which this consumer should connect
+        :type cluster: :class:`pykafka.cluster.Cluster`
+        :param consumer_group: The name of the consumer group this consumer
+            should use for offset committing and fetching.
+        :type consumer_group: bytes
+        """
+        if not isinstance(topics, dict):
+            topics = {topic: None for topic in topics}
+        if not topics:
+            raise ValueError("At least one topic is required")
+        # partitions only hold weak references to their topics
+        self._topics = {topic.name: topic for topic in topics}
+        partitions = []
+        for topic, topic_partitions in iteritems(topics):
+            if topic_partitions is None:
+                topic_partitions = itervalues(topic.partitions)
+            partitions.extend(topic_partitions)
+        super(MultiTopicSimpleConsumer, self).__init__(
+            None, cluster, consumer_group=consumer_group, partitions=partitions,
+            **kwargs)
+
+    def _partition_key(self, partition):
+        return (partition.topic.name, partition.id)
+
+    @property
+    def _topic_label(self):
+        return b", ".join(sorted(self._topics))
+
+    @property
+    def topics(self):
+        """A dict mapping the names of the consumed topics to the topics"""
+        return dict(self._topics)
+
+
 class OwnedPartition(object):
     """A partition that is owned by a SimpleConsumer.
 
@@ -838,6 +1223,8 @@ class OwnedPartition(object):
         self._is_compacted_topic = compacted_topic
         self.last_offset_consumed = -1
         self.next_offset = 0
+        # the partition's latest offset, as reported by the last fetch
+        self.high_watermark = -1
         self.fetch_lock = handler.RLock() if handler is not None else threading.RLock()
         # include consumer id in offset metadata for debugging
         self._offset_metadata = {
@@ -0,0 +1,302 @@
+"""
+Author: Emmett Butler, Keith Bourgoin
+"""
+__license__ = """
+Copyright 2015 Parse.ly, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+__all__ = ["SpillStore"]
+import logging
+import mmap
+import os
+import struct
+from zlib import crc32
+
+from .protocol import MessageSet
+from .utils.error_handlers import valid_int
+
+log = logging.getLogger(__name__)
+
+
+class SpillStore(object):
+    """A bounded, disk-backed queue of message batches for the producer
+
+    When passed to :class:`pykafka.producer.Producer` as `spill_store`,
+    messages that don't fit into the producer's in-memory queues are appended
+    here instead, and replayed in order once the brokers catch up.
+
+    Batches are stored as records in memory-mapped segment files of
+    `segment_bytes` each, in the directory `path`. Every record holds the
+    batch in Kafka's MessageSet encoding, prefixed by::
+
+        Record => Length Crc TopicName PartitionId MessageSet
+          Length => int32 (size of TopicName, PartitionId and MessageSet)
+          Crc => uint32 (of TopicName, PartitionId and MessageSet)
+          TopicName => string
+          PartitionId => int32
+
+    A record's length is written last, and segments are zero-filled, so a
+    record that was cut short by a crash reads as the end of the data. The
+    position up to which records have been delivered is kept in a separate,
+    checksummed cursor file. After a crash, replay resumes from that cursor,
+    so records may be delivered more than once but are not lost. Segments
+    are flushed to disk when they fill up, on `flush()` and on `close()`;
+    between those points durability relies on the operating system's page
+    cache.
+
+    A `SpillStore` is not thread-safe; the producer serializes access to it.
+    """
+    _CURSOR_FILE = "cursor"
+    _SEGMENT_SUFFIX = ".spill"
+    _HEADER_SIZE = 14  # of a record with an empty topic name
+
+    def __init__(self, path, max_bytes=1024 ** 3, segment_bytes=64 * 1024 ** 2):
+        """
+        :param path: The directory in which to keep segment files. It is
+            created if it doesn't exist.
+        :type path: str
+        :param max_bytes: The maximum disk space (in bytes) that segment files
+            may take up. Batches that don't fit are refused.
+        :type max_bytes: int
+        :param segment_bytes: The size (in bytes) of a single segment file.
+            This is also the upper bound on the size of a single batch.
+        :type segment_bytes: int
+        """
+        self._path = path
+        self._max_bytes = valid_int(max_bytes)
+        self._segment_bytes = valid_int(segment_bytes)
+        if self._segment_bytes < self._HEADER_SIZE:
+            raise ValueError("segment_bytes must be at least {}".format(
+                self._HEADER_SIZE))
+        if self._segment_bytes > self._max_bytes:
+            raise ValueError("segment_bytes cannot exceed max_bytes")
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self._segments = {}  # segment number -> (file, mmap)
+        self._cursor_file = None
+        self._cursor_map = None
+        self._recover()
+
+    def __repr__(self):
+        return "<{module}.{name} at {id_} (path={path})>".format(
+            module=self.__class__.__module__,
+            name=self.__class__.__name__,
+            id_=hex(id(self)),
+            path=self._path
+        )
+
+    @property
+    def disk_bytes(self):
+        """The disk space (in bytes) reserved by segment files"""
+        return sum(len(mm) for _, mm in self._segments.values())
+
+    def empty(self):
+        """Whether all appended records have been read"""
+        self._advance_read()
+        return self._read == self._write
+
+    def append(self, topic_name, partition_id, messages):
+        """Append a batch of messages for a single partition
+
+        :param topic_name: The name of the topic the messages are bound for
+        :type topic_name: bytes
+        :param partition_id: The id of the partition the messages are bound for
+        :type partition_id: int
+        :param messages: The messages to store
+        :type messages: iterable of :class:`pykafka.protocol.Message`
+        :returns: The position of the new record, or `None` if it doesn't fit
+            within `max_bytes` or a single segment
+        """
+        mset = MessageSet(messages=list(messages))
+        prefix = struct.pack('!h%dsi' % len(topic_name), len(topic_name),
+                             topic_name, partition_id)
+        length = len(prefix) + len(mset)
+        record_size = 8 + length
+        if record_size > self._segment_bytes:
+            return None
+        seq, offset = self._write
+        mm = self._segments[seq][1]
+        if offset + record_size > len(mm):
+            if len(self._segments) * self._segment_bytes + self._segment_bytes > \
+                    self._max_bytes:
+                return None
+            mm.flush()
+            seq, offset = seq + 1, 0
+            mm = self._create_segment(seq)
+        mm[offset + 8:offset + 8 + len(prefix)] = prefix
+        mset.pack_into(mm, offset + 8 + len(prefix))
+        crc = crc32(mm[offset + 8:offset + 8 + length]) & 0xffffffff
+        # the length goes last: until it's written, the record doesn't exist
+        struct.pack_into('!I', mm, offset + 4, crc)
+        struct.pack_into('!i', mm, offset, length)
+        self._write = (seq, offset + record_size)
+        return (seq, offset)
+
+    def read(self):
+        """Read the next record
+
+        Reading doesn't remove the record; see `commit()`.
+
+        :returns: `None` if there are no unread records, otherwise a 5-tuple
+            of the record's position, the position following it, the topic
+            name, the partition id and the list of
+            :class:`pykafka.protocol.Message`
+        """
+        self._advance_read()
+        if self._read == self._write:
+            return None
+        seq, offset = self._read
+        topic_name, partition_id, payload, next_offset = self._record_at(seq, offset)
+        self._read = (seq, next_offset)
+        messages = MessageSet.decode(payload, partition_id=partition_id).messages
+        return ((seq, offset), (seq, next_offset), topic_name, partition_id,
+                messages)
+
+    def commit(self, position):
+        """Mark all records before `position` as delivered
+
+        Segment files that hold only delivered records are deleted.
+
+        :param position: A position as returned by `read()`
+        """
+        seq, offset = position
+        head = struct.pack('!qq', seq, offset)
+        self._cursor_map[:len(head)] = head
+        struct.pack_into('!I', self._cursor_map, len(head),
+                         crc32(head) & 0xffffffff)
+        delete = [s for s in self._segments if s < seq]
+        if delete:
+            # make sure the cursor has moved on before the data is gone
+            self._cursor_map.flush()
+            for s in delete:
+                self._close_segment(s, delete=True)
+
+    def flush(self):
+        """Flush all segments and the cursor to disk"""
+        for _, mm in self._segments.values():
+            mm.flush()
+        self._cursor_map.flush()
+
+    def close(self):
+        """Flush and close all files"""
+        if self._cursor_map is None:
+            return
+        self.flush()
+        for seq in list(self._segments):
+            self._close_segment(seq)
+        self._cursor_map.close()
+        self._cursor_file.close()
+        self._cursor_map = None
+
+    def _segment_path(self, seq):
+        return os.path.join(self._path, "{:020d}{}".format(seq, self._SEGMENT_SUFFIX))
+
+    def _create_segment(self, seq):
+        """Create, preallocate and map segment number `seq`"""
+        f = open(self._segment_path(seq), "w+b")
+        f.truncate(self._segment_bytes)
+        return self._map_segment(seq, f)
+
+    def _map_segment(self, seq, f):
+        mm = mmap.mmap(f.fileno(), 0)
+        self._segments[seq] = (f, mm)
+        return mm
+
+    def _close_segment(self, seq, delete=False):
+        f, mm = self._segments.pop(seq)
+        mm.close()
+        f.close()
+        if delete:
+            os.remove(self._segment_path(seq))
+
+    def _record_at(self, seq, offset):
+        """Return the valid record at `offset` in segment `seq`, or None
+
+        :returns: `None` or a 4-tuple of the topic name, the partition id, the
+            MessageSet bytes and the offset following the record
+        """
+        mm = self._segments[seq][1]
+        if offset + self._HEADER_SIZE > len(mm):
+            return None
+        length, crc = struct.unpack_from('!iI', mm, offset)
+        end = offset + 8 + length
+        if length < self._HEADER_SIZE - 8 or end > len(mm):
+            return None
+        data = mm[offset + 8:end]
+        if crc32(data) & 0xffffffff != crc:
+            log.warning("Corrupt record at %d in %s, ignoring the rest of the segment",
+                        offset, self._segment_path(seq))
+            return None
+        topic_length, = struct.unpack_from('!h', data, 0)
+        topic_name = data[2:2 + topic_length]
+        partition_id, = struct.unpack_from('!i', data, 2 + topic_length)
+        return topic_name, partition_id, data[6 + topic_length:], end
+
+    def _advance_read(self):
+        """Move the read position past the end of fully read segments"""
+        while self._read != self._write:
+            seq, offset = self._read
+            if seq == self._write[0] or self._record_at(seq, offset) is not None:
+                return
+            self._read = (seq + 1, 0)
+
+    def _recover(self):
+        """Map existing segment files and find the read and write positions"""
+        cursor_path = os.path.join(self._path, self._CURSOR_FILE)
+        if not os.path.exists(cursor_path):
+            head = struct.pack('!qq', 0, 0)
+            with open(cursor_path, "wb") as f:
+                f.write(head + struct.pack('!I', crc32(head) & 0xffffffff))
+        self._cursor_file = open(cursor_path, "r+b")
+        self._cursor_map = mmap.mmap(self._cursor_file.fileno(), 20)
+        seq, offset, crc = struct.unpack_from('!qqI', self._cursor_map, 0)
+        cursor = None
+        if crc32(self._cursor_map[:16]) & 0xffffffff == crc:
+            cursor = (seq, offset)
+
+        existing = sorted(
+            int(name[:-len(self._SEGMENT_SUFFIX)])
+            for name in os.listdir(self._path)
+            if name.endswith(self._SEGMENT_SUFFIX))
+        if cursor is None:
+            if existing:
+                log.warning("Invalid cursor in %s, replaying all segments",
+                            self._path)
+            cursor = (existing[0] if existing else 0, 0)
+        for seq in existing:
+            if seq < cursor[0] or os.path.getsize(self._segment_path(seq)) == 0:
+                os.remove(self._segment_path(seq))
+            else:
+                self._map_segment(seq, open(self._segment_path(seq), "r+b"))
+
+        if not self._segments:
+            self._create_segment(cursor[0])
+            cursor = (cursor[0], 0)
+        elif cursor[0] not in self._segments:
+            cursor = (min(self._segments), 0)
+        last = max(self._segments)
+        # everything in the last segment up to the first invalid record is
+        # intact, anything after it was cut short
+        offset = 0
+        while True:
+            record = self._record_at(last, offset)
+            if record is None:
+                break
+            offset = record[3]
+        self._write = (last, offset)
+        self._read = cursor
+        if self._read > self._write:
+            self._read = self._write
+        if not self.empty():
+            log.info("Found spilled messages to replay in %s", self._path)
@@ -0,0 +1,874 @@
+"""
+Author: Emmett Butler
+
+An in-process fake Kafka cluster for tests and benchmarks
+
+The brokers listen on localhost ports and speak the parts of the wire
+protocol that pykafka uses: Metadata, Produce, Fetch, Offset, OffsetCommit,
+OffsetFetch, GroupCoordinator and the group membership and administration
+APIs. Partition logs are kept in memory and there is no replication, so a
+partition is only ever served by its leader.
+
+Notable differences from a real cluster:
+
+1. compressed message sets are stored (and fetched) decompressed
+2. messages without timestamps are given their append time, so that
+   timestamp offset lookups work for all of them
+3. offset lookups by time (version 0) treat each partition as one segment
+4. every request can be delayed by a configurable latency, which makes
+   timings on a single machine repeatable
+"""
+__license__ = """
+Copyright 2015 Parse.ly, Inc.
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+__all__ = ["FakeBroker", "FakeKafkaCluster"]
+import logging
+import socket
+import struct
+import threading
+import time
+import uuid
+from zlib import crc32
+
+from six.moves import socketserver
+
+from pykafka.common import CompressionType
+from pykafka.exceptions import (IllegalGeneration, InconsistentGroupProtocol,
+                                NotCoordinatorForGroup, NotLeaderForPartition,
+                                OffsetOutOfRangeError, RebalanceInProgress,
+                                UnknownMemberId, UnknownTopicOrPartition)
+from pykafka.protocol import Message
+from pykafka.utils import compression, struct_helpers
+from pykafka.utils.compat import get_bytes, iteritems, range
+
+
+log = logging.getLogger(__name__)
+
+
+def _pack(fmt, values):
+    """Serialize `values` according to a `struct_helpers.unpack_from` format
+
+    This is the inverse of :func:`pykafka.utils.struct_helpers.unpack_from`:
+    arrays (`[]`) take a sequence of tuples, or of plain values if the array
+    holds a single field, and strings (`S`) and byte arrays (`Y`) may be None.
+
+    :returns: :class:`bytes`
+    """
+    output = []
+    _pack_fields(fmt.replace(' ', ''), values, output)
+    return b''.join(output)
+
+
+def _pack_fields(fmt, values, output):
+    values = iter(values)
+    i = 0
+    while i < len(fmt):
+        ch = fmt[i]
+        if ch == '[':
+            depth, end = 1, i + 1
+            while depth:
+                depth += {'[': 1, ']': -1}.get(fmt[end], 0)
+                end += 1
+            array_fmt = fmt[i + 1:end - 1]
+            items = next(values)
+            output.append(struct.pack('!i', len(items)))
+            for item in items:
+                _pack_fields(array_fmt, item if len(array_fmt) > 1 else (item,),
+                             output)
+            i = end
+            continue
+        value = next(values)
+        if ch in 'SY':
+            len_fmt = '!h' if ch == 'S' else '!i'
+            if value is None:
+                output.append(struct.pack(len_fmt, -1))
+            else:
+                output.append(struct.pack(len_fmt, len(value)))
+                output.append(bytes(value))
+        else:
+            output.append(struct.pack('!' + ch, value))
+        i += 1
+
+
+def _split_message_set(buff):
+    """Get the uncompressed messages out of a serialized MessageSet
+
+    :returns: generator of (serialized message, timestamp or None)
+    """
+    offset = 0
+    while offset + 12 <= len(buff):
+        _, size = struct.unpack_from('!qi', buff, offset)
+        offset += 12
+        raw = bytes(buff[offset:offset + size])
+        offset += size
+        if len(raw) < size:
+            break  # truncated, as the protocol allows
+        magic, attributes = struct.unpack_from('!BB', raw, 4)
+        codec = attributes & 0x07
+        if codec == CompressionType.NONE:
+            timestamp = None
+            if magic > 0:
+                timestamp, = struct.unpack_from('!q', raw, 6)
+            yield raw, timestamp
+            continue
+        value = Message.decode(raw).value
+        if codec == CompressionType.GZIP:
+            decompressed = compression.decode_gzip(value)
+        elif codec == CompressionType.SNAPPY:
+            decompressed = compression.decode_snappy(value)
+        else:
+            raise ValueError("Unknown compression: {}".format(codec))
+        for item in _split_message_set(decompressed):
+            yield item
+
+
+class _PartitionLog(object):
+    """The messages of one partition, serialized as MessageSet entries"""
+    def __init__(self, leader_id, replica_ids):
+        self.leader_id = leader_id
+        self.replica_ids = replica_ids
+        self._entries = []
+        self._timestamps = []
+
+    @property
+    def earliest_offset(self):
+        return 0
+
+    @property
+    def latest_offset(self):
+        return len(self._entries)
+
+    def append(self, messages):
+        """Append serialized messages
+
+        :param messages: Messages as returned by `_split_message_set`
+        :returns: The offset of the first message appended
+        """
+        base_offset = len(self._entries)
+        append_time = int(time.time() * 1000)
+        for raw, timestamp in messages:
+            self._entries.append(
+                struct.pack('!qi', len(self._entries), len(raw)) + raw)
+            self._timestamps.append(
+                append_time if timestamp is None or timestamp < 0 else timestamp)
+        return base_offset
+
+    def read(self, offset, max_bytes):
+        """Get serialized MessageSet entries starting at `offset`
+
+        Like Kafka, returns a truncated message if the first one doesn't fit
+        into `max_bytes`, so that the client can tell it needs to fetch more.
+        """
+        output, size = [], 0
+        for i in range(offset, len(self._entries)):
+            entry = self._entries[i]
+            if size + len(entry) > max_bytes:
+                if not output:
+                    output.append(entry[:max_bytes])
+                break
+            output.append(entry)
+            size += len(entry)
+        return b''.join(output)
+
+    def offsets_before(self, timestamp, max_offsets):
+        """Answer a version 0 offset request, treating the log as one segment"""
+        if timestamp == -1:
+            offsets = [self.latest_offset]
+        elif timestamp == -2:
+            offsets = [self.earliest_offset]
+        elif self._timestamps and self._timestamps[0] <= timestamp:
+            offsets = [self.earliest_offset]
+        else:
+            offsets = []
+        return offsets[:max_offsets]
+
+    def offset_for_time(self, timestamp):
+        """Answer a version 1 offset request
+
+        :returns: (timestamp, offset)
+        """
+        if timestamp == -1:
+            return -1, self.latest_offset
+        elif timestamp == -2:
+            return -1, self.earliest_offset
+        for offset, message_time in enumerate(self._timestamps):
+            if message_time >= timestamp:
+                return message_time, offset
+        return -1, -1
+
+
+class _GroupMember(object):
+    def __init__(self, member_id, client_id, client_host):
+        self.member_id = member_id
+        self.client_id = client_id
+        self.client_host = client_host
+        self.session_timeout = 30000
+        self.protocols = []
+        self.last_seen = time.time()
+
+    def expired(self, now):
+        return now - self.last_seen > self.session_timeout / 1000.0
+
+
+class _Group(object):
+    """State of a consumer group, as managed by its coordinator
+
+    Follows Kafka's group state machine: a join starts a rebalance that
+    completes once every known member has rejoined (or the rebalance timed
+    out), after which the leader's SyncGroup hands out the assignments.
+    """
+    def __init__(self, group_id, lock):
+        self.group_id = group_id
+        self._lock = lock
+        self.state = b'Empty'
+        self.members = {}
+        self.generation_id = 0
+        self.leader_id = b''
+        self.protocol_type = b''
+        self.protocol = b''
+        self.assignments = {}
+        self.joining = []
+        self.join_round = 0
+        self.join_result = None
+        self.rebalance_deadline = None
+
+    def expire_members(self, now):
+        """Drop members whose session timed out, rebalancing if needed"""
+        expired = [member_id for member_id, member in iteritems(self.members)
+                   if member.expired(now) and member_id not in self.joining]
+        for member_id in expired:
+            log.debug("Member %s of group %s expired", member_id, self.group_id)
+            del self.members[member_id]
+        if expired:
+            self.begin_rebalance(now)
+
+    def begin_rebalance(self, now):
+        """Start a rebalance, waking up members waiting to sync"""
+        self._lock.notify_all()
+        if not self.members:
+            self.state = b'Empty'
+            self.joining = []
+            return
+        if self.state != b'PreparingRebalance':
+            self.state = b'PreparingRebalance'
+            self.joining = []
+            # Kafka uses the session timeout as rebalance timeout for JoinGroup
+            # version 0
+            self.rebalance_deadline = now + max(
+                member.session_timeout for member in self.members.values()) / 1000.0
+
+    def rebalance_done(self):
+        return all(member_id in self.joining for member_id in self.members)
+
+    def complete_rebalance(self):
+        """Start a new generation with the members that rejoined"""
+        for member_id in list(self.members):
+            if member_id not in self.joining:
+                del self.members[member_id]
+        self.generation_id += 1
+        self.leader_id = self.joining[0]
+        # the first protocol of the leader's that all members support
+        protocols = [set(name for name, _ in member.protocols)
+                     for member in self.members.values()]
+        self.protocol = next(
+            (name for name, _ in self.members[self.leader_id].protocols
+             if all(name in names for names in protocols)), b'')
+        self.assignments = {}
+        self.state = b'AwaitingSync'
+        members = [(member_id, dict(member.protocols).get(self.protocol, b''))
+                   for member_id, member in iteritems(self.members)]
+        self.join_result = (self.generation_id, self.protocol, self.leader_id,
+                            members)
+        self.joining = []
+        self.join_round += 1
+
+
+class _FakeBrokerRequestHandler(socketserver.BaseRequestHandler):
+    """Serves the requests of one client connection, one after another"""
+    def setup(self):
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.fake_broker._connections.add(self.request)
+
+    def finish(self):
+        self.server.fake_broker._connections.discard(self.request)
+
+    def handle(self):
+        broker = self.server.fake_broker
+        while True:
+            size = self._recv(4)
+            if size is None:
+                return
+            buff = self._recv(struct.unpack('!i', size)[0])
+            if buff is None:
+                return
+            api_key, api_version, correlation_id, client_id_len = \
+                struct.unpack_from('!hhih', buff, 0)
+            offset = 10 + max(client_id_len, 0)
+            client_id = buff[10:offset]
+            response = broker.handle_request(api_key, api_version, buff, offset,
+                                             client_id, self.client_address[0])
+            if broker.latency_ms:
+                time.sleep(broker.latency_ms / 1000.0)
+            if response is not None:
+                self.request.sendall(
+                    struct.pack('!ii', len(response) + 4, correlation_id) + response)
+
+    def _recv(self, size):
+        chunks = []
+        while size:
+            try:
+                chunk = self.request.recv(size)
+            except socket.error:
+                return None
+            if not chunk:
+                return None
+            chunks.append(chunk)
+            size -= len(chunk)
+        return b''.join(chunks)
+
+
+class _ThreadingTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class FakeBroker(object):
+    """One broker of a :class:`FakeKafkaCluster`
+
+    :ivar latency_ms: Delay added to every response from this broker, in
+        milliseconds
+    """
+    def __init__(self, cluster, id_, host='127.0.0.1', port=0, latency_ms=0):
+        """Start listening for requests
+
+        :param cluster: The cluster holding the state this broker serves
+        :type cluster: :class:`FakeKafkaCluster`
+        :param id_: The broker id
+        :type id_: int
+        :param host: The address to listen on
+        :type host: str
+        :param port: The port to listen on. 0 picks a free port.
+        :type port: int
+        :param latency_ms: Delay added to every response, in milliseconds
+        :type latency_ms: int
+        """
+        self._cluster = cluster
+        self.id = id_
+        self.latency_ms = latency_ms
+        self._connections = set()
+        self._server = _ThreadingTCPServer((host, port), _FakeBrokerRequestHandler)
+        self._server.fake_broker = self
+        self.host, self.port = self._server.server_address[:2]
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="FakeBroker-{}".format(id_))
+        self._thread.daemon = True
+        self._thread.start()
+        self._handlers = {
+            0: self._produce,
+            1: self._fetch,
+            2: self._list_offsets,
+            3: self._metadata,
+            8: self._offset_commit,
+            9: self._offset_fetch,
+            10: self._group_coordinator,
+            11: self._join_group,
+            12: self._heartbeat,
+            13: self._leave_group,
+            14: self._sync_group,
+            15: self._describe_groups,
+            16: self._list_groups,
+        }
+
+    def __repr__(self):
+        return "<{module}.{name} {id_} at {host}:{port}>".format(
+            module=self.__class__.__module__,
+            name=self.__class__.__name__,
+            id_=self.id,
+            host=self.host,
+            port=self.port
+        )
+
+    def stop(self):
+        """Stop listening and drop all client connections"""
+        self._server.shutdown()
+        self._server.server_close()
+        for connection in list(self._connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        self._thread.join()
+
+    def handle_request(self, api_key, api_version, buff, offset, client_id,
+                       client_host):
+        """Answer one request
+
+        :returns: The serialized response body, or None if there is none
+        """
+        handler = self._handlers.get(api_key)
+        if handler is None:
+            raise NotImplementedError(
+                "Fake broker does not support API key {}".format(api_key))
+        return handler(api_version, buff, offset, client_id, client_host)
+
+    def _partition_error(self, topic_name, partition_id):
+        """Get the error code for serving a partition from this broker"""
+        partition = self._cluster._get_partition(topic_name, partition_id)
+        if partition is None:
+            return UnknownTopicOrPartition.ERROR_CODE, None
+        if partition.leader_id != self.id:
+            return NotLeaderForPartition.ERROR_CODE, None
+        return 0, partition
+
+    def _coordinator_error(self, group_id):
+        if self._cluster._get_coordinator_id(group_id) != self.id:
+            return NotCoordinatorForGroup.ERROR_CODE
+        return 0
+
+    def _metadata(self, api_version, buff, offset, client_id, client_host):
+        topic_names = struct_helpers.unpack_from('[S]', buff, offset)
+        cluster = self._cluster
+        with cluster._lock:
+            if not topic_names:
+                topic_names = sorted(cluster._topics)
+            topics = []
+            for topic_name in topic_names:
+                partitions = cluster._topics.get(topic_name)
+                if partitions is None and cluster.auto_create_topics:
+                    partitions = cluster._create_topic(
+                        topic_name, cluster.default_num_partitions, 1)
+                if partitions is None:
+                    topics.append((UnknownTopicOrPartition.ERROR_CODE,
+                                   topic_name, []))
+                    continue
+                topics.append((0, topic_name, [
+                    (0, partition_id, partition.leader_id, partition.replica_ids,
+                     partition.replica_ids)
+                    for partition_id, partition in enumerate(partitions)]))
+            brokers = [(broker.id, get_bytes(broker.host), broker.port)
+                       for broker in cluster.broker_servers.values()]
+        return _pack('[iSi] [hS [hii [i] [i] ] ]', (brokers, topics))
+
+    def _produce(self, api_version, buff, offset, client_id, client_host):
+        required_acks, _, topics = struct_helpers.unpack_from(
+            'hi [S [iY] ]', buff, offset)
+        cluster = self._cluster
+        response = []
+        with cluster._lock:
+            for topic_name, partitions in topics:
+                results = []
+                for partition_id, message_set in partitions:
+                    err, partition = self._partition_error(topic_name, partition_id)
+                    base_offset = -1
+                    if partition is not None:
+                        base_offset = partition.append(
+                            _split_message_set(message_set))
+                    results.append((partition_id, err, base_offset))
+                response.append((topic_name, results))
+            cluster._lock.notify_all()
+        if required_acks == 0:
+            return None
+        return _pack('[S [ihq] ]', (response,))
+
+    def _fetch(self, api_version, buff, offset, client_id, client_host):
+        _, max_wait_ms, min_bytes, topics = struct_helpers.unpack_from(
+            'iii [S [iqi] ]', buff, offset)
+        cluster = self._cluster
+        deadline = time.time() + max_wait_ms / 1000.0
+        with cluster._lock:
+            while True:
+                response, num_bytes, failed = [], 0, False
+                for topic_name, partitions in topics:
+                    results = []
+                    for partition_id, fetch_offset, max_bytes in partitions:
+                        err, partition = self._partition_error(topic_name,
+                                                               partition_id)
+                        highwater_mark, data = -1, b''
+                        if partition is not None:
+                            highwater_mark = partition.latest_offset
+                            if not (partition.earliest_offset <= fetch_offset
+                                    <= highwater_mark):
+                                err = OffsetOutOfRangeError.ERROR_CODE
+                            else:
+                                data = partition.read(fetch_offset, max_bytes)
+                        failed = failed or err != 0
+                        num_bytes += len(data)
+                        results.append((partition_id, err, highwater_mark, data))
+                    response.append((topic_name, results))
+                remaining = deadline - time.time()
+                if failed or num_bytes >= min_bytes or remaining <= 0:
+                    break
+                cluster._lock.wait(remaining)
+        if api_version == 0:
+            return _pack('[S [ihqY] ]', (response,))
+        return _pack('i [S [ihqY] ]', (0, response))
+
+    def _list_offsets(self, api_version, buff, offset, client_id, client_host):
+        if api_version == 0:
+            _, topics = struct_helpers.unpack_from('i [S [iqi] ]', buff, offset)
+        else:
+            _, topics = struct_helpers.unpack_from('i [S [iq] ]', buff, offset)
+        response = []
+        with self._cluster._lock:
+            for topic_name, partitions in topics:
+                results = []
+                for partition_request in partitions:
+                    partition_id, timestamp = partition_request[:2]
+                    err, partition = self._partition_error(topic_name,
+                                                           partition_id)
+                    if api_version == 0:
+                        offsets = []
+                        if partition is not None:
+                            offsets = partition.offsets_before(
+                                timestamp, partition_request[2])
+                        results.append((partition_id, err, offsets))
+                    else:
+                        found = (-1, -1)
+                        if partition is not None:
+                            found = partition.offset_for_time(timestamp)
+                        results.append((partition_id, err) + found)
+                response.append((topic_name, results))
+        if api_version == 0:
+            return _pack('[S [ih [q] ] ]', (response,))
+        return _pack('[S [ihqq] ]', (response,))
+
+    def _group_coordinator(self, api_version, buff, offset, client_id,
+                           client_host):
+        group_id = struct_helpers.unpack_from('S', buff, offset)[0]
+        coordinator = self._cluster.broker_servers[
+            self._cluster._get_coordinator_id(group_id)]
+        return _pack('hiSi', (0, coordinator.id, get_bytes(coordinator.host),
+                              coordinator.port))
+
+    def _offset_commit(self, api_version, buff, offset, client_id, client_host):
+        if api_version == 0:
+            group_id, topics = struct_helpers.unpack_from(
+                'S [S [iqS] ]', buff, offset)
+            generation_id, member_id = -1, b''
+        elif api_version == 1:
+            group_id, generation_id, member_id, topics = \
+                struct_helpers.unpack_from('SiS [S [iqqS] ]', buff, offset)
+        else:
+            group_id, generation_id, member_id, _, topics = \
+                struct_helpers.unpack_from('SiSq [S [iqS] ]', buff, offset)
+        cluster = self._cluster
+        with cluster._lock:
+            err = self._coordinator_error(group_id)
+            group = cluster._groups.get(group_id)
+            if not err and generation_id >= 0 and group is not None \
+                    and group.members:
+                if member_id not in group.members:
+                    err = UnknownMemberId.ERROR_CODE
+                elif generation_id != group.generation_id:
+                    err = IllegalGeneration.ERROR_CODE
+            response = []
+            for topic_name, partitions in topics:
+                results = []
+                for partition_request in partitions:
+                    partition_id, committed_offset = partition_request[:2]
+                    if not err:
+                        cluster._offsets[(group_id, topic_name, partition_id)] = (
+                            committed_offset, partition_request[-1] or b'')
+                    results.append((partition_id, err))
+                response.append((topic_name, results))
+        return _pack('[S [ih] ]', (response,))
+
+    def _offset_fetch(self, api_version, buff, offset, client_id, client_host):
+        group_id, topics = struct_helpers.unpack_from('S [S [i] ]', buff, offset)
+        cluster = self._cluster
+        with cluster._lock:
+            err = self._coordinator_error(group_id)
+            response = []
+            for topic_name, partition_ids in topics:
+                results = []
+                for partition_id in partition_ids:
+                    committed_offset, metadata = cluster._offsets.get(
+                        (group_id, topic_name, partition_id), (-1, b''))
+                    results.append((partition_id, committed_offset, metadata, err))
+                response.append((topic_name, results))
+        return _pack('[S [iqSh] ]', (response,))
+
+    def _join_group(self, api_version, buff, offset, client_id, client_host):
+        group_id, session_timeout, member_id, protocol_type, protocols = \
+            struct_helpers.unpack_from('SiSS [SY]', buff, offset)
+        cluster = self._cluster
+        with cluster._lock:
+            err = self._coordinator_error(group_id)
+            group = cluster._groups.get(group_id)
+            if group is None:
+                group = cluster._groups[group_id] = _Group(group_id, cluster._lock)
+            now = time.time()
+            group.expire_members(now)
+            if not err and member_id and member_id not in group.members:
+                err = UnknownMemberId.ERROR_CODE
+            if not err and group.members and protocol_type != group.protocol_type:
+                err = InconsistentGroupProtocol.ERROR_CODE
+            if err:
+                return _pack('hiSSS [SY]', (err, -1, b'', b'', member_id, []))
+            if not member_id:
+                member_id = client_id + b'-' + get_bytes(str(uuid.uuid4()))
+                group.members[member_id] = _GroupMember(member_id, client_id,
+                                                        get_bytes(client_host))
+            member = group.members[member_id]
+            member.session_timeout = session_timeout
+            member.protocols = protocols
+            member.last_seen = now
+            group.protocol_type = protocol_type
+            group.begin_rebalance(now)
+            if member_id not in group.joining:
+                group.joining.append(member_id)
+            join_round = group.join_round
+            while group.join_round == join_round:
+                now = time.time()
+                group.expire_members(now)
+                if group.rebalance_done() or now >= group.rebalance_deadline:
+                    group.complete_rebalance()
+                    cluster._lock.notify_all()
+                    break
+                cluster._lock.wait(group.rebalance_deadline - now)
+            if member_id not in group.members:
+                return _pack('hiSSS [SY]', (UnknownMemberId.ERROR_CODE, -1, b'',
+                                            b'', member_id, []))
+            member.last_seen = time.time()
+            generation_id, protocol, leader_id, members = group.join_result
+            if member_id != leader_id:
+                members = []
+        return _pack('hiSSS [SY]', (0, generation_id, protocol, leader_id,
+                                    member_id, members))
+
+    def _check_member(self, group, generation_id, member_id):
+        """Get the error code for a request of an existing group member"""
+        if group is None or member_id not in group.members:
+            return UnknownMemberId.ERROR_CODE
+        if group.state == b'PreparingRebalance':
+            return RebalanceInProgress.ERROR_CODE
+        if generation_id != group.generation_id:
+            return IllegalGeneration.ERROR_CODE
+        return 0
+
+    def _sync_group(self, api_version, buff, offset, client_id, client_host):
+        group_id, generation_id, member_id, assignments = \
+            struct_helpers.unpack_from('SiS [SY]', buff, offset)
+        cluster = self._cluster
+        with cluster._lock:
+            group = cluster._groups.get(group_id)
+            if group is not None:
+                group.expire_members(time.time())
+            err = (self._coordinator_error(group_id)
+                   or self._check_member(group, generation_id, member_id))
+            if err:
+                return _pack('hY', (err, b''))
+            group.members[member_id].last_seen = time.time()
+            if member_id == group.leader_id and group.state == b'AwaitingSync':
+                group.assignments = dict(assignments)
+                group.state = b'Stable'
+                cluster._lock.notify_all()
+            deadline = time.time() + (
+                group.members[member_id].session_timeout / 1000.0)
+            while (group.state == b'AwaitingSync'
+                   and group.generation_id == generation_id):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                cluster._lock.wait(remaining)
+            if group.state != b'Stable' or group.generation_id != generation_id \
+                    or member_id not in group.members:
+                return _pack('hY', (RebalanceInProgress.ERROR_CODE, b''))
+            group.members[member_id].last_seen = time.time()
+            return _pack('hY', (0, group.assignments.get(member_id, b'')))
+
+    def _heartbeat(self, api_version, buff, offset, client_id, client_host):
+        group_id, generation_id, member_id = struct_helpers.unpack_from(
+            'SiS', buff, offset)
+        cluster = self._cluster
+        with cluster._lock:
+            group = cluster._groups.get(group_id)
+            if group is not None:
+                group.expire_members(time.time())
+            err = (self._coordinator_error(group_id)
+                   or self._check_member(group, generation_id, member_id))
+            if not err:
+                group.members[member_id].last_seen = time.time()
+        return _pack('h', (err,))
+
+    def _leave_group(self, api_version, buff, offset, client_id, client_host):
+        group_id, member_id = struct_helpers.unpack_from('SS', buff, offset)
+        cluster = self._cluster
+        with cluster._lock:
+            err = self._coordinator_error(group_id)
+            group = cluster._groups.get(group_id)
+            if not err and (group is None or member_id not in group.members):
+                err = UnknownMemberId.ERROR_CODE
+            if not err:
+                del group.members[member_id]
+                if member_id in group.joining:
+                    group.joining.remove(member_id)
+                group.begin_rebalance(time.time())
+        return _pack('h', (err,))
+
+    def _describe_groups(self, api_version, buff, offset, client_id,
+                         client_host):
+        group_ids = struct_helpers.unpack_from('[S]', buff, offset)
+        cluster = self._cluster
+        response = []
+        with cluster._lock:
+            for group_id in group_ids:
+                err = self._coordinator_error(group_id)
+                group = cluster._groups.get(group_id)
+                if err or group is None:
+                    response.append((err, group_id, b'Dead', b'', b'', []))
+                    continue
+                members = [
+                    (member.member_id, member.client_id, member.client_host,
+                     dict(member.protocols).get(group.protocol, b''),
+                     group.assignments.get(member.member_id, b''))
+                    for member in group.members.values()]
+                response.append((0, group_id, group.state, group.protocol_type,
+                                 group.protocol, members))
+        return _pack('[hSSSS [SSSYY] ]', (response,))
+
+    def _list_groups(self, api_version, buff, offset, client_id, client_host):
+        cluster = self._cluster
+        with cluster._lock:
+            groups = [(group_id, group.protocol_type)
+                      for group_id, group in iteritems(cluster._groups)
+                      if cluster._get_coordinator_id(group_id) == self.id]
+        return _pack('h [SS]', (0, groups))
+
+
+class FakeKafkaCluster(object):
+    """An in-process stand-in for a Kafka cluster
+
+    Offers the same helpers as :class:`pykafka.test.kafka_instance.KafkaInstance`
+    for managing topics, without ZooKeeper. Connect a
+    :class:`pykafka.KafkaClient` to it with `hosts=cluster.brokers`.
+
+    :ivar brokers: The comma-separated `host:port` list of the brokers
+    :ivar broker_servers: dict of {broker id: :class:`FakeBroker`}
+    :ivar auto_create_topics: Whether metadata requests for unknown topics
+        create them, like Kafka's `auto.create.topics.enable`
+    """
+    def __init__(self,
+                 num_instances=1,
+                 host='127.0.0.1',
+                 latency_ms=0,
+                 auto_create_topics=True,
+                 default_num_partitions=1):
+        """Start a fake cluster
+
+        :param num_instances: The number of brokers
+        :type num_instances: int
+        :param host: The address the brokers listen on
+        :type host: str
+        :param latency_ms: Delay added to every response, in milliseconds.
+            Can be changed per broker through `broker_servers`.
+        :type latency_ms: int
+        :param auto_create_topics: Whether metadata requests for unknown
+            topics create them
+        :type auto_create_topics: bool
+        :param default_num_partitions: The number of partitions of
+            automatically created topics
+        :type default_num_partitions: int
+        """
+        self._lock = threading.Condition()
+        self._topics = {}
+        self._groups = {}
+        self._offsets = {}
+        self.auto_create_topics = auto_create_topics
+        self.default_num_partitions = default_num_partitions
+        self.broker_servers = {}
+        for id_ in range(num_instances):
+            self.broker_servers[id_] = FakeBroker(self, id_, host=host,
+                                                  latency_ms=latency_ms)
+        self.brokers = ','.join('{}:{}'.format(broker.host, broker.port)
+                                for broker in self.broker_servers.values())
+        self.brokers_ssl = None
+        self.zookeeper = None
+
+    def __repr__(self):
+        return "<{module}.{name} at {id_} (brokers={brokers})>".format(
+            module=self.__class__.__module__,
+            name=self.__class__.__name__,
+            id_=hex(id(self)),
+            brokers=self.brokers
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.terminate()
+
+    def terminate(self):
+        """Stop all brokers"""
+        for broker in self.broker_servers.values():
+            broker.stop()
+
+    def _get_partition(self, topic_name, partition_id):
+        partitions = self._topics.get(topic_name)
+        if partitions is None or not 0 <= partition_id < len(partitions):
+            return None
+        return partitions[partition_id]
+
+    def _get_coordinator_id(self, group_id):
+        broker_ids = sorted(self.broker_servers)
+        return broker_ids[(crc32(group_id) & 0xffffffff) % len(broker_ids)]
+
+    def _create_topic(self, topic_name, num_partitions, replication_factor):
+        broker_ids = sorted(self.broker_servers)
+        if not 0 < replication_factor <= len(broker_ids):
+            raise ValueError("Replication factor {} not possible with {} "
+                             "brokers".format(replication_factor,
+                                              len(broker_ids)))
+        partitions = []
+        for partition_id in range(num_partitions):
+            replica_ids = [broker_ids[(partition_id + i) % len(broker_ids)]
+                           for i in range(replication_factor)]
+            partitions.append(_PartitionLog(replica_ids[0], replica_ids))
+        self._topics[topic_name] = partitions
+        return partitions
+
+    def create_topic(self, topic_name, num_partitions, replication_factor):
+        """Create a topic, spreading partition leadership over the brokers"""
+        with self._lock:
+            self._create_topic(get_bytes(topic_name), num_partitions,
+                               replication_factor)
+
+    def delete_topic(self, topic_name):
+        with self._lock:
+            del self._topics[get_bytes(topic_name)]
+
+    def flush(self):
+        """Delete all topics."""
+        with self._lock:
+            self._topics.clear()
+
+    def list_topics(self):
+        with self._lock:
+            return sorted(self._topics)
+
+    def produce_messages(self, topic_name, messages):
+        """Append some messages to a topic, spread over its partitions."""
+        with self._lock:
+            topic_name = get_bytes(topic_name)
+            partitions = self._topics.get(topic_name)
+            if partitions is None:
+                partitions = self._create_topic(topic_name,
+                                                self.default_num_partitions, 1)
+            for i, message in enumerate(messages):
+                message = Message(get_bytes(message))
+                raw = bytes(message.encode())
+                partitions[i % len(partitions)].append([(raw, None)])
+            self._lock.notify_all()
@@ -18,7 +18,6 @@ limitations under the License.
 """
 __all__ = ["Topic"]
 import logging
-from collections import defaultdict
 
 from .balancedconsumer import BalancedConsumer
 from .common import OffsetType
@@ -26,7 +25,6 @@ from .exceptions import LeaderNotFoundError
 from .managedbalancedconsumer import ManagedBalancedConsumer
 from .partition import Partition
 from .producer import Producer
-from .protocol import PartitionOffsetRequest
 from .simpleconsumer import SimpleConsumer
 from .utils.compat import iteritems, itervalues
 try:
@@ -63,6 +61,7 @@ class Topic(object):
         self._name = topic_metadata.name
         self._cluster = cluster
         self._partitions = {}
+        self._sorted_partitions = []
         self.update(topic_metadata)
 
     def __repr__(self):
@@ -83,6 +82,16 @@ class Topic(object):
         """A dictionary containing all known partitions for this topic"""
         return self._partitions
 
+    @property
+    def sorted_partitions(self):
+        """A list of all known partitions for this topic, sorted by id
+
+        The list is rebuilt on every metadata update rather than on access, so
+        the same object is returned until the next update. It must not be
+        modified by callers.
+        """
+        return self._sorted_partitions
+
     def get_producer(self, use_rdkafka=False, **kwargs):
         """Create a :class:`pykafka.producer.Producer` for this topic.
 
@@ -119,16 +128,10 @@ class Topic(object):
         :param max_offsets: The maximum number of offsets to return
         :type max_offsets: int
         """
-        requests = defaultdict(list)  # one request for each broker
-        for part in itervalues(self.partitions):
-            requests[part.leader].append(PartitionOffsetRequest(
-                self.name, part.id, offsets_before, max_offsets
-            ))
-        output = {}
-        for broker, reqs in iteritems(requests):
-            res = broker.request_offset_limits(reqs)
-            output.update(res.topics[self.name])
-        return output
+        offsets = self._cluster.fetch_offset_limits([self], offsets_before,
+                                                    max_offsets=max_offsets)
+        return {partition_id: res
+                for (_, partition_id), res in iteritems(offsets)}
 
     def earliest_available_offsets(self):
         """Get the earliest offset for each partition of this topic."""
@@ -175,6 +178,7 @@ class Topic(object):
                 )
             else:
                 self._partitions[id_].update(brokers, meta)
+        self._sorted_partitions = sorted(itervalues(self._partitions))
 
     def get_simple_consumer(self,
                             consumer_group=None,
@@ -44,6 +44,8 @@ if PY3:
 
     buffer = memoryview
 
+    from time import monotonic  # noqa
+
 else:
     range = xrange
     from threading import Condition, Lock
@@ -62,6 +64,9 @@ else:
 
     buffer = buffer
 
+    # NB not actually monotonic, but the closest the standard library offers
+    monotonic = _time
+
     # -- begin unmodified backport of threading.Semaphore from Python 3.4 -- #
     class Semaphore(object):
         """This class implements semaphore objects.
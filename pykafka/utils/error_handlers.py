@@ -25,7 +25,8 @@ def handle_partition_responses(error_handlers,
                                parts_by_error=None,
                                success_handler=None,
                                response=None,
-                               partitions_by_id=None):
+                               partitions_by_id=None,
+                               partitions_by_topic=None):
     """Call the appropriate handler for each errored partition
 
     :param error_handlers: mapping of error code to handler
@@ -41,9 +42,15 @@ def handle_partition_responses(error_handlers,
         instances
     :type partitions_by_id: dict
         {int: :class:`pykafka.simpleconsumer.OwnedPartition`}
+    :param partitions_by_topic: a dict mapping topic names to dicts like
+        `partitions_by_id`. Takes precedence over `partitions_by_id`, for
+        responses that cover more than one topic.
+    :type partitions_by_topic: dict
+        {bytes: {int: :class:`pykafka.simpleconsumer.OwnedPartition`}}
     """
     if parts_by_error is None:
-        parts_by_error = build_parts_by_error(response, partitions_by_id)
+        parts_by_error = build_parts_by_error(response, partitions_by_id,
+                                              partitions_by_topic)
 
     for errcode, parts in iteritems(parts_by_error):
         if errcode != 0:
@@ -54,7 +61,7 @@ def handle_partition_responses(error_handlers,
     return parts_by_error
 
 
-def build_parts_by_error(response, partitions_by_id):
+def build_parts_by_error(response, partitions_by_id=None, partitions_by_topic=None):
     """Separate the partitions from a response by their error code
 
     :param response: a Response object containing partition responses
@@ -63,13 +70,20 @@ def build_parts_by_error(response, partitions_by_id):
         instances
     :type partitions_by_id: dict
         {int: :class:`pykafka.simpleconsumer.OwnedPartition`}
+    :param partitions_by_topic: a dict mapping topic names to dicts like
+        `partitions_by_id`. Takes precedence over `partitions_by_id`.
+    :type partitions_by_topic: dict
+        {bytes: {int: :class:`pykafka.simpleconsumer.OwnedPartition`}}
     """
     # group partition responses by error code
     parts_by_error = defaultdict(list)
     for topic_name in response.topics.keys():
+        owned_partitions = partitions_by_id
+        if partitions_by_topic is not None:
+            owned_partitions = partitions_by_topic.get(topic_name)
         for partition_id, pres in iteritems(response.topics[topic_name]):
-            if partitions_by_id is not None and partition_id in partitions_by_id:
-                owned_partition = partitions_by_id[partition_id]
+            if owned_partitions is not None and partition_id in owned_partitions:
+                owned_partition = owned_partitions[partition_id]
                 parts_by_error[pres.err].append((owned_partition, pres))
     return parts_by_error
 
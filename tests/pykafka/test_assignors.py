@@ -0,0 +1,137 @@
+import unittest2
+
+from pykafka.assignors import (LegacyRangeAssignor, RangeAssignor,
+                               RoundRobinAssignor, StickyAssignor)
+
+
+class _Topic(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class _Broker(object):
+    def __init__(self, id_):
+        self.id = id_
+
+
+class _Partition(object):
+    def __init__(self, topic, id_, leader_id=0):
+        self.topic = topic
+        self.id = id_
+        self.leader = _Broker(leader_id)
+
+
+def _partitions(num_partitions, topic_name=b'topic'):
+    topic = _Topic(topic_name)
+    return [_Partition(topic, i, leader_id=i % 3) for i in range(num_partitions)]
+
+
+class AssignorTestMixin(object):
+    assignor = None
+
+    def _check_balanced(self, assignment, members, partitions):
+        self.assertEqual(set(assignment), set(members))
+        assigned = [p for parts in assignment.values() for p in parts]
+        self.assertEqual(sorted(assigned, key=id), sorted(partitions, key=id))
+        sizes = [len(parts) for parts in assignment.values()]
+        self.assertLessEqual(max(sizes) - min(sizes), 1)
+
+    def test_balanced(self):
+        for num_members in range(1, 12):
+            for num_partitions in (0, 1, 7, 10, 23):
+                members = [b'member-%d' % i for i in range(num_members)]
+                partitions = _partitions(num_partitions)
+                assignment = self.assignor(members, partitions)
+                self._check_balanced(assignment, members, partitions)
+
+    def test_deterministic(self):
+        """Members must agree on the assignment whatever the input order"""
+        members = [b'c', b'a', b'b']
+        partitions = _partitions(10)
+        expected = self.assignor(members, partitions)
+        self.assertEqual(self.assignor(list(reversed(members)),
+                                       list(reversed(partitions))), expected)
+
+    def test_ignores_leaders(self):
+        """A leader change must not change the assignment"""
+        members = [b'a', b'b', b'c']
+        partitions = _partitions(10)
+        expected = self.assignor(members, partitions)
+        for p in partitions:
+            p.leader = _Broker(2 - p.leader.id)
+        self.assertEqual(self.assignor(members, partitions), expected)
+
+    def test_no_members(self):
+        self.assertEqual(self.assignor([], _partitions(4)), {})
+
+
+class TestRangeAssignor(AssignorTestMixin, unittest2.TestCase):
+    assignor = RangeAssignor()
+
+    def test_ranges(self):
+        partitions = _partitions(5)
+        assignment = self.assignor([b'b', b'a'], partitions)
+        self.assertEqual(assignment, {b'a': set(partitions[:3]),
+                                      b'b': set(partitions[3:])})
+
+
+class TestRoundRobinAssignor(AssignorTestMixin, unittest2.TestCase):
+    assignor = RoundRobinAssignor()
+
+    def test_round_robin(self):
+        partitions = _partitions(5)
+        assignment = self.assignor([b'b', b'a'], partitions)
+        self.assertEqual(assignment, {b'a': set(partitions[0::2]),
+                                      b'b': set(partitions[1::2])})
+
+
+class TestStickyAssignor(AssignorTestMixin, unittest2.TestCase):
+    assignor = StickyAssignor()
+
+    def test_member_joins(self):
+        """Only the partitions needed by a new member should move"""
+        partitions = _partitions(12)
+        previous = self.assignor([b'a', b'b', b'c'], partitions)
+        assignment = self.assignor([b'a', b'b', b'c', b'd'], partitions,
+                                   previous_assignment=previous)
+        self._check_balanced(assignment, [b'a', b'b', b'c', b'd'], partitions)
+        for member in (b'a', b'b', b'c'):
+            self.assertTrue(assignment[member] <= previous[member])
+        self.assertEqual(len(assignment[b'd']), 3)
+
+    def test_member_leaves(self):
+        """Only the partitions of the departed member should move"""
+        partitions = _partitions(10)
+        previous = self.assignor([b'a', b'b', b'c'], partitions)
+        assignment = self.assignor([b'a', b'c'], partitions,
+                                   previous_assignment=previous)
+        self._check_balanced(assignment, [b'a', b'c'], partitions)
+        for member in (b'a', b'c'):
+            self.assertTrue(previous[member] <= assignment[member])
+
+    def test_unchanged_membership(self):
+        partitions = _partitions(10)
+        members = [b'a', b'b', b'c']
+        previous = RoundRobinAssignor()(members, partitions)
+        self.assertEqual(self.assignor(members, partitions, previous), previous)
+
+    def test_conflicting_previous_assignment(self):
+        """A partition claimed by two members is kept by one of them"""
+        partitions = _partitions(4)
+        previous = {b'a': partitions[:3], b'b': partitions[1:]}
+        assignment = self.assignor([b'a', b'b'], partitions, previous)
+        self._check_balanced(assignment, [b'a', b'b'], partitions)
+        self.assertEqual(assignment[b'b'], set(partitions[2:]))
+
+
+class TestLegacyRangeAssignor(unittest2.TestCase):
+    def test_matches_earlier_versions(self):
+        """Partitions are ordered by "<topic>-<leader id>-<id>" strings"""
+        partitions = _partitions(12)
+        assignment = LegacyRangeAssignor()(
+            [b'e', b'd', b'c', b'b', b'a'], partitions)
+        self.assertEqual(
+            dict((member, sorted(p.id for p in parts))
+                 for member, parts in assignment.items()),
+            {b'a': [0, 3, 6], b'b': [1, 9, 10], b'c': [4, 7], b'd': [2, 11],
+             b'e': [5, 8]})
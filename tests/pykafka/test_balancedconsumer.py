@@ -7,6 +7,7 @@ import pytest
 import time
 import threading
 import unittest2
+from collections import defaultdict
 from uuid import uuid4
 
 from kazoo.client import KazooClient
@@ -16,9 +17,13 @@ except ImportError:
     gevent = None
 
 from pykafka import KafkaClient
+from pykafka.assignors import sticky_assignor
 from pykafka.balancedconsumer import BalancedConsumer, OffsetType
 from pykafka.exceptions import ConsumerStoppedException
-from pykafka.managedbalancedconsumer import ManagedBalancedConsumer
+from pykafka.handlers import ThreadingHandler
+from pykafka.managedbalancedconsumer import (ManagedBalancedConsumer,
+                                             MultiTopicManagedBalancedConsumer)
+from pykafka.protocol import ConsumerGroupProtocolMetadata
 from pykafka.test.utils import get_cluster, stop_cluster
 from pykafka.utils.compat import range, iterkeys, iteritems
 from tests.pykafka import patch_subclass
@@ -77,6 +82,87 @@ class TestBalancedConsumer(unittest2.TestCase):
         with self.assertRaises(ConsumerStoppedException):
             consumer.consume()
 
+    def test_incremental_rebalance(self):
+        """Ensure that a changed assignment is applied to the internal
+        consumer in place, keeping the partitions that are still assigned
+        """
+        consumer, topic = self.buildMockConsumer(num_partitions=4)
+        parts = topic.partitions
+        consumer._setup_internal_consumer([parts[0], parts[1]], start=False)
+        internal_consumer = consumer._consumer
+        kept_partition = internal_consumer._partitions[parts[1]]
+
+        consumer._setup_internal_consumer([parts[1], parts[2]], start=False)
+        self.assertIs(consumer._consumer, internal_consumer)
+        self.assertEqual(consumer._partitions, set([parts[1], parts[2]]))
+        self.assertIs(internal_consumer._partitions[parts[1]], kept_partition)
+
+    def test_rebalance_coalescing(self):
+        """Ensure that a burst of watch events leads to a single rebalance
+        once the quiet period has passed"""
+        consumer, _ = self.buildMockConsumer()
+        if isinstance(consumer, ManagedBalancedConsumer):
+            self.skipTest("ManagedBalancedConsumer doesn't use zookeeper watches")
+        consumer._cluster.handler = ThreadingHandler()
+        consumer._rebalance_requested = threading.Event()
+        consumer._rebalance_quiet_period_ms = 200
+        consumer._rebalance = mock.Mock()
+        consumer._running = True
+        consumer._setting_watches = False
+        consumer._setup_rebalance_worker()
+        try:
+            for _ in range(20):
+                consumer._consumers_changed([])
+                time.sleep(.005)
+            self.assertEqual(consumer._rebalance.call_count, 0)
+            time.sleep(.5)
+            self.assertEqual(consumer._rebalance.call_count, 1)
+            self.assertEqual(consumer.rebalance_stats["requested"], 20)
+        finally:
+            consumer._running = False
+            consumer._rebalance_requested.set()
+
+    def test_restart_rebalance_worker(self):
+        """Ensure stop() ends the rebalance worker and a restarted consumer
+        doesn't rebalance for requests made before it was stopped"""
+        consumer, _ = self.buildMockConsumer()
+        if isinstance(consumer, ManagedBalancedConsumer):
+            self.skipTest("ManagedBalancedConsumer has no rebalance worker")
+        consumer._cluster.handler = ThreadingHandler()
+        consumer._rebalance_requested = threading.Event()
+        consumer._rebalance_quiet_period_ms = 50
+        consumer._rebalance = mock.Mock()
+        consumer._set_watches = mock.Mock()
+        consumer.start()
+        worker = consumer._rebalance_worker
+        consumer.stop()
+        self.assertFalse(worker.is_alive())
+
+        consumer.start()
+        time.sleep(.2)
+        # one rebalance for each start(), none from the worker
+        self.assertEqual(consumer._rebalance.call_count, 2)
+        consumer.stop()
+
+    def test_partition_owners_unknown_partition(self):
+        """Ensure owners of partitions missing from our metadata are ignored"""
+        consumer, topic = self.buildMockConsumer(num_partitions=2)
+        zk = consumer._zookeeper
+        zk.get_children.return_value = ['0-0', '0-1', '0-2']
+        zk.get_async.return_value.get.return_value = (b'owner', None)
+        owners = consumer._get_partition_owners()
+        self.assertEqual(owners, {b'owner': set(topic.partitions.values())})
+
+    def test_sticky_assignor_rejected(self):
+        """Ensure the zookeeper consumer refuses the sticky assignor"""
+        consumer, topic = self.buildMockConsumer()
+        if isinstance(consumer, ManagedBalancedConsumer):
+            self.skipTest("ManagedBalancedConsumer supports sticky assignment")
+        with self.assertRaises(ValueError):
+            BalancedConsumer(topic, mock.MagicMock(), b'testgroup',
+                             zookeeper=mock.MagicMock(), auto_start=False,
+                             assignor=sticky_assignor)
+
     def test_decide_partitions(self):
         """Test partition assignment for a number of partitions/consumers."""
         # 100 test iterations
@@ -137,6 +223,79 @@ class TestManagedBalancedConsumer(TestBalancedConsumer):
         return cns, topic
 
 
+class TestMultiTopicManagedBalancedConsumer(unittest2.TestCase):
+    def buildMockConsumer(self):
+        topics = []
+        for name, num_partitions in ((b'topic-a', 3), (b'topic-b', 2)):
+            topic = mock.Mock()
+            topic.name = name
+            topic.partitions = {}
+            for k in range(num_partitions):
+                part = mock.Mock(name='part-{part}'.format(part=k))
+                part.id = k
+                part.topic = topic
+                part.leader = mock.Mock()
+                part.leader.id = 0
+                topic.partitions[k] = part
+            topics.append(topic)
+
+        cluster = mock.MagicMock()
+        cluster._max_connection_retries = 1
+        cns = MultiTopicManagedBalancedConsumer(topics, cluster, b'testgroup',
+                                                auto_start=False)
+        cns._group_coordinator = mock.MagicMock()
+        return cns, topics
+
+    def test_single_membership(self):
+        """Ensure that all topics are joined and assigned in a single round"""
+        consumer, topics = self.buildMockConsumer()
+        all_partitions = [p for topic in topics for p in topic.partitions.values()]
+        coordinator = consumer._group_coordinator
+        join_result = coordinator.join_group.return_value
+        join_result.error_code = 0
+        join_result.generation_id = 1
+        join_result.member_id = b'member-a'
+        join_result.members = {
+            member_id: ConsumerGroupProtocolMetadata(
+                topic_names=[b'topic-a', b'topic-b'], user_data=b'')
+            for member_id in (b'member-a', b'member-b')}
+        group_assignments = {}
+
+        def sync_group(connection_id, group, generation_id, member_id, assignments):
+            group_assignments.update(assignments)
+            return mock.Mock(error_code=0,
+                             member_assignment=group_assignments[member_id])
+        coordinator.sync_group.side_effect = sync_group
+        consumer._setup_internal_consumer = mock.Mock()
+
+        consumer._update_member_assignment()
+        self.assertEqual(coordinator.join_group.call_count, 1)
+        self.assertEqual(coordinator.join_group.call_args[0][3],
+                         [b'topic-a', b'topic-b'])
+        self.assertEqual(coordinator.sync_group.call_count, 1)
+        assigned = [(topic_name, partition_id)
+                    for assignment in group_assignments.values()
+                    for topic_name, partition_ids in assignment.partition_assignment
+                    for partition_id in partition_ids]
+        self.assertEqual(sorted(assigned), sorted((p.topic.name, p.id)
+                                                  for p in all_partitions))
+        partitions = consumer._setup_internal_consumer.call_args[1]['partitions']
+        self.assertEqual(
+            sorted((p.topic.name, p.id) for p in partitions),
+            [(topic_name, partition_id) for topic_name, partition_ids
+             in group_assignments[b'member-a'].partition_assignment
+             for partition_id in partition_ids])
+
+    def test_internal_consumer(self):
+        """Ensure that the internal consumer keys partitions by topic"""
+        consumer, topics = self.buildMockConsumer()
+        parts = [topics[0].partitions[2], topics[1].partitions[0]]
+        consumer._setup_internal_consumer(parts, start=False)
+        self.assertEqual(set(consumer.partitions),
+                         set([(b'topic-a', 2), (b'topic-b', 0)]))
+        self.assertEqual(consumer._partitions, set(parts))
+
+
 class BalancedConsumerIntegrationTests(unittest2.TestCase):
     maxDiff = None
     USE_RDKAFKA = False
@@ -430,8 +589,8 @@ class BalancedConsumerIntegrationTests(unittest2.TestCase):
     def test_no_partitions(self):
         """Ensure a consumer assigned no partitions doesn't fail"""
 
-        def _decide_dummy(p, consumer_id=None):
-            return set()
+        def _decide_dummy(participants, previous_assignment=None):
+            return defaultdict(set)
         consumer = self.get_balanced_consumer(
             b'test_no_partitions',
             zookeeper_connect=self.kafka.zookeeper,
@@ -439,7 +598,7 @@ class BalancedConsumerIntegrationTests(unittest2.TestCase):
             consumer_timeout_ms=50,
             use_rdkafka=self.USE_RDKAFKA)
 
-        consumer._decide_partitions = _decide_dummy
+        consumer._decide_assignment = _decide_dummy
         consumer.start()
         res = consumer.consume()
         self.assertEqual(res, None)
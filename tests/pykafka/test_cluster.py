@@ -1,7 +1,10 @@
+import time
 import unittest
 from uuid import uuid4
 
 from pykafka import KafkaClient, Topic
+from pykafka.common import OffsetType
+from pykafka.protocol import PartitionOffsetCommitRequest
 from pykafka.utils.compat import itervalues
 from pykafka.test.utils import get_cluster, stop_cluster
 
@@ -66,5 +69,39 @@ class ClusterIntegrationTests(unittest.TestCase):
                          for b in itervalues(kafka_client.brokers)]
         self.assertEqual(zk_brokers, kafka_brokers)
 
+    def test_fetch_offset_limits(self):
+        """Offsets for several topics should match the per-topic lookup"""
+        topics = []
+        for _ in range(2):
+            topic_name = uuid4().hex.encode()
+            self.kafka.create_topic(topic_name, 3, 2)
+            topic = self.client.topics[topic_name]
+            with topic.get_sync_producer() as producer:
+                for i in range(10):
+                    producer.produce(b'msg', partition_key=str(i).encode())
+            topics.append(topic)
+
+        offsets = self.client.cluster.fetch_offset_limits(
+            [topics[0], topics[1].name], OffsetType.LATEST)
+        self.assertEqual(len(offsets), 6)
+        for topic in topics:
+            for partition_id, res in topic.latest_available_offsets().items():
+                self.assertEqual(offsets[(topic.name, partition_id)], res)
+
+    def test_fetch_group_offsets(self):
+        topic_name = uuid4().hex.encode()
+        self.kafka.create_topic(topic_name, 3, 2)
+        topic = self.client.topics[topic_name]
+        consumer_group = uuid4().hex.encode()
+        coordinator = self.client.cluster.get_group_coordinator(consumer_group)
+        coordinator.commit_consumer_group_offsets(
+            consumer_group, 1, b'test', [PartitionOffsetCommitRequest(
+                topic_name, 0, 42, int(time.time() * 1000), b'')])
+
+        offsets = self.client.cluster.fetch_group_offsets(consumer_group, [topic])
+        self.assertEqual(len(offsets), 3)
+        self.assertEqual(offsets[(topic_name, 0)].offset, 42)
+        self.assertEqual(offsets[(topic_name, 1)].offset, -1)
+
 if __name__ == "__main__":
     unittest.main()
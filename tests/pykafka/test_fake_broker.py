@@ -0,0 +1,139 @@
+import time
+import unittest
+from uuid import uuid4
+
+from pykafka import KafkaClient
+from pykafka.common import CompressionType, OffsetType
+from pykafka.exceptions import NotLeaderForPartition
+from pykafka.partitioners import hashing_partitioner
+from pykafka.protocol import PartitionFetchRequest
+from pykafka.test.fake_broker import FakeKafkaCluster, _pack
+from pykafka.utils import struct_helpers
+from pykafka.test.utils import retry
+
+
+class TestPack(unittest.TestCase):
+    def test_roundtrip(self):
+        fmt = 'hi [S [ihqY] ] [i] S'
+        values = (3, -1, [(b'topic', [(0, 6, 100, b'data'), (1, 0, -1, None)])],
+                  [1, 2, 3], None)
+        self.assertEqual(struct_helpers.unpack_from(fmt, _pack(fmt, values)),
+                         values[:2] + ([(b'topic', [(0, 6, 100, b'data'),
+                                                    (1, 0, -1, None)])],
+                                       [1, 2, 3], None))
+
+
+class FakeClusterIntegrationTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.kafka = FakeKafkaCluster(num_instances=3)
+        cls.client = KafkaClient(cls.kafka.brokers, broker_version='0.10.1')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.kafka.terminate()
+
+    def _create_topic(self, num_partitions=6, replication_factor=2):
+        topic_name = uuid4().hex.encode()
+        self.kafka.create_topic(topic_name, num_partitions, replication_factor)
+        return self.client.topics[topic_name]
+
+    def test_metadata(self):
+        topic = self._create_topic()
+        self.assertEqual(sorted(self.client.brokers), [0, 1, 2])
+        for partition in topic.partitions.values():
+            self.assertEqual(partition.leader.id, partition.id % 3)
+            self.assertEqual(len(partition.replicas), 2)
+
+    def test_produce_consume(self):
+        """Compressed and uncompressed messages are read back in order"""
+        topic = self._create_topic()
+        for compression in (CompressionType.NONE, CompressionType.GZIP):
+            with topic.get_producer(compression=compression,
+                                    partitioner=hashing_partitioner,
+                                    linger_ms=10) as producer:
+                for i in range(50):
+                    producer.produce(str(i).encode(), partition_key=b'key')
+        consumer = topic.get_simple_consumer(
+            auto_offset_reset=OffsetType.EARLIEST, consumer_timeout_ms=500)
+        messages = list(consumer)
+        consumer.stop()
+        self.assertEqual([m.value for m in messages],
+                         [str(i).encode() for i in range(50)] * 2)
+        self.assertEqual([m.offset for m in messages], list(range(100)))
+        self.assertTrue(all(m.timestamp > 0 for m in messages))
+
+    def test_offsets(self):
+        topic = self._create_topic(num_partitions=2)
+        before = int(time.time() * 1000)
+        self.kafka.produce_messages(topic.name, [b'a', b'b', b'c', b'd'])
+        latest = topic.latest_available_offsets()
+        self.assertEqual({p: res.offset[0] for p, res in latest.items()},
+                         {0: 2, 1: 2})
+        consumer = topic.get_simple_consumer(consumer_group=b'offsets')
+        self.assertEqual(consumer.seek_to_timestamp(before), {0: 0, 1: 0})
+        self.assertEqual(consumer.seek_to_timestamp(before + 60 * 1000),
+                         {0: 2, 1: 2})
+        consumer.stop()
+        committed = self.client.cluster.fetch_group_offsets(b'offsets', [topic])
+        self.assertEqual({key: res.offset for key, res in committed.items()},
+                         {(topic.name, 0): 2, (topic.name, 1): 2})
+
+    def test_not_leader(self):
+        topic = self._create_topic(num_partitions=1)
+        not_leader = self.client.brokers[1]
+        response = not_leader.fetch_messages(
+            [PartitionFetchRequest(topic.name, 0, 0)], timeout=0, min_bytes=1)
+        self.assertEqual(response.topics[topic.name][0].err,
+                         NotLeaderForPartition.ERROR_CODE)
+
+    def test_fetch_waits(self):
+        """Fetches block until min_bytes arrived or max_wait_ms passed"""
+        topic = self._create_topic(num_partitions=1)
+        leader = topic.partitions[0].leader
+        start = time.time()
+        response = leader.fetch_messages(
+            [PartitionFetchRequest(topic.name, 0, 0)], timeout=200, min_bytes=1)
+        self.assertGreaterEqual(time.time() - start, 0.2)
+        self.assertEqual(response.topics[topic.name][0].messages, [])
+
+    def test_latency(self):
+        topic = self._create_topic(num_partitions=1)
+        leader = self.kafka.broker_servers[topic.partitions[0].leader.id]
+        leader.latency_ms = 100
+        try:
+            start = time.time()
+            topic.latest_available_offsets()
+            self.assertGreaterEqual(time.time() - start, 0.1)
+        finally:
+            leader.latency_ms = 0
+
+    def test_managed_balanced_consumers(self):
+        topic = self._create_topic(num_partitions=4, replication_factor=1)
+        self.kafka.produce_messages(topic.name,
+                                    [str(i).encode() for i in range(20)])
+        group = uuid4().hex.encode()
+        consumers = [
+            topic.get_balanced_consumer(group, managed=True,
+                                        auto_offset_reset=OffsetType.EARLIEST,
+                                        consumer_timeout_ms=500)
+            for _ in range(2)]
+        try:
+            def assert_balanced():
+                partitions = [set(c.partitions) for c in consumers]
+                self.assertEqual(len(partitions[0]), 2)
+                self.assertEqual(partitions[0] | partitions[1], set(range(4)))
+            retry(assert_balanced, retry_time=10)
+            values = [m.value for c in consumers for m in c]
+            self.assertEqual(sorted(values),
+                             sorted(str(i).encode() for i in range(20)))
+            consumers.pop().stop()
+            retry(lambda: self.assertEqual(set(consumers[0].partitions),
+                                           set(range(4))), retry_time=10)
+        finally:
+            for consumer in consumers:
+                consumer.stop()
+
+
+if __name__ == "__main__":
+    unittest.main()
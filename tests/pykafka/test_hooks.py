@@ -0,0 +1,108 @@
+import unittest
+from uuid import uuid4
+
+from pykafka import KafkaClient
+from pykafka.hooks import RequestHooks
+from pykafka.protocol import FetchRequest
+from pykafka.test.fake_broker import FakeKafkaCluster
+
+
+class RecordingHooks(RequestHooks):
+    def __init__(self):
+        self.calls = []
+
+    def on_request_enqueued(self, event):
+        self.calls.append(('enqueued', event))
+
+    def on_request_sent(self, event):
+        self.calls.append(('sent', event))
+
+    def on_response_received(self, event):
+        self.calls.append(('received', event))
+
+    def on_response_decoded(self, event):
+        self.calls.append(('decoded', event))
+
+    def on_request_failed(self, event):
+        self.calls.append(('failed', event))
+
+
+PRODUCE, OFFSETS, METADATA = 0, 2, 3
+
+
+class BrokenHooks(RequestHooks):
+    def on_request_sent(self, event):
+        raise ValueError("hook failure")
+
+
+class RequestHooksTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.kafka = FakeKafkaCluster(num_instances=2)
+        cls.topic_name = uuid4().hex.encode()
+        cls.kafka.create_topic(cls.topic_name, 2, 1)
+        cls.kafka.produce_messages(cls.topic_name, [b'a', b'b', b'c'])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.kafka.terminate()
+
+    def test_lifecycle(self):
+        hooks = RecordingHooks()
+        client = KafkaClient(self.kafka.brokers, request_hooks=hooks)
+        self.assertEqual(hooks.calls[0][1].broker_id, -1)
+        del hooks.calls[:]
+
+        topic = client.topics[self.topic_name]
+        topic.latest_available_offsets()
+        events = [event for _, event in hooks.calls]
+        self.assertEqual(set(e.api_key for e in events),
+                         set([METADATA, OFFSETS]))
+        offset_events = [(stage, e) for stage, e in hooks.calls
+                         if e.api_key == OFFSETS]
+        self.assertEqual(len(set(e for _, e in offset_events)), 2)
+        self.assertEqual(set(e.broker_id for _, e in offset_events),
+                         set(client.brokers))
+        for event in set(e for _, e in offset_events):
+            stages = [stage for stage, e in offset_events if e is event]
+            self.assertEqual(stages, ['enqueued', 'sent', 'received', 'decoded'])
+            self.assertGreater(event.request_size, 0)
+            self.assertGreater(event.response_size, 0)
+            self.assertTrue(event.enqueued_at <= event.sent_at
+                            <= event.received_at <= event.decoded_at)
+            self.assertIsNone(event.error)
+
+    def test_produce_without_response(self):
+        """Requests that get no response only report being sent"""
+        hooks = RecordingHooks()
+        client = KafkaClient(self.kafka.brokers, request_hooks=hooks)
+        del hooks.calls[:]
+        topic = client.topics[self.topic_name]
+        with topic.get_producer(required_acks=0, linger_ms=0) as producer:
+            producer.produce(b'x')
+        stages = [stage for stage, e in hooks.calls
+                  if e.api_key == PRODUCE]
+        self.assertEqual(stages, ['enqueued', 'sent'])
+
+    def test_failed(self):
+        hooks = RecordingHooks()
+        client = KafkaClient(self.kafka.brokers, request_hooks=hooks)
+        broker = client.brokers[0]
+        broker._connection.disconnect()
+        del hooks.calls[:]
+        future = broker.handler.request(FetchRequest())
+        with self.assertRaises(Exception):
+            future.get()
+        self.assertEqual([stage for stage, _ in hooks.calls],
+                         ['enqueued', 'failed'])
+        self.assertIsNotNone(hooks.calls[-1][1].error)
+
+    def test_hook_exceptions_are_ignored(self):
+        client = KafkaClient(self.kafka.brokers, request_hooks=BrokenHooks())
+        topic = client.topics[self.topic_name]
+        offsets = topic.latest_available_offsets()
+        self.assertEqual(sum(res.offset[0] for res in offsets.values()), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
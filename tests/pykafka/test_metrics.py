@@ -0,0 +1,131 @@
+import unittest
+from uuid import uuid4
+
+from pykafka import KafkaClient
+from pykafka.common import CompressionType, OffsetType
+from pykafka.metrics import Histogram, MetricsRegistry
+from pykafka.test.fake_broker import FakeKafkaCluster
+
+
+class HistogramTests(unittest.TestCase):
+    def test_empty(self):
+        stats = Histogram().snapshot()
+        self.assertEqual(stats['count'], 0)
+        self.assertIsNone(stats['p99'])
+        self.assertIsNone(stats['mean'])
+
+    def test_small_values_are_exact(self):
+        hist = Histogram()
+        for value in range(1, 101):
+            hist.record(value)
+        stats = hist.snapshot()
+        self.assertEqual((stats['min'], stats['max'], stats['count']), (1, 100, 100))
+        self.assertEqual(stats['mean'], 50.5)
+        self.assertEqual((stats['p50'], stats['p90'], stats['p99'], stats['p999']),
+                         (50, 90, 99, 100))
+
+    def test_relative_error(self):
+        hist = Histogram(significant_bits=7)
+        values = [int(1.07 ** i) for i in range(300)]
+        for value in values:
+            hist.record(value)
+        stats = hist.snapshot()
+        expected = sorted(values)[int(len(values) * .9) - 1]
+        self.assertAlmostEqual(stats['p90'] / float(expected), 1, delta=2 ** -6)
+        self.assertEqual(stats['max'], max(values))
+        # memory is bounded by the range of values, not their number
+        for value in values:
+            hist.record(value)
+        self.assertLess(len(hist._counts), 64 * 62)
+
+    def test_negative(self):
+        hist = Histogram()
+        hist.record(-5)
+        self.assertEqual(hist.snapshot()['max'], 0)
+
+
+class MetricsRegistryTests(unittest.TestCase):
+    def test_stats(self):
+        registry = MetricsRegistry()
+        registry.counter("sent").inc()
+        registry.counter("sent").inc(4)
+        registry.gauge("depth", lambda: 7)
+        registry.gauge("static").set(3)
+        registry.histogram("latency").record(10)
+        stats = registry.stats()
+        self.assertEqual(stats['sent'], 5)
+        self.assertEqual(stats['depth'], 7)
+        self.assertEqual(stats['static'], 3)
+        self.assertEqual(stats['latency']['count'], 1)
+
+    def test_type_conflict(self):
+        registry = MetricsRegistry()
+        registry.counter("sent")
+        with self.assertRaises(TypeError):
+            registry.histogram("sent")
+
+
+class ClientStatsTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.kafka = FakeKafkaCluster(num_instances=2)
+        cls.client = KafkaClient(cls.kafka.brokers)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.kafka.terminate()
+
+    def _create_topic(self):
+        topic_name = uuid4().hex.encode()
+        self.kafka.create_topic(topic_name, 2, 1)
+        return self.client.topics[topic_name]
+
+    def test_producer_stats(self):
+        topic = self._create_topic()
+        producer = topic.get_producer(compression=CompressionType.GZIP,
+                                      min_queued_messages=1000, linger_ms=1000)
+        for i in range(100):
+            producer.produce(b'x' * 100)
+        stats = producer.stats()
+        self.assertEqual(sum(stats['queued_messages'].values()), 100)
+        producer.stop()
+        stats = producer.stats()
+        self.assertEqual(stats['messages_delivered'], 100)
+        self.assertEqual(stats['messages_failed'], 0)
+        self.assertEqual(stats['batch_messages']['count'], stats['requests_sent'])
+        self.assertLess(stats['compression_ratio'], .5)
+        self.assertEqual(stats['request_latency_us']['count'],
+                         stats['requests_sent'])
+        self.assertEqual(stats['buffer_memory_used'], 0)
+
+    def test_consumer_stats(self):
+        topic = self._create_topic()
+        self.kafka.produce_messages(topic.name, [b'msg'] * 10)
+        consumer = topic.get_simple_consumer(
+            auto_offset_reset=OffsetType.EARLIEST, consumer_timeout_ms=500)
+        messages = list(consumer)
+        stats = consumer.stats()
+        self.assertEqual(stats['messages_fetched'], len(messages))
+        self.assertEqual(sorted(stats['partitions']), [0, 1])
+        self.assertEqual(
+            sum(p['high_watermark'] for p in stats['partitions'].values()), 10)
+        self.assertEqual(sum(p['lag'] for p in stats['partitions'].values()), 0)
+        self.assertEqual(
+            sum(p['queued_messages'] for p in stats['partitions'].values()), 0)
+        self.assertGreater(stats['fetch_latency_us']['count'], 0)
+        consumer.stop()
+
+    def test_broker_stats(self):
+        broker = self.client.brokers[0]
+        before = broker.stats()
+        broker.request_metadata()
+        stats = broker.stats()
+        self.assertEqual(stats['requests_sent'], before['requests_sent'] + 1)
+        self.assertGreater(stats['bytes_received'], before['bytes_received'])
+        self.assertEqual(stats['response_latency_us']['count'],
+                         before['response_latency_us']['count'] + 1)
+        self.assertEqual(stats['queued_requests'], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,30 @@
+import mock
 import unittest2
 
 from hashlib import sha1
-from pykafka.partitioners import GroupHashingPartitioner
+from pykafka.partitioners import (GroupHashingPartitioner, HashingPartitioner,
+                                  LatencyAwarePartitioner, Murmur2Partitioner,
+                                  StickyPartitioner, murmur2)
+
+
+class _Broker(object):
+    def __init__(self, id_):
+        self.id = id_
+
+
+class _Topic(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class _Partition(object):
+    def __init__(self, id_, leader=None, topic=_Topic(b'topic')):
+        self.id = id_
+        self.leader = leader
+        self.topic = topic
+
+    def __lt__(self, other):
+        return self.id < other.id
 
 
 class TestGroupHashingPartitioner(unittest2.TestCase):
@@ -50,3 +73,166 @@ class TestGroupHashingPartitioner(unittest2.TestCase):
         partitioner = GroupHashingPartitioner(hash_func, group_size)
         x = partitioner.__call__(list(range(total_partition_count)), key)
         self.assertTrue(x in valid_partitions)
+
+
+class TestStickyPartitioner(unittest2.TestCase):
+
+    def setUp(self):
+        self.partitions = [_Partition(i) for i in range(8)]
+
+    def test_sticks_until_batch_closed(self):
+        partitioner = StickyPartitioner()
+        first = partitioner(self.partitions, None)
+        for _ in range(100):
+            self.assertIs(partitioner(self.partitions, None), first)
+        # a batch without the sticky partition does not cause a switch
+        partitioner.on_batch_closed(set([self.partitions[first.id - 1]]))
+        self.assertIs(partitioner(self.partitions, None), first)
+
+        partitioner.on_batch_closed(set([first]))
+        second = partitioner(self.partitions, None)
+        self.assertNotEqual(second.id, first.id)
+        self.assertIs(partitioner(self.partitions, None), second)
+
+    def test_single_partition(self):
+        partitioner = StickyPartitioner()
+        partitions = self.partitions[:1]
+        self.assertIs(partitioner(partitions, None), partitions[0])
+        partitioner.on_batch_closed(set(partitions))
+        self.assertIs(partitioner(partitions, None), partitions[0])
+
+    def test_sticky_partition_disappears(self):
+        partitioner = StickyPartitioner()
+        first = partitioner(self.partitions, None)
+        remaining = [p for p in self.partitions if p is not first]
+        self.assertIn(partitioner(remaining, None), remaining)
+
+    def test_topics_stick_independently(self):
+        partitioner = StickyPartitioner()
+        other_topic = _Topic(b'other')
+        others = [_Partition(i, topic=other_topic) for i in range(8)]
+        first = partitioner(self.partitions, None)
+        other_first = partitioner(others, None)
+        # closing a batch of one topic must not switch the other
+        partitioner.on_batch_closed(set([others[first.id]]))
+        self.assertIs(partitioner(self.partitions, None), first)
+        if other_first.id == first.id:
+            self.assertIsNot(partitioner(others, None), other_first)
+        else:
+            self.assertIs(partitioner(others, None), other_first)
+        partitioner.on_batch_closed(set([first]))
+        self.assertIsNot(partitioner(self.partitions, None), first)
+
+    def test_keyed_messages_use_key_partitioner(self):
+        partitioner = StickyPartitioner(key_partitioner=lambda parts, key: parts[-1])
+        self.assertIs(partitioner(self.partitions, b'foo'), self.partitions[-1])
+
+
+class TestMurmur2Partitioner(unittest2.TestCase):
+
+    def test_murmur2_java_compatibility(self):
+        # reference values from org.apache.kafka.common.utils.Utils.murmur2
+        data = [(b'21', -973932308),
+                (b'foobar', -790332482),
+                (b'a-little-bit-long-string', -985981536),
+                (b'a-little-bit-longer-string', -1486304829),
+                (b'lkjh234lh9fiuh90y23oiuhsafujhadof229phr9h19h89h8', -58897971),
+                (b'abc', 479470107)]
+        for key, expected in data:
+            self.assertEqual(murmur2(key), expected)
+
+    def test_partition_selection(self):
+        partitions = [_Partition(i) for i in range(16)]
+        partitioner = Murmur2Partitioner()
+        for key in (b'21', b'foobar', b'abc'):
+            expected = (murmur2(key) & 0x7fffffff) % len(partitions)
+            # input order must not matter
+            self.assertEqual(partitioner(partitions, key).id, expected)
+            self.assertEqual(partitioner(partitions[::-1], key).id, expected)
+
+    def test_none_key_raises_error(self):
+        with self.assertRaises(ValueError):
+            Murmur2Partitioner()([_Partition(0)], None)
+
+
+class TestSortedPartitionsCache(unittest2.TestCase):
+
+    def test_sort_reused_for_same_list(self):
+        partitioner = HashingPartitioner()
+        partitions = [_Partition(i) for i in range(4)][::-1]
+        self.assertEqual([p.id for p in partitioner._sorted(partitions)],
+                         [0, 1, 2, 3])
+        self.assertIs(partitioner._sorted(partitions),
+                      partitioner._sorted(partitions))
+
+        updated = partitions[1:]
+        self.assertEqual([p.id for p in partitioner._sorted(updated)], [0, 1, 2])
+
+    def test_sort_reused_across_lists(self):
+        """Alternating lists, as for the topics of a MultiTopicProducer"""
+        partitioner = HashingPartitioner()
+        first = [_Partition(i) for i in range(4)][::-1]
+        second = [_Partition(i) for i in range(2)][::-1]
+        sorted_first = partitioner._sorted(first)
+        sorted_second = partitioner._sorted(second)
+        self.assertIs(partitioner._sorted(first), sorted_first)
+        self.assertIs(partitioner._sorted(second), sorted_second)
+
+
+class TestLatencyAwarePartitioner(unittest2.TestCase):
+
+    def setUp(self):
+        brokers = [_Broker(i) for i in range(2)]
+        self.partitions = [_Partition(i, brokers[i % 2]) for i in range(4)]
+
+    def _distribution(self, partitioner, n=4000):
+        counts = dict((p.id, 0) for p in self.partitions)
+        for _ in range(n):
+            counts[partitioner(self.partitions, None).id] += 1
+        return counts
+
+    def test_uniform_without_stats(self):
+        counts = self._distribution(LatencyAwarePartitioner())
+        for count in counts.values():
+            self.assertGreater(count, 800)
+
+    def test_avoids_slow_broker(self):
+        partitioner = LatencyAwarePartitioner(min_share=0.2)
+        partitioner.on_request_completed(0, 5, 0)
+        partitioner.on_request_completed(1, 500, 0)
+        counts = self._distribution(partitioner)
+        slow = counts[1] + counts[3]
+        self.assertLess(slow, 800)
+        # every partition keeps at least its min_share of the traffic
+        for count in counts.values():
+            self.assertGreater(count, 100)
+
+    def test_avoids_deep_queue(self):
+        partitioner = LatencyAwarePartitioner(min_share=0.2)
+        partitioner.on_request_completed(0, 5, 0)
+        partitioner.on_request_completed(1, 5, 10000)
+        counts = self._distribution(partitioner)
+        self.assertLess(counts[1] + counts[3], 1000)
+
+    def test_weights_cached_across_lists(self):
+        partitioner = LatencyAwarePartitioner()
+        other = self.partitions[:2]
+        partitioner(self.partitions, None)
+        partitioner(other, None)
+        with mock.patch.object(partitioner, '_cumulative_weights') as weights:
+            partitioner(self.partitions, None)
+            partitioner(other, None)
+            self.assertFalse(weights.called)
+        partitioner.on_request_completed(0, 5, 0)
+        self.assertIn(partitioner(other, None), other)
+
+    def test_keyed_messages_use_key_partitioner(self):
+        partitioner = LatencyAwarePartitioner(
+            key_partitioner=lambda parts, key: parts[0])
+        self.assertIs(partitioner(self.partitions, b'foo'), self.partitions[0])
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            LatencyAwarePartitioner(min_share=1.5)
+        with self.assertRaises(ValueError):
+            LatencyAwarePartitioner(smoothing=0)
@@ -90,6 +90,17 @@ class ProducerIntegrationTests(unittest2.TestCase):
             with self.assertRaises(ZeroDivisionError):
                 p.produce(b"test")
 
+    def test_sync_produce_does_not_linger(self):
+        """Ensure a sync produce on an idle producer doesn't wait for linger_ms"""
+        consumer = self._get_consumer()
+        with self._get_producer(sync=True, linger_ms=10 * 1000) as prod:
+            start = time.time()
+            msg = prod.produce(uuid4().bytes)
+            self.assertLess(time.time() - start, 5)
+        self.assertGreaterEqual(msg.offset, 0)
+        consumer.consume()
+    test_sync_produce_does_not_linger.skip_condition = lambda cls: RDKAFKA
+
     def test_produce_hashing_partitioner(self):
         # unique bytes, just to be absolutely sure we're not fetching data
         # produced in a previous test
@@ -123,6 +134,51 @@ class ProducerIntegrationTests(unittest2.TestCase):
         message = consumer.consume()
         assert message.value == payload
 
+    def test_produce_on_delivery(self):
+        """Ensure delivery callbacks are run for every message"""
+        consumer = self._get_consumer()
+        reports = []
+        with self._get_producer(min_queued_messages=1) as prod:
+            payloads = [uuid4().bytes for _ in range(10)]
+            for payload in payloads:
+                prod.produce(payload,
+                             on_delivery=lambda msg, exc: reports.append((msg, exc)))
+        # stop() runs all outstanding callbacks
+        self.assertEqual(sorted(msg.value for msg, _ in reports), sorted(payloads))
+        self.assertTrue(all(exc is None for _, exc in reports))
+        for _ in payloads:
+            consumer.consume()
+
+    def test_produce_future(self):
+        payload = uuid4().bytes
+        consumer = self._get_consumer()
+        with self._get_producer(min_queued_messages=1) as prod:
+            future = prod.produce_future(payload)
+            msg = future.get(timeout=10)
+            self.assertTrue(future.done())
+        self.assertEqual(msg.value, payload)
+        self.assertGreaterEqual(msg.offset, 0)
+        self.assertEqual(consumer.consume().value, payload)
+
+    def test_multi_topic_producer(self):
+        """Ensure a MultiTopicProducer delivers to each of several topics"""
+        other_topic_name = b'test-data-multi'
+        self.kafka.create_topic(other_topic_name, 2, 1)
+        consumer = self._get_consumer()
+        other_consumer = self.client.topics[other_topic_name].get_simple_consumer(
+            consumer_timeout_ms=1000,
+            auto_offset_reset=OffsetType.LATEST,
+            reset_offset_on_start=True,
+        )
+        payload, other_payload = uuid4().bytes, uuid4().bytes
+        with self.client.get_multi_producer(min_queued_messages=1) as prod:
+            prod.produce(self.topic_name, payload)
+            future = prod.produce_future(other_topic_name, other_payload)
+            self.assertEqual(future.get(timeout=10).value, other_payload)
+        self.assertEqual(consumer.consume().value, payload)
+        self.assertEqual(other_consumer.consume().value, other_payload)
+    test_multi_topic_producer.skip_condition = lambda cls: RDKAFKA
+
     def test_recover_disconnected(self):
         """Test our retry-loop with a recoverable error"""
         payload = uuid4().bytes
@@ -158,19 +214,90 @@ class ProducerIntegrationTests(unittest2.TestCase):
         while consumer.consume() is not None:
             time.sleep(.05)
 
+    def test_queue_full_releases_memory(self):
+        """Ensure messages rejected by a full queue don't keep their memory"""
+        consumer = self._get_consumer()
+        with self._get_producer(block_on_queue_full=False,
+                                max_queued_messages=1,
+                                linger_ms=1000) as producer:
+            for _ in range(50):
+                try:
+                    producer.produce(uuid4().bytes)
+                except ProducerQueueFullError:
+                    pass
+            producer.flush()
+            self.assertEqual(producer.buffer_memory_used, 0)
+        while consumer.consume() is not None:
+            time.sleep(.05)
+    test_queue_full_releases_memory.skip_condition = lambda cls: RDKAFKA
+
+    def test_async_produce_buffer_memory_full(self):
+        """Ensure that the producer raises an error when buffer_memory_bytes is used up"""
+        consumer = self._get_consumer()
+        payload = uuid4().bytes * 100
+        with self._get_producer(block_on_queue_full=False,
+                                buffer_memory_bytes=len(payload) * 5,
+                                linger_ms=1000) as producer:
+            with self.assertRaises(ProducerQueueFullError):
+                while True:
+                    producer.produce(payload)
+            self.assertLessEqual(producer.buffer_memory_used, len(payload) * 5)
+            self.assertGreater(producer.buffer_memory_used, 0)
+            producer.flush()
+            self.assertEqual(producer.buffer_memory_used, 0)
+        while consumer.consume() is not None:
+            time.sleep(.05)
+    test_async_produce_buffer_memory_full.skip_condition = lambda cls: RDKAFKA
+
     def test_async_produce_lingers(self):
-        """Ensure that the context manager waits for linger_ms milliseconds"""
+        """Ensure that messages wait for linger_ms milliseconds, unless the
+        producer is stopped"""
         linger = 3
         consumer = self._get_consumer()
         with self._get_producer(linger_ms=linger * 1000) as producer:
-            start = time.time()
             producer.produce(uuid4().bytes)
             producer.produce(uuid4().bytes)
-        self.assertTrue(int(time.time() - start) >= int(linger))
+            time.sleep(.5)
+            self.assertEqual(producer._messages_pending(), 2)
+            start = time.time()
+        self.assertLess(time.time() - start, 1)
         consumer.consume()
         consumer.consume()
     test_async_produce_lingers.skip_condition = lambda cls: RDKAFKA
 
+    def test_flush(self):
+        """Ensure flush() returns as soon as all messages are delivered"""
+        consumer = self._get_consumer()
+        with self._get_producer(min_queued_messages=1,
+                                delivery_reports=True) as producer:
+            producer.produce(uuid4().bytes)
+            self.assertEqual(producer.flush(timeout=10), 0)
+            msg, exc = producer.get_delivery_report(block=False)
+            self.assertIsNone(exc)
+        consumer.consume()
+
+    def test_flush_skips_linger(self):
+        """Ensure flush() sends queued messages without waiting for linger_ms"""
+        consumer = self._get_consumer()
+        with self._get_producer(min_queued_messages=100,
+                                linger_ms=3000) as producer:
+            producer.produce(uuid4().bytes)
+            start = time.time()
+            self.assertEqual(producer.flush(timeout=10), 0)
+            self.assertLess(time.time() - start, 1)
+        consumer.consume()
+    test_flush_skips_linger.skip_condition = lambda cls: RDKAFKA
+
+    def test_flush_timeout(self):
+        """Ensure flush() reports outstanding messages when it times out"""
+        consumer = self._get_consumer()
+        with self._get_producer(min_queued_messages=100,
+                                linger_ms=3000) as producer:
+            producer.produce(uuid4().bytes)
+            self.assertEqual(producer.flush(timeout=0), 1)
+        consumer.consume()
+    test_flush_timeout.skip_condition = lambda cls: RDKAFKA
+
     def test_async_produce_thread_exception(self):
         """Ensure that an exception on a worker thread is raised to the main thread"""
         consumer = self._get_consumer()
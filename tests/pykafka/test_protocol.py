@@ -201,6 +201,22 @@ class TestProduceAPI(unittest2.TestCase):
             )
         )
 
+    def test_request_encoded_messages(self):
+        """Ensure pre-encoded messages serialize the same as plain ones"""
+        for message in self.test_messages:
+            expected = protocol.ProduceRequest()
+            expected.add_message(message, b'test', 0)
+            encoded_message = protocol.Message(
+                message.value, partition_key=message.partition_key,
+                timestamp=message.timestamp,
+                protocol_version=message.protocol_version)
+            encoded = encoded_message.encode()
+            self.assertEqual(len(encoded), len(message))
+            self.assertEqual(len(encoded_message), len(message))
+            req = protocol.ProduceRequest()
+            req.add_message(encoded_message, b'test', 0)
+            self.assertEqual(req.get_bytes(), expected.get_bytes())
+
     def test_gzip_compression(self):
         req = protocol.ProduceRequest(compression_type=CompressionType.GZIP)
         [req.add_message(m, b'test_gzip', 0) for m in self.test_messages]
@@ -309,7 +325,8 @@ class TestFetchAPI(unittest2.TestCase):
 
     def msg_to_dict(self, msg):
         """Helper to extract data from Message slots"""
-        attr_names = protocol.Message.__slots__
+        attr_names = [name for name in protocol.Message.__slots__
+                      if not name.startswith('_')]
         f = operator.attrgetter(*attr_names)
         return dict(zip(attr_names, f(msg)))
 
@@ -467,6 +484,40 @@ class TestOffsetAPI(unittest2.TestCase):
         )
         self.assertEqual(resp.topics[b'test'][0].offset, [2])
 
+    def test_request_v1(self):
+        preq = protocol.PartitionOffsetRequest(b'test', 0, 1497302164000, 1)
+        req = protocol.OffsetRequest(partition_requests=[preq, ], api_version=1)
+        msg = req.get_bytes()
+        self.assertEqual(
+            msg,
+            bytearray(
+                b'\x00\x00\x00/\x00\x02\x00\x01\x00\x00\x00\x00\x00\x07pykafka'  # header
+                b'\xff\xff\xff\xff'  # replica id
+                b'\x00\x00\x00\x01'  # len(topics)
+                    b'\x00\x04'  # len(topic name)
+                        b'test'  # topic name
+                    b'\x00\x00\x00\x01'  # len(partitions)
+                        b'\x00\x00\x00\x00'  # partition
+                        b'\x00\x00\x01\\\x9e)\xe2 '  # time
+            )
+        )
+
+    def test_response_v1(self):
+        resp = protocol.OffsetResponseV1(
+            buffer(
+                b'\x00\x00\x00\x01'  # len(topics)
+                    b'\x00\x04'  # len(topic name)
+                        b'test'  # topic name
+                    b'\x00\x00\x00\x01'  # len(partitions)
+                        b'\x00\x00\x00\x00'  # partition
+                        b'\x00\x00'  # error code
+                        b'\x00\x00\x01\\\x9e)\xe2%'  # timestamp
+                        b'\x00\x00\x00\x00\x00\x00\x00\x02'  # offset
+            )
+        )
+        self.assertEqual(resp.topics[b'test'][0].offset, [2])
+        self.assertEqual(resp.topics[b'test'][0].timestamp, 1497302164005)
+
 
 class TestOffsetCommitFetchAPI(unittest2.TestCase):
     maxDiff = None
@@ -611,6 +662,38 @@ class TestGroupMembershipAPI(unittest2.TestCase):
             )
         )
 
+    def test_join_group_request_protocol(self):
+        req = protocol.JoinGroupRequest(b'dummygroup', b'testmember', b'abcdefghij',
+                                        protocol_name=b'sticky', user_data=b'held')
+        msg = req.get_bytes()
+        self.assertEqual(
+            msg[-42:],
+            bytearray(
+                b'\x00\x00\x00\x01'  # len(group protocols)
+                    b'\x00\x06'  # len(protocol name)
+                        b'sticky'  # protocol name
+                    b'\x00\x00\x00\x1a'  # len(protocol metadata)
+                        b'\x00\x00\x00\x00\x00\x01\x00\nabcdefghij\x00\x00\x00\x04held'  # protocol metadata
+            )
+        )
+
+    def test_join_group_request_topics(self):
+        req = protocol.JoinGroupRequest(b'dummygroup', b'testmember',
+                                        [b'abcdefghij', b'klm'], user_data=b'')
+        msg = req.get_bytes()
+        self.assertEqual(
+            msg[-42:],
+            bytearray(
+                b'\x00\x00\x00\x01'  # len(group protocols)
+                    b'\x00\x05'  # len(protocol name)
+                        b'range'  # protocol name
+                    b'\x00\x00\x00\x1b'  # len(protocol metadata)
+                        b'\x00\x00\x00\x00\x00\x02'  # version, len(topics)
+                        b'\x00\nabcdefghij\x00\x03klm'  # topics
+                        b'\x00\x00\x00\x00'  # len(userdata)
+            )
+        )
+
     def test_join_group_response(self):
         response = protocol.JoinGroupResponse(
             bytearray(
@@ -2,6 +2,7 @@ from contextlib import contextmanager
 import json
 import mock
 import os
+import pkg_resources
 import platform
 import pytest
 import time
@@ -200,6 +201,82 @@ class TestSimpleConsumer(unittest2.TestCase):
             self.assertEqual(msg.offset, expected_offset)
             self.assertEqual(consumer.held_offsets[part_id], expected_offset)
 
+    def test_add_remove_partitions(self):
+        """Partitions added in place should resume from committed offsets,
+        while partitions that stay should keep their position"""
+        topic = self.client.topics[self.topic_name]
+        parts = topic.partitions
+        group = b'test_add_remove_partitions'
+        with self._get_simple_consumer(consumer_group=group,
+                                       consumer_timeout_ms=1000) as consumer:
+            [consumer.consume() for _ in range(100)]
+            consumer.commit_offsets()
+            committed = consumer.held_offsets
+
+        with self._get_simple_consumer(consumer_group=group,
+                                       partitions=[parts[0], parts[1]],
+                                       consumer_timeout_ms=1000) as consumer:
+            [consumer.consume() for _ in range(10)]
+            held = consumer.held_offsets
+            consumer.remove_partitions([parts[0]])
+            consumer.add_partitions([parts[1], parts[2]])
+            self.assertEqual(sorted(consumer.partitions), [1, 2])
+            self.assertEqual(consumer.held_offsets,
+                             {1: held[1], 2: committed[2]})
+            msg = consumer.consume()
+            self.assertIn(msg.partition_id, (1, 2))
+
+    def test_add_partitions_while_fetching(self):
+        """Partitions added to a running consumer shouldn't be fetched before
+        their committed offsets are known"""
+        topic = self.client.topics[self.topic_name]
+        parts = topic.partitions
+        group = b'test_add_partitions_while_fetching'
+        with self._get_simple_consumer(consumer_group=group,
+                                       partitions=[parts[1]],
+                                       consumer_timeout_ms=1000) as consumer:
+            [consumer.consume() for _ in range(10)]
+            consumer.commit_offsets()
+            committed = consumer.held_offsets[1]
+
+        with self._get_simple_consumer(consumer_group=group,
+                                       partitions=[parts[0]],
+                                       consumer_timeout_ms=1000) as consumer:
+            coordinator = consumer._group_coordinator
+            fetch_offsets = coordinator.fetch_consumer_group_offsets
+
+            def slow_fetch_offsets(*args, **kwargs):
+                # give the fetcher time to pick up the new partition
+                time.sleep(.2)
+                return fetch_offsets(*args, **kwargs)
+
+            with mock.patch.object(coordinator, 'fetch_consumer_group_offsets',
+                                   slow_fetch_offsets):
+                consumer.add_partitions([parts[1]])
+            offsets = [msg.offset for msg in consumer if msg.partition_id == 1]
+            self.assertEqual(offsets[0], committed + 1)
+
+    def test_seek_to_timestamp(self):
+        """Seeking should land on the first message at or after the timestamp"""
+        if (pkg_resources.parse_version(kafka_version) <
+                pkg_resources.parse_version("0.10.0")):
+            self.skipTest("Messages carry timestamps since Kafka 0.10.0")
+        with self._get_simple_consumer(consumer_timeout_ms=1000) as consumer:
+            messages = {}
+            for msg in consumer:
+                messages.setdefault(msg.partition_id, []).append(msg)
+            part_id, part_messages = max(iteritems(messages),
+                                         key=lambda k: len(k[1]))
+            timestamp = part_messages[len(part_messages) // 2].timestamp
+            expected = next(m.offset for m in part_messages
+                            if m.timestamp >= timestamp)
+
+            offsets = consumer.seek_to_timestamp(timestamp)
+            self.assertEqual(offsets[part_id], expected)
+            self.assertEqual(consumer.held_offsets[part_id], expected - 1)
+            msg = consumer.consume()
+            self.assertGreaterEqual(msg.timestamp, timestamp)
+
     def test_update_cluster(self):
         """Check that the consumer can initiate cluster updates"""
         with self._get_simple_consumer() as consumer:
@@ -247,6 +324,83 @@ class TestGEventSimpleConsumer(TestSimpleConsumer):
     USE_GEVENT = True
 
 
+class TestMultiTopicSimpleConsumer(unittest2.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.kafka = get_cluster()
+        cls.topic_names = [uuid4().hex.encode() for _ in range(2)]
+        cls.msgs_per_topic = 100
+        cls.client = KafkaClient(cls.kafka.brokers, broker_version=kafka_version)
+        for topic_name in cls.topic_names:
+            cls.kafka.create_topic(topic_name, 3, 2)
+            prod = cls.client.topics[topic_name].get_producer(min_queued_messages=1)
+            for i in range(cls.msgs_per_topic):
+                prod.produce('msg {i}'.format(i=i).encode())
+            prod.stop()
+
+    @classmethod
+    def tearDownClass(cls):
+        stop_cluster(cls.kafka)
+
+    @contextmanager
+    def _get_multi_consumer(self, **kwargs):
+        consumer = self.client.get_multi_simple_consumer(self.topic_names, **kwargs)
+        try:
+            yield consumer
+        finally:
+            consumer.stop()
+
+    def test_consume(self):
+        """Test consuming all messages in all topics"""
+        with self._get_multi_consumer(consumer_timeout_ms=5000) as consumer:
+            counts = {name: 0 for name in self.topic_names}
+            for msg in consumer:
+                counts[msg.partition.topic.name] += 1
+                if sum(counts.values()) == 2 * self.msgs_per_topic:
+                    break
+            self.assertEqual(counts, {name: self.msgs_per_topic
+                                      for name in self.topic_names})
+
+    def test_one_fetch_per_broker(self):
+        """Each fetch() should send a single request to each leader"""
+        with self._get_multi_consumer(auto_start=False) as consumer:
+            leaders = consumer._partitions_by_leader
+            with mock.patch.object(consumer, '_wait_for_slot_available'):
+                for broker in leaders:
+                    broker.fetch_messages = mock.Mock(wraps=broker.fetch_messages)
+                try:
+                    consumer.fetch()
+                    for broker, owned_partitions in iteritems(leaders):
+                        self.assertEqual(broker.fetch_messages.call_count, 1)
+                        reqs = broker.fetch_messages.call_args[0][0]
+                        self.assertEqual(
+                            sorted((r.topic_name, r.partition_id) for r in reqs),
+                            sorted(consumer._partition_key(op.partition)
+                                   for op in owned_partitions))
+                finally:
+                    for broker in leaders:
+                        del broker.fetch_messages
+
+    def test_offset_commit(self):
+        """Check fetched offsets match pre-commit internal state"""
+        with self._get_multi_consumer(
+                consumer_group=b'test_multi_offset_commit') as consumer:
+            [consumer.consume() for _ in range(50)]
+            offsets_committed = consumer.held_offsets
+            self.assertEqual(set(offsets_committed),
+                             set(consumer.partitions))
+            with mock.patch.object(
+                    consumer._group_coordinator, 'commit_consumer_group_offsets',
+                    wraps=consumer._group_coordinator.commit_consumer_group_offsets
+            ) as commit:
+                consumer.commit_offsets()
+                self.assertEqual(commit.call_count, 1)
+
+            offsets_fetched = TestSimpleConsumer._convert_offsets(
+                consumer.fetch_offsets())
+            self.assertEqual(offsets_fetched, offsets_committed)
+
+
 class TestOwnedPartition(unittest2.TestCase):
     def test_partition_saves_offset(self):
         offset = 20
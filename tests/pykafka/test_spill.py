@@ -0,0 +1,180 @@
+import os
+import shutil
+import struct
+import tempfile
+import time
+import unittest2
+from uuid import uuid4
+from zlib import crc32
+
+from pykafka import KafkaClient
+from pykafka.common import OffsetType
+from pykafka.protocol import Message
+from pykafka.spill import SpillStore
+from pykafka.test.fake_broker import FakeKafkaCluster
+
+
+class TestSpillStore(unittest2.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def _get_store(self, **kwargs):
+        kwargs.setdefault('max_bytes', 4000)
+        kwargs.setdefault('segment_bytes', 1000)
+        return SpillStore(self.path, **kwargs)
+
+    def _append(self, store, count, partition_id=0):
+        return [store.append(b'topic', partition_id,
+                             [Message(b'value %d' % i, partition_key=b'key')])
+                for i in range(count)]
+
+    def _read_all(self, store):
+        records = []
+        while True:
+            record = store.read()
+            if record is None:
+                return records
+            records.append(record)
+
+    def test_append_read(self):
+        store = self._get_store()
+        self.assertTrue(store.empty())
+        store.append(b'topic', 3,
+                     [Message(b'a'), Message(b'b', partition_key=b'k')])
+        self.assertFalse(store.empty())
+        position, next_position, topic_name, partition_id, messages = store.read()
+        self.assertEqual(position, (0, 0))
+        self.assertEqual(topic_name, b'topic')
+        self.assertEqual(partition_id, 3)
+        self.assertEqual([m.value for m in messages], [b'a', b'b'])
+        self.assertEqual(messages[1].partition_key, b'k')
+        self.assertTrue(all(m.partition_id == 3 for m in messages))
+        self.assertIsNone(store.read())
+        self.assertTrue(store.empty())
+        store.close()
+
+    def test_order_across_segments(self):
+        store = self._get_store()
+        self._append(store, 50)
+        self.assertGreater(store.disk_bytes, 1000)
+        values = [r[4][0].value for r in self._read_all(store)]
+        self.assertEqual(values, [b'value %d' % i for i in range(50)])
+        store.close()
+
+    def test_bounded_disk_usage(self):
+        store = self._get_store()
+        positions = self._append(store, 200)
+        self.assertIn(None, positions)
+        self.assertLessEqual(store.disk_bytes, 4000)
+        # a batch larger than a segment never fits
+        self.assertIsNone(store.append(b'topic', 0, [Message(b' ' * 2000)]))
+        store.close()
+
+    def test_commit_deletes_segments(self):
+        store = self._get_store()
+        self._append(store, 50)
+        records = self._read_all(store)
+        store.commit(records[-1][1])
+        self.assertEqual(store.disk_bytes, 1000)
+        self.assertEqual(
+            len([f for f in os.listdir(self.path) if f.endswith('.spill')]), 1)
+        store.close()
+
+    def test_recovery_resumes_from_commit(self):
+        store = self._get_store()
+        self._append(store, 30)
+        records = self._read_all(store)
+        store.commit(records[9][1])
+        store.close()
+
+        store = self._get_store()
+        values = [r[4][0].value for r in self._read_all(store)]
+        self.assertEqual(values, [b'value %d' % i for i in range(10, 30)])
+        # new records go after the recovered ones
+        store.append(b'topic', 0, [Message(b'new')])
+        self.assertEqual(store.read()[4][0].value, b'new')
+        store.close()
+
+    def test_recovery_ignores_torn_record(self):
+        store = self._get_store()
+        positions = self._append(store, 5)
+        store.close()
+        # corrupt the last record, as if the process died while writing it
+        seq, offset = positions[-1]
+        segment = os.path.join(self.path, '{:020d}.spill'.format(seq))
+        with open(segment, 'r+b') as f:
+            f.seek(offset + 50)
+            f.write(b'\xff\xff')
+
+        store = self._get_store()
+        records = self._read_all(store)
+        self.assertEqual(len(records), 4)
+        self.assertEqual(store.append(b'topic', 0, [Message(b'x')]), positions[-1])
+        store.close()
+
+    def test_new_cursor_is_valid(self):
+        store = self._get_store()
+        store.close()
+        with open(os.path.join(self.path, 'cursor'), 'rb') as f:
+            seq, offset, crc = struct.unpack('!qqI', f.read())
+        self.assertEqual((seq, offset), (0, 0))
+        self.assertEqual(crc, crc32(struct.pack('!qq', 0, 0)) & 0xffffffff)
+
+    def test_invalid_cursor_replays_everything(self):
+        store = self._get_store()
+        self._append(store, 5)
+        store.commit(self._read_all(store)[2][1])
+        store.close()
+        with open(os.path.join(self.path, 'cursor'), 'r+b') as f:
+            f.write(struct.pack('!q', 12345))
+
+        store = self._get_store()
+        self.assertEqual(len(self._read_all(store)), 5)
+        store.close()
+
+
+class TestProducerSpill(unittest2.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.kafka = FakeKafkaCluster(num_instances=1)
+        cls.client = KafkaClient(cls.kafka.brokers)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.kafka.terminate()
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_other_topic_is_not_replayed(self):
+        """Ensure a store reopened for another topic drops its leftovers"""
+        store = SpillStore(self.path)
+        store.append(b'other', 0, [Message(b'stray')])
+        store.close()
+
+        topic_name = uuid4().hex.encode()
+        self.kafka.create_topic(topic_name, 1, 1)
+        topic = self.client.topics[topic_name]
+        store = SpillStore(self.path)
+        with topic.get_producer(spill_store=store, linger_ms=0) as producer:
+            producer.produce(b'mine')
+            deadline = time.time() + 5
+            while not store.empty() and time.time() < deadline:
+                time.sleep(.05)
+        consumer = topic.get_simple_consumer(
+            auto_offset_reset=OffsetType.EARLIEST, consumer_timeout_ms=500)
+        self.assertEqual([m.value for m in consumer], [b'mine'])
+        consumer.stop()
+        store.close()
+        # the dropped record is committed along with the replayed one
+        store = SpillStore(self.path)
+        self.assertIsNone(store.read())
+        store.close()
+